@@ -1,18 +1,52 @@
+from collections import namedtuple
+
 from flask import Flask, session
 from flask_bootstrap import Bootstrap5
 from flask_sqlalchemy import SQLAlchemy # type: ignore
 
 from config import config
+from .aio import AsyncRuntime
+from .database import engine_options, init_engines
+from .event_feed import EventFeed
+from .image_proxy import ImageProxy
+from .metadata_cache import MetadataCache
+from .metrics import Metrics
+from .response_cache import ResponseCache
+from .rpc import RPCClient
+from .search_index import SearchIndex
 
 db = SQLAlchemy()
 bootstrap = Bootstrap5()
+metadata_cache = MetadataCache()
+image_proxy = ImageProxy()
+rpc = RPCClient()
+response_cache = ResponseCache()
+event_feed = EventFeed()
+metrics = Metrics()
+aio = AsyncRuntime()
+search_index = SearchIndex()
+
+# What templates see as ``current_user``, rebuilt from the signed session cookie.
+SessionUser = namedtuple('SessionUser', 'id wallet_address')
 
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     bootstrap.init_app(app)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(app.config), **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
     db.init_app(app)
+    init_engines(app, db)
+    metadata_cache.init_app(app)
+    image_proxy.init_app(app)
+    rpc.init_app(app)
+    response_cache.init_app(app)
+    event_feed.init_app(app)
+    metrics.init_app(app)
+    aio.init_app(app)
+    search_index.init_app(app)
 
     from .main import main as main_blueprint
     from .nfts import nfts as nfts_blueprint
@@ -24,12 +58,12 @@ def create_app(config_name='default'):
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     app.register_blueprint(api_blueprint, url_prefix='/api')
 
-    from app.model import User
     @app.context_processor
     def inject_user():
         user_id = session.get('user_id')
-        if user_id:
-            user = User.query.get(user_id)
+        wallet_address = session.get('wallet_address')
+        if user_id and wallet_address:
+            user = SessionUser(user_id, wallet_address)
         else:
             user = None
         return dict(current_user=user)
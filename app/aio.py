@@ -0,0 +1,173 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+from app.call_cache import call_cache_middleware
+from app.metadata_fetcher import MetadataFetcher
+from app.metrics import rpc_metrics_middleware
+from app.rpc_batch import BatchCallError, BatchReader, RawOnion
+
+
+class AsyncRuntime:
+    """One asyncio event loop per worker process, shared by all of its requests.
+
+    The loop runs in a daemon thread and owns an ``AsyncWeb3`` client and an
+    aiohttp session for tokenURI metadata, so connections are pooled across
+    requests. Views stay synchronous: they hand their RPC and metadata fan-out
+    to the loop with :meth:`run` and wait for the result. A waiting request
+    thread costs little, so one process can hold hundreds of requests in
+    flight with a threaded worker (``gunicorn -k gthread --threads 200``).
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.rpc_url = None
+        self.timeout = 15
+        self.connections = 100
+        self.batch_concurrency = 8
+        self.call_cache = None
+        self.metrics = None
+        self.fetcher = None
+        self.loop = None
+        self.w3 = None
+        self.metadata_session = None
+        self._rpc_session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        urls = app.config.get('MONAD_RPC_URLS') or [app.config.get('MONAD_RPC_URL')]
+        urls = [url for url in urls if url]
+        self.enabled = bool(app.config.get('ASYNC_VIEWS')) and bool(urls)
+        self.rpc_url = urls[0] if urls else None
+        self.timeout = app.config.get('RPC_TIMEOUT', self.timeout)
+        self.connections = app.config.get('ASYNC_RPC_CONNECTIONS', self.connections)
+        self.batch_concurrency = app.config.get('ASYNC_BATCH_CONCURRENCY', self.batch_concurrency)
+        rpc = app.extensions.get('rpc')
+        self.call_cache = rpc.call_cache if rpc is not None else None
+        self.metrics = app.extensions.get('metrics')
+        self.fetcher = MetadataFetcher.from_config(app.config)
+        self.close()
+        app.extensions['aio'] = self
+
+    def run(self, coro, timeout: float = None):
+        """Run ``coro`` on the shared loop and block until it finishes.
+
+        Context variables of the calling thread (such as the request's
+        metrics) are visible to the coroutine.
+        """
+        return self.submit(coro).result(timeout)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule ``coro`` on the shared loop without waiting for it."""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def batch_reader(self, w3, batch_size: int = 100) -> 'AsyncBatchReader':
+        return AsyncBatchReader(self, w3, batch_size=batch_size)
+
+    def fetch_metadata(self, uris) -> dict:
+        """``{uri: metadata or None}`` over the shared metadata session."""
+        async def fetch():
+            return await self.fetcher.fetch_all_async(uris, session=self.metadata_session)
+        return self.run(fetch())
+
+    def close(self):
+        """Close the shared sessions and stop the loop; the next :meth:`run` starts a new one."""
+        loop, self.loop = self.loop, None
+        if loop is None or self._pid != os.getpid():
+            return
+        asyncio.run_coroutine_threadsafe(self._close_sessions(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _ensure_loop(self):
+        # Started lazily, and again after a fork, so every worker owns its loop.
+        if self.loop is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self.loop is not None and self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='async-runtime', daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self.loop = loop
+            self._pid = os.getpid()
+
+    async def _setup(self):
+        import aiohttp
+        from web3 import AsyncHTTPProvider, AsyncWeb3
+
+        self._rpc_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        provider = AsyncHTTPProvider(self.rpc_url)
+        await provider.cache_async_session(self._rpc_session)
+        self.w3 = AsyncWeb3(provider)
+        if self.call_cache is not None:
+            self.w3.middleware_onion.inject(call_cache_middleware(self.call_cache), name='eth_call_cache', layer=0)
+        if self.metrics is not None and self.metrics.enabled:
+            self.w3.middleware_onion.inject(rpc_metrics_middleware(self.metrics), name='rpc_metrics', layer=0)
+        self.metadata_session = self.fetcher.session()
+
+    async def _close_sessions(self):
+        for session in (self._rpc_session, self.metadata_session):
+            if session is not None:
+                await session.close()
+
+
+class AsyncBatchReader(BatchReader):
+    """``BatchReader`` whose batches are sent concurrently on the shared loop.
+
+    Calls are queued and decoded exactly as in ``BatchReader``; only
+    :meth:`execute` differs, sending up to ``batch_concurrency`` chunks at
+    once instead of one after another.
+    """
+
+    def __init__(self, runtime: AsyncRuntime, w3, block_identifier=None, batch_size: int = 100):
+        super().__init__(w3, block_identifier=block_identifier, batch_size=batch_size)
+        self.runtime = runtime
+
+    def execute(self) -> list:
+        block = hex(self.pin_block())
+        chunks = [self._calls[start:start + self.batch_size] for start in range(0, len(self._calls), self.batch_size)]
+        self._calls = []
+        self._index = {}
+        results = self.runtime.run(self._execute_all(chunks, block))
+        return [value for chunk in results for value in chunk]
+
+    async def _execute_all(self, chunks, block: str) -> list:
+        limit = asyncio.Semaphore(self.runtime.batch_concurrency)
+
+        async def one(chunk):
+            async with limit:
+                return await self._execute_chunk_async(chunk, block)
+
+        return await asyncio.gather(*(one(chunk) for chunk in chunks))
+
+    async def _execute_chunk_async(self, chunk, block: str) -> list:
+        w3 = self.runtime.w3
+        batch = [("eth_call", [{"to": to, "data": data}, block]) for to, data, _ in chunk]
+        try:
+            send_batch = await w3.provider.batch_request_func(w3, RawOnion(w3.middleware_onion))
+            responses = await send_batch(batch)
+        except Exception as e:
+            return [BatchCallError(str(e)) for _ in chunk]
+
+        if not isinstance(responses, list):
+            responses = await asyncio.gather(*(self._call_one_async(request) for request in batch))
+        return [self._decode(output_types, response) for (_, _, output_types), response in zip(chunk, responses)]
+
+    async def _call_one_async(self, request) -> dict:
+        from web3.exceptions import ContractLogicError
+
+        _, params = request
+        try:
+            return {"result": await self.runtime.w3.eth.call(params[0], block_identifier=int(params[1], 16))}
+        except ContractLogicError as e:
+            return {"error": {"code": 3, "message": str(e)}}
+        except Exception as e:
+            return {"error": str(e)}
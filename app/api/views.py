@@ -1,32 +1,39 @@
+import gzip
+import hashlib
 import json
-import os
-from urllib.parse import unquote
-from flask import jsonify, render_template, request, session, url_for, current_app
-import os
+import queue
+from flask import Response, jsonify, redirect, request, session, url_for, current_app
 
+from app.event_feed import Subscription, format_sse, parse_event_id
 from app.model import User
+from app.listings import ListingQuery, ListingQueryError, chain_page, indexed_page
+from app.search_index import SearchQuery, SearchQueryError, search_page
+from app.stats import collection_stats, token_stats
 from . import api
-from app import db
+from app import event_feed, rpc, search_index
 
 @api.route('/login', methods=['POST'])
 def wallet_login():
     """Create or fetch a user by wallet address and start a session."""
+    from web3 import Web3
+
     data = request.get_json()
     wallet_address = data.get('wallet_address')
 
     if not wallet_address:
         return jsonify({'error': 'Wallet address is required'}), 400
 
-    user = User.query.filter_by(wallet_address=wallet_address).first()
-    if not user:
-        user = User(wallet_address=wallet_address)
-        db.session.add(user)
-        db.session.commit()
+    if not Web3.is_address(wallet_address):
+        return jsonify({'error': 'Invalid wallet address'}), 400
+
+    wallet_address = User.normalize_address(wallet_address)
+    user_id = User.upsert(wallet_address)
 
-    session['user_id'] = user.id
-    session['wallet_address'] = user.wallet_address
+    # Pages render the user from this snapshot instead of querying for it.
+    session['user_id'] = user_id
+    session['wallet_address'] = wallet_address
 
-    return jsonify({'id': user.id, 'wallet_address': user.wallet_address})
+    return jsonify({'id': user_id, 'wallet_address': wallet_address})
 
 @api.route('/logout', methods=['GET'])
 def wallet_logout():
@@ -40,23 +47,10 @@ def wallet_logout():
 @api.route('/marketplace_abi', methods=['GET'])
 def get_marketplace_abi():
     """Return the marketplace contract ABI for frontend contract interactions."""
-    try:
-        abi_path = os.path.join(current_app.root_path, 'static', 'contract-abi', 'NFTMarketplace.abi.json')
-        with open(abi_path, 'r') as f:
-            abi = json.load(f)
-        
-        return jsonify(abi)
-    
-    except FileNotFoundError:
+    if rpc.marketplace_abi is None:
         return jsonify({'error': 'ABI file not found'}), 404
-    
-    except json.JSONDecodeError:
-        return jsonify({'error': 'Invalid ABI file format'}), 500
-    
-    except Exception as e:
-        current_app.logger.exception('Unexpected error reading marketplace ABI')
-        return jsonify({'error': str(e)}), 500
-    
+    return jsonify(rpc.marketplace_abi)
+
 
 @api.route('/marketplace_contract_address', methods=['GET'])
 def get_marketplace_contract_address():
@@ -64,9 +58,7 @@ def get_marketplace_contract_address():
     return jsonify({'contract_address': current_app.config.get('NFT_MARKETPLACE_CONTRACT_ADDRESS')})
 
 
-@api.route('/network_config', methods=['GET'])
-def get_network_config():
-    """Return network configuration for the frontend wallet to use when adding/switching chains."""
+def _network_config() -> dict:
     # Provide sensible defaults but allow overrides via app config / env
     chain_id_dec = current_app.config.get('MONAD_CHAIN_ID', 10143)
     try:
@@ -75,7 +67,7 @@ def get_network_config():
         chain_id_int = 10143
 
     rpc_url = current_app.config.get('MONAD_RPC_URL') or current_app.config.get('MONAD_RPC') or ''
-    network = {
+    return {
         'chainId': hex(chain_id_int),
         'chainName': current_app.config.get('MONAD_CHAIN_NAME', 'Monad Testnet'),
         'nativeCurrency': {
@@ -88,4 +80,189 @@ def get_network_config():
         'blockGasLimit': int(current_app.config.get('MONAD_BLOCK_GAS_LIMIT', 150000000)),
     }
 
-    return jsonify(network)
\ No newline at end of file
+
+@api.route('/network_config', methods=['GET'])
+def get_network_config():
+    """Return network configuration for the frontend wallet to use when adding/switching chains."""
+    return jsonify(_network_config())
+
+
+def _bootstrap_payload() -> dict:
+    """Serialize, compress and hash the bootstrap document once per process."""
+    payload = current_app.extensions.get('bootstrap_payload')
+    if payload is None:
+        body = json.dumps({
+            'network': _network_config(),
+            'contract_address': current_app.config.get('NFT_MARKETPLACE_CONTRACT_ADDRESS'),
+            'abi': rpc.marketplace_abi or [],
+        }, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        payload = {
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+            'etag': digest[:32],
+            'version': digest[:12],
+        }
+        current_app.extensions['bootstrap_payload'] = payload
+    return payload
+
+
+def bootstrap_url() -> str:
+    return url_for('api.get_bootstrap_versioned', version=_bootstrap_payload()['version'])
+
+
+@api.app_context_processor
+def inject_bootstrap_url():
+    return dict(bootstrap_url=bootstrap_url)
+
+
+def _bootstrap_response(cache_control: str):
+    payload = _bootstrap_payload()
+    if request.if_none_match.contains(payload['etag']):
+        response = current_app.response_class(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = current_app.response_class(payload['gzip'], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(payload['body'], mimetype='application/json')
+    response.set_etag(payload['etag'])
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@api.route('/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """Return network config, marketplace address and ABI in one revalidatable response."""
+    return _bootstrap_response('no-cache')
+
+
+@api.route('/bootstrap/<version>', methods=['GET'])
+def get_bootstrap_versioned(version):
+    """Immutable copy of the bootstrap document; the version changes whenever its content does."""
+    if version != _bootstrap_payload()['version']:
+        return redirect(bootstrap_url())
+    return _bootstrap_response('public, max-age=31536000, immutable')
+
+
+@api.route('/listings', methods=['GET'])
+def get_listings():
+    """Return one page of marketplace listings with keyset cursor pagination.
+
+    Query args: sort (listed|price|token_id; ``listed`` only with the indexed
+    read source, where it is the default), order (asc|desc), limit, cursor,
+    collection, owner, min_price, max_price (MON).
+    """
+    try:
+        source = 'index' if current_app.config.get('MARKETPLACE_READ_SOURCE') == 'index' else 'chain'
+        query = ListingQuery.from_args(request.args, source)
+    except ListingQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if source == 'index':
+            page = indexed_page(query)
+        else:
+            page = chain_page(query)
+    except Exception as e:
+        current_app.logger.exception('Unexpected error listing marketplace NFTs')
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(page)
+
+
+@api.route('/search', methods=['GET'])
+def search_listings():
+    """Search listed NFTs by name, symbol, token id, description and traits.
+
+    Query args: q, collection, trait (``type:value``, repeatable; values of
+    one type are alternatives), offset, limit. The response carries trait
+    value counts in ``facets`` and per-collection counts in ``collections``.
+    """
+    try:
+        query = SearchQuery.from_args(request.args)
+    except SearchQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        page = search_page(search_index, query)
+    except Exception as e:
+        current_app.logger.exception('Unexpected error searching marketplace NFTs')
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(page)
+
+
+@api.route('/collections/<contract_address>/stats', methods=['GET'])
+def get_collection_stats(contract_address):
+    """Floor/ceiling price, listing count, best offer, offer count and 24h volume (MON)."""
+    from web3 import Web3
+
+    if not Web3.is_address(contract_address):
+        return jsonify({'error': 'contract_address must be an address'}), 400
+    stats = collection_stats(Web3.to_checksum_address(contract_address))
+    if stats is None:
+        return jsonify({'error': 'Collection not indexed'}), 404
+    return jsonify(stats)
+
+
+@api.route('/collections/<contract_address>/tokens/<int:token_id>/stats', methods=['GET'])
+def get_token_stats(contract_address, token_id):
+    from web3 import Web3
+
+    if not Web3.is_address(contract_address):
+        return jsonify({'error': 'contract_address must be an address'}), 400
+    stats = token_stats(Web3.to_checksum_address(contract_address), token_id)
+    if stats is None:
+        return jsonify({'error': 'Token not indexed'}), 404
+    return jsonify(stats)
+
+
+@api.route('/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of marketplace events.
+
+    Query args: collection, token_id, events (comma-separated names) and
+    since (block number). A reconnecting EventSource resumes from its
+    ``Last-Event-ID`` automatically.
+    """
+    from web3 import Web3
+
+    collection = request.args.get('collection')
+    if collection and not Web3.is_address(collection):
+        return jsonify({'error': 'collection must be an address'}), 400
+    try:
+        token_id = int(request.args['token_id']) if request.args.get('token_id') else None
+    except ValueError:
+        return jsonify({'error': 'token_id must be an integer'}), 400
+    names = [n for n in request.args.get('events', '').split(',') if n] or None
+    after = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    subscription = Subscription(collection, token_id, names, maxsize=event_feed.client_queue)
+    replay, complete = event_feed.subscribe(subscription, after)
+    heartbeat = current_app.config.get('FEED_HEARTBEAT', 15)
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            if not complete:
+                yield 'event: reset\ndata: {}\n\n'
+            for event in replay:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is Subscription.OVERFLOW:
+                    # Too far behind: close so the browser reconnects and replays from its last id.
+                    return
+                yield format_sse(event)
+        finally:
+            event_feed.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
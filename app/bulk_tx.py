@@ -0,0 +1,411 @@
+import csv
+import json
+import logging
+import math
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from web3 import Web3
+
+logger = logging.getLogger(__name__)
+
+# action -> (target, function); ``marketplace`` calls go to the marketplace
+# contract, ``collection`` calls to the NFT contract named in the manifest row.
+ACTIONS = {
+    'list': ('marketplace', 'setNFTPrice'),
+    'set_price': ('marketplace', 'setNFTPrice'),
+    'unlist': ('marketplace', 'unlistNFT'),
+    'approve': ('collection', 'approve'),
+    'approve_all': ('collection', 'setApprovalForAll'),
+}
+
+ERC721_WRITE_ABI = [
+    {
+        "inputs": [{"name": "_approved", "type": "address"}, {"name": "_tokenId", "type": "uint256"}],
+        "name": "approve",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function",
+    },
+    {
+        "inputs": [{"name": "_operator", "type": "address"}, {"name": "_approved", "type": "bool"}],
+        "name": "setApprovalForAll",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function",
+    },
+]
+
+
+class ManifestError(ValueError):
+    """A manifest row is missing a field or has an invalid value."""
+
+
+class Operation:
+    """One manifest row and what happened to its transaction."""
+
+    def __init__(self, line: int, action: str, contract: str, token_id: int = None, price_wei: int = None):
+        self.line = line
+        self.action = action
+        self.contract = contract
+        self.token_id = token_id
+        self.price_wei = price_wei
+        self.status = 'queued'
+        self.error = None
+        self.nonce = None
+        self.gas = None
+        self.gas_price = None
+        self.tx = None
+        self.hashes = []
+        self.mined_hash = None
+        self.sent_at = None
+        self.replacements = 0
+        self.retries = 0
+        self.block = None
+        self.gas_used = None
+
+    @property
+    def tx_hash(self):
+        return self.mined_hash or (self.hashes[-1] if self.hashes else None)
+
+    def to_dict(self) -> dict:
+        return {
+            'line': self.line,
+            'action': self.action,
+            'contract': self.contract,
+            'token_id': self.token_id,
+            'price_wei': str(self.price_wei) if self.price_wei is not None else None,
+            'status': self.status,
+            'tx_hash': self.tx_hash,
+            'nonce': self.nonce,
+            'gas': self.gas,
+            'gas_price': self.gas_price,
+            'block': self.block,
+            'gas_used': self.gas_used,
+            'replacements': self.replacements,
+            'error': self.error,
+        }
+
+
+def parse_operation(line: int, row: dict) -> Operation:
+    action = (row.get('action') or '').strip().lower()
+    if action not in ACTIONS:
+        raise ManifestError(f"line {line}: unknown action {action!r} (expected one of {', '.join(ACTIONS)})")
+    contract = (row.get('contract') or row.get('nft_address') or '').strip()
+    if not Web3.is_address(contract):
+        raise ManifestError(f"line {line}: invalid contract address {contract!r}")
+    op = Operation(line, action, Web3.to_checksum_address(contract))
+    if action != 'approve_all':
+        try:
+            op.token_id = int(str(row.get('token_id')).strip())
+        except ValueError:
+            raise ManifestError(f"line {line}: invalid token_id {row.get('token_id')!r}")
+    if action in ('list', 'set_price'):
+        try:
+            if row.get('price_wei') not in (None, ''):
+                op.price_wei = int(str(row['price_wei']).strip())
+            else:
+                op.price_wei = Web3.to_wei(Decimal(str(row.get('price')).strip()), 'ether')
+        except (InvalidOperation, ValueError):
+            raise ManifestError(f"line {line}: invalid price {row.get('price_wei') or row.get('price')!r}")
+        if op.price_wei <= 0:
+            raise ManifestError(f"line {line}: price must be positive")
+    return op
+
+
+def load_manifest(path: str) -> list:
+    """Operations from a CSV file with a header row, or a JSON list of objects."""
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows.get('operations', [])
+            numbered = enumerate(rows, start=1)
+        else:
+            numbered = enumerate(csv.DictReader(f), start=2)
+        return [parse_operation(line, row) for line, row in numbered]
+
+
+class NonceManager:
+    """Hand out consecutive nonces for one account without asking the node each time.
+
+    The counter starts from the account's pending transaction count and only
+    goes back to the node on :meth:`sync`, e.g. after a "nonce too low" error.
+    """
+
+    def __init__(self, w3: Web3, address: str):
+        self.w3 = w3
+        self.address = address
+        self._next = None
+        self._lock = threading.Lock()
+
+    def sync(self) -> int:
+        with self._lock:
+            self._next = self.w3.eth.get_transaction_count(self.address, 'pending')
+            return self._next
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = self.w3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce: int):
+        """Give back a nonce whose transaction never reached the node."""
+        with self._lock:
+            if self._next is not None and nonce == self._next - 1:
+                self._next = nonce
+            else:
+                self._next = None
+
+
+class GasEstimates:
+    """Gas limits estimated once per ``(contract, function)`` and padded by ``margin``."""
+
+    def __init__(self, margin: float = 1.2):
+        self.margin = margin
+        self._limits = {}
+
+    def get(self, key, estimate, fallback: int = None) -> int:
+        limit = self._limits.get(key)
+        if limit is not None:
+            return limit
+        try:
+            limit = math.ceil(estimate() * self.margin)
+        except Exception:
+            if fallback is None:
+                raise
+            return fallback
+        self._limits[key] = limit
+        return limit
+
+    def invalidate(self, key):
+        self._limits.pop(key, None)
+
+
+def _is_nonce_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return 'nonce too low' in message or 'already known' in message or 'replacement transaction underpriced' in message
+
+
+class BulkSender:
+    """Sign and send many transactions from one account without waiting on each receipt.
+
+    Up to ``max_pending`` transactions are in flight at once; receipts for all
+    of them are polled in one JSON-RPC batch per round. A transaction still
+    unmined after ``replace_after`` seconds is re-sent with the same nonce and
+    its gas price raised by ``price_bump``, at most ``max_replacements`` times.
+    One that ran out of gas is estimated again and sent once more.
+    """
+
+    def __init__(self, w3: Web3, account, marketplace, max_pending: int = 32, gas_margin: float = 1.2,
+                 gas_price: int = None, fallback_gas: int = None, replace_after: float = 60,
+                 max_replacements: int = 3, price_bump: float = 1.125, poll_interval: float = 1.0,
+                 max_retries: int = 1):
+        self.w3 = w3
+        self.account = account
+        self.marketplace = marketplace
+        self.max_pending = max(1, max_pending)
+        self.gas_price = gas_price
+        self.fallback_gas = fallback_gas
+        self.replace_after = replace_after
+        self.max_replacements = max_replacements
+        self.price_bump = price_bump
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.nonces = NonceManager(w3, account.address)
+        self.estimates = GasEstimates(gas_margin)
+        self.chain_id = None
+        self.stuck_nonce = None
+        self._head = (None, 0.0)
+        self._collections = {}
+
+    def call_for(self, op: Operation):
+        """``(gas cache key, contract function call)`` for ``op``."""
+        target, fn_name = ACTIONS[op.action]
+        if target == 'marketplace':
+            contract = self.marketplace
+            args = [op.contract, op.token_id] + ([op.price_wei] if fn_name == 'setNFTPrice' else [])
+        else:
+            contract = self._collections.get(op.contract)
+            if contract is None:
+                contract = self._collections[op.contract] = self.w3.eth.contract(
+                    address=op.contract, abi=ERC721_WRITE_ABI)
+            args = [self.marketplace.address, True] if fn_name == 'setApprovalForAll' \
+                else [self.marketplace.address, op.token_id]
+        return (contract.address, fn_name), contract.get_function_by_name(fn_name)(*args)
+
+    def estimate(self, operations) -> list:
+        """Fill in each operation's gas limit without sending anything."""
+        for op in operations:
+            key, call = self.call_for(op)
+            try:
+                op.gas = self.estimates.get(key, lambda: call.estimate_gas({'from': self.account.address}))
+                op.status = 'estimated'
+            except Exception as e:
+                op.status, op.error = 'failed', str(e)
+        return operations
+
+    def run(self, operations, on_update=None) -> list:
+        """Send every operation and return them once each is mined, failed or stuck.
+
+        ``on_update(op)`` is called whenever an operation reaches a final state.
+        """
+        self.chain_id = self.w3.eth.chain_id
+        if self.gas_price is None:
+            self.gas_price = self.w3.eth.gas_price
+        self.nonces.sync()
+        queue = list(operations)
+        inflight = {}
+        while queue or inflight:
+            if self.stuck_nonce is not None:
+                # Nothing sent from here on could be mined before the stuck nonce.
+                for op in queue:
+                    op.status, op.error = 'skipped', f'not sent, nonce {self.stuck_nonce} is stuck'
+                    if on_update:
+                        on_update(op)
+                queue = []
+            while queue and len(inflight) < self.max_pending:
+                op = queue.pop(0)
+                if self._send(op):
+                    inflight[op.nonce] = op
+                elif on_update:
+                    on_update(op)
+            if not inflight:
+                continue
+            time.sleep(self.poll_interval)
+            for op in self._poll(inflight):
+                del inflight[op.nonce]
+                if op.status == 'retry':
+                    queue.insert(0, op)
+                elif on_update:
+                    on_update(op)
+        return operations
+
+    def _send(self, op: Operation) -> bool:
+        key, call = self.call_for(op)
+        try:
+            op.gas = self.estimates.get(
+                key, lambda: call.estimate_gas({'from': self.account.address}), self.fallback_gas)
+        except Exception as e:
+            op.status, op.error = 'failed', f'gas estimation failed: {e}'
+            return False
+        for attempt in range(2):
+            nonce = self.nonces.next()
+            op.gas_price = self.gas_price
+            op.tx = call.build_transaction({
+                'from': self.account.address,
+                'nonce': nonce,
+                'gas': op.gas,
+                'gasPrice': op.gas_price,
+                'chainId': self.chain_id,
+            })
+            try:
+                tx_hash = self._send_raw(op.tx)
+            except Exception as e:
+                self.nonces.release(nonce)
+                if attempt == 0 and _is_nonce_error(e):
+                    self.nonces.sync()
+                    continue
+                op.status, op.error = 'failed', str(e)
+                return False
+            op.nonce = nonce
+            op.hashes = [tx_hash]
+            op.sent_at = time.monotonic()
+            op.status = 'sent'
+            return True
+        return False
+
+    def _send_raw(self, tx: dict) -> str:
+        signed = self.account.sign_transaction(tx)
+        return Web3.to_hex(self.w3.eth.send_raw_transaction(signed.raw_transaction))
+
+    def _poll(self, inflight: dict) -> list:
+        """Check every in-flight transaction once; return the operations that are done with."""
+        requests_info = [('eth_getTransactionCount', [self.account.address, 'latest'])]
+        owners = []
+        for op in inflight.values():
+            for tx_hash in op.hashes:
+                requests_info.append(('eth_getTransactionReceipt', [tx_hash]))
+                owners.append(op)
+        try:
+            send_batch = self.w3.provider.batch_request_func(self.w3, self.w3.middleware_onion)
+            responses = send_batch(requests_info)
+        except Exception as e:
+            logger.warning("Receipt poll failed: %s", e)
+            return []
+        if not isinstance(responses, list):
+            logger.warning("Receipt poll rejected: %s", responses)
+            return []
+
+        latest = responses[0].get('result')
+        if latest is None:
+            return []
+        latest = int(latest, 16)
+        receipts = {}
+        for op, response in zip(owners, responses[1:]):
+            if response.get('result'):
+                receipts[op.nonce] = response['result']
+
+        now = time.monotonic()
+        if latest != self._head[0]:
+            self._head = (latest, now)
+        done = []
+        for nonce, op in sorted(inflight.items()):
+            receipt = receipts.get(nonce)
+            if receipt is not None:
+                self._mined(op, receipt)
+                done.append(op)
+            elif nonce < latest:
+                # The nonce was used by a transaction we did not send (or no longer see).
+                op.status, op.error = 'dropped', 'nonce consumed by another transaction'
+                done.append(op)
+            elif self.stuck_nonce is not None:
+                # Nothing after a stuck nonce can be mined.
+                op.status, op.error = 'stuck', f'waiting on stuck nonce {self.stuck_nonce}'
+                done.append(op)
+            elif nonce == latest and now - max(op.sent_at, self._head[1]) >= self.replace_after:
+                # Only the next nonce to be mined is replaced; later ones just wait behind it.
+                if op.replacements < self.max_replacements:
+                    self._replace(op)
+                else:
+                    op.status, op.error = 'stuck', f'not mined after {op.replacements} replacements'
+                    self.stuck_nonce = nonce
+                    done.append(op)
+        return done
+
+    def _mined(self, op: Operation, receipt: dict):
+        op.block = int(receipt['blockNumber'], 16)
+        op.gas_used = int(receipt['gasUsed'], 16)
+        op.mined_hash = receipt.get('transactionHash')
+        if int(receipt.get('status', '0x1'), 16) == 1:
+            op.status = 'mined'
+            return
+        key, _ = self.call_for(op)
+        if op.gas_used >= op.gas and op.retries < self.max_retries:
+            # Out of gas: the cached estimate was too low for this call.
+            self.estimates.invalidate(key)
+            op.retries += 1
+            op.status, op.hashes, op.mined_hash = 'retry', [], None
+            return
+        op.status, op.error = 'reverted', 'transaction reverted'
+
+    def _replace(self, op: Operation):
+        gas_price = math.ceil(op.gas_price * self.price_bump)
+        tx = dict(op.tx, gasPrice=gas_price)
+        try:
+            tx_hash = self._send_raw(tx)
+        except Exception as e:
+            logger.warning("Replacing nonce %s failed: %s", op.nonce, e)
+            op.sent_at = time.monotonic()
+            return
+        logger.info("Replaced nonce %s at %s wei gas price", op.nonce, gas_price)
+        op.tx, op.gas_price = tx, gas_price
+        op.hashes.append(tx_hash)
+        op.replacements += 1
+        op.sent_at = time.monotonic()
+        # Later transactions are priced from the bumped value too.
+        self.gas_price = max(self.gas_price, gas_price)
@@ -0,0 +1,343 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+
+
+class _Flight:
+    __slots__ = ('event', 'response', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent requests for the same key into one upstream call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def begin(self, key):
+        """Return ``(flight, leader)``; the leader must call :meth:`finish`."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def finish(self, key, flight, response=None, error=None):
+        flight.response = response
+        flight.error = error
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.event.set()
+
+    def do(self, key, fn):
+        flight, leader = self.begin(key)
+        if not leader:
+            return wait_flight(flight)
+        try:
+            response = fn()
+        except BaseException as e:
+            # Including KeyboardInterrupt and the like: an unfinished flight would block its waiters forever.
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, response=response)
+        return response
+
+
+def wait_flight(flight):
+    flight.event.wait()
+    if flight.error is not None:
+        raise flight.error
+    return flight.response
+
+
+class EthCallCache:
+    """eth_call results keyed by ``(contract, calldata, block)``.
+
+    Calls whose 4-byte selector is declared immutable (``symbol()`` and the
+    like) are cached forever per ``(contract, calldata)``. Every other call is
+    cached for the block it ran at; ``latest`` calls are pinned to the current
+    head, which is itself refreshed at most every ``head_ttl`` seconds, so the
+    per-block entries roll over as soon as the chain advances.
+    """
+
+    def __init__(self, immutable_signatures=('symbol()', 'name()', 'decimals()'),
+                 head_ttl: float = 1.0, max_blocks: int = 2, max_entries: int = 50000):
+        self.immutable_signatures = tuple(immutable_signatures)
+        self.head_ttl = head_ttl
+        self.max_blocks = max_blocks
+        self.max_entries = max_entries
+        self.flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self._immutable = {}
+        self._blocks = OrderedDict()
+        self._chain_id = None
+        self._head = None
+        self._head_checked = 0.0
+        self._lock = threading.Lock()
+
+    @cached_property
+    def immutable_selectors(self) -> set:
+        # Hashed on first use, once web3 is loaded anyway, so building the cache stays cheap.
+        from web3 import Web3
+
+        return {Web3.keccak(text=sig)[:4].hex().removeprefix('0x') for sig in self.immutable_signatures}
+
+    def is_immutable(self, data: str) -> bool:
+        return data[2:10].lower() in self.immutable_selectors
+
+    def head(self, fetch):
+        """Current block number, fetched through ``fetch`` at most every ``head_ttl``.
+
+        Returns ``None`` if the head could not be read.
+        """
+        head = self.fresh_head()
+        if head is not None:
+            return head
+        return self.store_head(self.flights.do(('head',), fetch))
+
+    def fresh_head(self):
+        """The cached head if it was read within ``head_ttl``, else ``None``."""
+        if self._head is not None and time.monotonic() - self._head_checked < self.head_ttl:
+            return self._head
+        return None
+
+    def store_head(self, response):
+        """Record an ``eth_blockNumber`` response and return the head."""
+        if 'result' in response:
+            with self._lock:
+                self._head = int(response['result'], 16)
+                self._head_checked = time.monotonic()
+                self._roll(self._head)
+        return self._head
+
+    def chain_id(self, fetch):
+        """``eth_chainId`` response, fetched once; web3's validation asks for it on every call."""
+        if self._chain_id is None:
+            response = self.flights.do(('chain_id',), fetch)
+            if 'result' not in response:
+                return response
+            self._chain_id = response
+        return self._chain_id
+
+    def key(self, tx: dict, block):
+        """Cache key for a call at ``block``, or ``None`` if it cannot be cached."""
+        to = (tx.get('to') or '').lower()
+        data = (tx.get('data') or tx.get('input') or '').lower()
+        if self.is_immutable(data):
+            return ('immutable', to, data)
+        number = _block_number(block)
+        if number is None:
+            return None
+        return ('block', number, to, data)
+
+    def get(self, key):
+        with self._lock:
+            if key[0] == 'immutable':
+                response = self._immutable.get(key)
+            else:
+                response = self._blocks.get(key[1], {}).get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def set(self, key, response):
+        if not isinstance(response, dict) or 'error' in response or 'result' not in response:
+            return
+        with self._lock:
+            if key[0] == 'immutable':
+                if response['result'] not in (None, '0x') and len(self._immutable) < self.max_entries:
+                    self._immutable[key] = response
+                return
+            entries = self._blocks.setdefault(key[1], {})
+            if len(entries) < self.max_entries:
+                entries[key] = response
+            self._roll(max(self._blocks))
+
+    def _roll(self, newest):
+        for block in [b for b in self._blocks if b <= newest - self.max_blocks]:
+            del self._blocks[block]
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'head': self._head}
+
+
+def _block_number(block):
+    """Block number from an int or hex quantity; tags and block hashes give ``None``."""
+    if isinstance(block, int):
+        return block
+    if isinstance(block, str) and block.startswith('0x') and len(block) <= 18:
+        return int(block, 16)
+    return None
+
+
+def _is_latest(block) -> bool:
+    """Whether ``block`` follows the head; ``safe`` and ``finalized`` lag it, so they are never pinned to it."""
+    return block in (None, 'latest', 'pending')
+
+
+def _check_batch_length(result: list, requests: list):
+    if len(result) != len(requests):
+        raise ValueError(f"Batch response has {len(result)} entries for {len(requests)} requests")
+
+
+def call_cache_middleware(cache: EthCallCache):
+    """Build a Web3 middleware class bound to ``cache``."""
+    from web3.middleware import Web3Middleware
+
+    class EthCallCacheMiddleware(Web3Middleware):
+        def wrap_make_request(self, make_request):
+            def middleware(method, params):
+                if method == 'eth_chainId':
+                    return cache.chain_id(lambda: make_request(method, params))
+                if method == 'eth_blockNumber':
+                    head = cache.head(lambda: make_request(method, params))
+                    if head is None:
+                        return make_request(method, params)
+                    return {'jsonrpc': '2.0', 'id': 0, 'result': hex(head)}
+                if method != 'eth_call' or not params or 'pending' in params[1:2]:
+                    return make_request(method, params)
+
+                tx = params[0]
+                block = params[1] if len(params) > 1 else 'latest'
+                if _is_latest(block):
+                    head = cache.head(lambda: make_request('eth_blockNumber', []))
+                    if head is None:
+                        return make_request(method, params)
+                    block = hex(head)
+                    params = [tx, block, *params[2:]]
+                key = cache.key(tx, block)
+                if key is None:
+                    return make_request(method, params)
+                response = cache.get(key)
+                if response is not None:
+                    return response
+
+                def fetch():
+                    fresh = make_request(method, params)
+                    cache.set(key, fresh)
+                    return fresh
+                return cache.flights.do(key, fetch)
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+            def middleware(requests_info):
+                responses = [None] * len(requests_info)
+                upstream = []
+                waiting = []
+                for i, (method, params) in enumerate(requests_info):
+                    if method != 'eth_call' or not params or len(params) < 2 or _is_latest(params[1]):
+                        upstream.append((i, None, None, (method, params)))
+                        continue
+                    key = cache.key(params[0], params[1])
+                    if key is None:
+                        upstream.append((i, None, None, (method, params)))
+                        continue
+                    cached = cache.get(key)
+                    if cached is not None:
+                        responses[i] = cached
+                        continue
+                    flight, leader = cache.flights.begin(key)
+                    if leader:
+                        upstream.append((i, key, flight, (method, params)))
+                    else:
+                        waiting.append((i, flight))
+
+                if upstream:
+                    error = RuntimeError('eth_call batch ended without answering this call')
+                    try:
+                        result = make_batch_request([request for _, _, _, request in upstream])
+                        if not isinstance(result, list):
+                            for _, key, flight, _ in upstream:
+                                if flight is not None:
+                                    cache.flights.finish(key, flight, response=result)
+                            return result
+                        _check_batch_length(result, upstream)
+                        for (i, key, flight, _), response in zip(upstream, result):
+                            responses[i] = response
+                            if flight is not None:
+                                cache.set(key, response)
+                                cache.flights.finish(key, flight, response=response)
+                    except BaseException as e:
+                        error = e
+                        raise
+                    finally:
+                        # Every flight led here must finish, or later requests for its key wait forever.
+                        for _, key, flight, _ in upstream:
+                            if flight is not None and not flight.event.is_set():
+                                cache.flights.finish(key, flight, error=error)
+
+                for i, flight in waiting:
+                    try:
+                        responses[i] = wait_flight(flight)
+                    except Exception as e:
+                        responses[i] = {'jsonrpc': '2.0', 'id': i, 'error': {'code': -32603, 'message': str(e)}}
+                return responses
+            return middleware
+
+        # AsyncWeb3 shares the same cache. Concurrent misses are not coalesced
+        # here: they all run on one event loop, where a blocking wait would stall it.
+        async def async_wrap_make_request(self, make_request):
+            async def middleware(method, params):
+                if method == 'eth_chainId':
+                    if cache._chain_id is None:
+                        response = await make_request(method, params)
+                        if 'result' not in response:
+                            return response
+                        cache._chain_id = response
+                    return cache._chain_id
+                if method == 'eth_blockNumber':
+                    head = cache.fresh_head()
+                    if head is None:
+                        head = cache.store_head(await make_request(method, params))
+                    if head is None:
+                        return await make_request(method, params)
+                    return {'jsonrpc': '2.0', 'id': 0, 'result': hex(head)}
+                if method != 'eth_call' or not params or len(params) < 2 or _is_latest(params[1]):
+                    return await make_request(method, params)
+                key = cache.key(params[0], params[1])
+                if key is None:
+                    return await make_request(method, params)
+                response = cache.get(key)
+                if response is None:
+                    response = await make_request(method, params)
+                    cache.set(key, response)
+                return response
+            return middleware
+
+        async def async_wrap_make_batch_request(self, make_batch_request):
+            async def middleware(requests_info):
+                responses = [None] * len(requests_info)
+                upstream = []
+                for i, (method, params) in enumerate(requests_info):
+                    key = None
+                    if method == 'eth_call' and params and len(params) >= 2 and not _is_latest(params[1]):
+                        key = cache.key(params[0], params[1])
+                    cached = cache.get(key) if key is not None else None
+                    if cached is not None:
+                        responses[i] = cached
+                    else:
+                        upstream.append((i, key, (method, params)))
+
+                if upstream:
+                    result = await make_batch_request([request for _, _, request in upstream])
+                    if not isinstance(result, list):
+                        return result
+                    _check_batch_length(result, upstream)
+                    for (i, key, _), response in zip(upstream, result):
+                        responses[i] = response
+                        if key is not None:
+                            cache.set(key, response)
+                return responses
+            return middleware
+
+    return EthCallCacheMiddleware
@@ -0,0 +1,93 @@
+import threading
+
+from flask import current_app
+
+from app import aio, rpc
+from app.rpc_batch import BatchCallError, BatchReader
+from app.token_metadata import erc721_abi
+
+_listed_snapshot = (None, frozenset())
+_listed_lock = threading.Lock()
+
+
+def get_w3() -> 'Web3':
+    return rpc.get_w3()
+
+
+def get_marketplace_contract(w3: 'Web3' = None):
+    return rpc.get_marketplace()
+
+
+def get_erc721_contract(address: str):
+    return rpc.erc721(address, erc721_abi())
+
+
+def get_batch_reader(w3: 'Web3' = None) -> BatchReader:
+    """A ``BatchReader`` for the current request; with ``ASYNC_VIEWS`` its batches run concurrently."""
+    w3 = w3 or get_w3()
+    batch_size = current_app.config.get('RPC_BATCH_SIZE', 100)
+    if aio.enabled:
+        return aio.batch_reader(w3, batch_size=batch_size)
+    return BatchReader(w3, batch_size=batch_size)
+
+
+def paged_reads() -> bool:
+    return bool(current_app.config.get('MARKETPLACE_PAGED_READS'))
+
+
+def read_listings(reader: BatchReader) -> list:
+    """Every listing with its price, seller, proposal count and best offer, via ``getListings``.
+
+    One ``getListingCount`` call, then all pages in a single batch at the
+    reader's pinned block, however many listings there are. Rows are in
+    listing order with ``position``, ``contract_address``, ``token_id``,
+    ``price_wei``, ``owner``, ``proposal_count`` and ``best_offer_wei``;
+    ``owner`` is None when the token's ``ownerOf`` reverts.
+    """
+    from web3 import Web3
+
+    marketplace_contract = get_marketplace_contract()
+    block_number = reader.pin_block()
+    count = marketplace_contract.functions.getListingCount().call(block_identifier=block_number)
+    page_size = current_app.config.get('LISTINGS_PAGE_SIZE', 100)
+    pages = [reader.add(marketplace_contract, 'getListings', offset, page_size) for offset in range(0, count, page_size)]
+    values = reader.execute()
+
+    rows = []
+    for page_idx in pages:
+        page = values[page_idx]
+        if isinstance(page, BatchCallError):
+            raise page
+        for nft_address, token_id, price_wei, seller, proposal_count, best_offer_wei in page:
+            rows.append({
+                'position': len(rows),
+                'contract_address': Web3.to_checksum_address(nft_address),
+                'token_id': token_id,
+                'price_wei': price_wei,
+                'owner': None if int(seller, 16) == 0 else Web3.to_checksum_address(seller),
+                'proposal_count': proposal_count,
+                'best_offer_wei': best_offer_wei or None,
+            })
+    return rows
+
+
+def get_listed_set(block_number: int = None) -> frozenset:
+    """``(lowercase address, token id)`` pairs listed on the marketplace.
+
+    The set is rebuilt at most once per block and shared by every request in
+    the process.
+    """
+    global _listed_snapshot
+    if block_number is None:
+        block_number = get_w3().eth.block_number
+    if _listed_snapshot[0] == block_number:
+        return _listed_snapshot[1]
+    with _listed_lock:
+        if _listed_snapshot[0] != block_number:
+            listed_nfts, listed_token_ids = get_marketplace_contract().functions.getAllListedNFTs().call(
+                block_identifier=block_number
+            )
+            _listed_snapshot = (block_number, frozenset(
+                (addr.lower(), tid) for addr, tid in zip(listed_nfts, listed_token_ids)
+            ))
+        return _listed_snapshot[1]
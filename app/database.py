@@ -0,0 +1,54 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config) -> dict:
+    """SQLAlchemy engine options for ``SQLALCHEMY_DATABASE_URI``, sized from the ``DB_*`` settings."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        options = {'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5)}}
+        if url.database and url.database != ':memory:':
+            options.update(pool_size=config.get('DB_POOL_SIZE', 10), max_overflow=config.get('DB_MAX_OVERFLOW', 20))
+        return options
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def sqlite_pragmas(config) -> list:
+    pragmas = [
+        f"synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"cache_size={-int(config.get('SQLITE_CACHE_SIZE', 65536))}",
+        f"mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        "temp_store=MEMORY",
+    ]
+    journal_mode = config.get('SQLITE_JOURNAL_MODE')
+    if journal_mode:
+        pragmas.insert(0, f"journal_mode={journal_mode}")
+    return pragmas
+
+
+def init_engines(app, db):
+    """Apply the SQLite pragmas to every new connection of the app's SQLite engines.
+
+    WAL lets the indexer write while web workers read, and
+    ``synchronous=NORMAL`` is durable in WAL mode except for the last
+    transactions before a power loss.
+    """
+    pragmas = sqlite_pragmas(app.config)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', on_connect)
@@ -0,0 +1,214 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def event_id(event: dict) -> str:
+    return f"{event['block']}-{event['log_index']}"
+
+
+def parse_event_id(value):
+    """``"block-logIndex"`` or a bare block number to a ``(block, log_index)`` position."""
+    if not value:
+        return None
+    block, _, log_index = str(value).partition('-')
+    try:
+        return int(block), int(log_index) if log_index else float('inf')
+    except ValueError:
+        return None
+
+
+def _jsonable(value):
+    if isinstance(value, bytes):
+        from web3 import Web3
+
+        return Web3.to_hex(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        # Wei amounts overflow JavaScript numbers.
+        return str(value)
+    return value
+
+
+class Subscription:
+    """One connected client: its topic filter and a bounded outbound queue."""
+
+    OVERFLOW = None
+
+    def __init__(self, collection: str = None, token_id: int = None, names=None, maxsize: int = 256):
+        self.collection = collection.lower() if collection else None
+        self.token_id = token_id
+        self.names = set(names) if names else None
+        self.queue = queue.Queue(maxsize)
+
+    def matches(self, event: dict) -> bool:
+        if self.collection and event['contract_address'].lower() != self.collection:
+            return False
+        if self.token_id is not None and event['token_id'] != self.token_id:
+            return False
+        return self.names is None or event['name'] in self.names
+
+    def offer(self, event: dict) -> bool:
+        """Queue ``event`` without blocking; a full queue ends the subscription.
+
+        The client then reconnects with ``Last-Event-ID`` and catches up from
+        the replay buffer, so one slow reader never stalls the poller.
+        """
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(self.OVERFLOW)
+            return False
+
+
+class EventFeed:
+    """Marketplace events fanned out from one poller thread per process.
+
+    The poller reads the marketplace logs with eth_getLogs, keeps the newest
+    ``buffer_size`` events for replay, and hands each one to every
+    subscription whose filter matches.
+    """
+
+    def __init__(self, app=None):
+        self.client = None
+        self.poll_interval = 2.0
+        self.backfill_blocks = 1000
+        self.chunk_size = 100
+        self.confirmations = 1
+        self.client_queue = 256
+        self.buffer = deque(maxlen=2000)
+        self.covered_from = None
+        self.last_block = None
+        self._events = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.client = app.extensions['rpc']
+        self.poll_interval = app.config.get('FEED_POLL_INTERVAL', self.poll_interval)
+        self.backfill_blocks = app.config.get('FEED_BACKFILL_BLOCKS', self.backfill_blocks)
+        self.chunk_size = app.config.get('INDEXER_CHUNK_SIZE', self.chunk_size)
+        self.confirmations = app.config.get('FEED_CONFIRMATIONS', self.confirmations)
+        self.client_queue = app.config.get('FEED_CLIENT_QUEUE', self.client_queue)
+        self.buffer = deque(maxlen=app.config.get('FEED_BUFFER_SIZE', 2000))
+        app.extensions['event_feed'] = self
+
+    def subscribe(self, subscription: Subscription, after=None):
+        """Register ``subscription`` and return ``(replay, complete)``.
+
+        ``replay`` holds the buffered events after the ``(block, log_index)``
+        position ``after``. ``complete`` is False when that position is older
+        than the buffer, in which case the client should reload instead.
+        """
+        self._ensure_poller()
+        if after is not None:
+            # Replay needs the backfill from the first poll.
+            self._ready.wait(timeout=10)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if after is None:
+                return [], True
+            complete = self.covered_from is not None and after[0] >= self.covered_from - 1
+            replay = [
+                e for e in self.buffer
+                if (e['block'], e['log_index']) > after and subscription.matches(e)
+            ]
+        return replay, complete
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def poll_once(self):
+        from web3 import Web3
+
+        w3 = self.client.get_w3()
+        contract = self.client.get_marketplace()
+        if self._events is None:
+            from app.indexer import MARKETPLACE_EVENTS
+
+            self._events = {}
+            for name in MARKETPLACE_EVENTS:
+                event = getattr(contract.events, name)
+                self._events[event.topic] = event()
+
+        head = w3.eth.block_number - self.confirmations
+        if self.last_block is None:
+            self.last_block = max(head - self.backfill_blocks, -1)
+            self.covered_from = self.last_block + 1
+        while self.last_block < head:
+            from_block = self.last_block + 1
+            to_block = min(from_block + self.chunk_size - 1, head)
+            logs = w3.eth.get_logs({
+                'address': contract.address,
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'topics': [list(self._events)],
+            })
+            self.publish([self._decode(log) for log in logs if Web3.to_hex(log['topics'][0]) in self._events])
+            self.last_block = to_block
+        self._ready.set()
+
+    def publish(self, events):
+        if not events:
+            return
+        with self._lock:
+            self.buffer.extend(events)
+            subscribers = list(self._subscribers)
+        for event in events:
+            for subscription in subscribers:
+                if subscription.matches(event) and not subscription.offer(event):
+                    self.unsubscribe(subscription)
+
+    def _decode(self, log) -> dict:
+        from web3 import Web3
+
+        data = self._events[Web3.to_hex(log['topics'][0])].process_log(log)
+        args = {k: _jsonable(v) for k, v in data['args'].items()}
+        return {
+            'name': data['event'],
+            'block': log['blockNumber'],
+            'log_index': log['logIndex'],
+            'tx_hash': Web3.to_hex(log['transactionHash']),
+            'contract_address': Web3.to_checksum_address(data['args']['nftAddress']),
+            'token_id': int(data['args']['tokenId']),
+            'args': args,
+        }
+
+    def _ensure_poller(self):
+        # Started lazily so each forked worker runs exactly one poller of its own.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name='event-feed', daemon=True)
+                self._thread.start()
+
+    def _poll_loop(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception("Event feed poll failed")
+            time.sleep(self.poll_interval)
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event_id(event)}\nevent: {event['name']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,252 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metadata_cache import LRUCache
+from app.metrics import instrumented_session
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are linked directly
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('image/webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('image/jpeg', 'JPEG', {'quality': 82, 'progressive': True, 'optimize': True}),
+}
+
+
+def source_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+class ImageIndex:
+    """SQLite table mapping proxy keys to their source URL and content hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_source ("
+            " key TEXT PRIMARY KEY, url TEXT NOT NULL, sha256 TEXT, error TEXT, updated_at REAL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def register(self, sources: dict):
+        """Insert ``key -> url`` rows that are not there yet, in one transaction."""
+        conn = self._conn()
+        conn.executemany("INSERT OR IGNORE INTO image_source (key, url) VALUES (?, ?)", sources.items())
+        conn.commit()
+
+    def get(self, key: str):
+        """Return ``(url, sha256, error, updated_at)`` or ``None`` for an unknown key."""
+        return self._conn().execute(
+            "SELECT url, sha256, error, updated_at FROM image_source WHERE key = ?", (key,)
+        ).fetchone()
+
+    def record(self, key: str, sha256: str = None, error: str = None):
+        conn = self._conn()
+        conn.execute(
+            "UPDATE image_source SET sha256 = ?, error = ?, updated_at = ? WHERE key = ?",
+            (sha256, error, time.time(), key),
+        )
+        conn.commit()
+
+
+class ImageProxy:
+    """Fetch remote NFT images once and serve fixed-size thumbnails from disk.
+
+    Templates link to ``/nfts/image/<key>`` through the ``thumbnail`` filter,
+    which registers the source URL under a key derived from it; only
+    registered URLs are ever fetched. Rendering only queues new keys: a
+    background writer stores them in batches, and keys known to be stored
+    are remembered in a bounded LRU. Originals are stored by the SHA-256 of
+    their bytes, so the same image behind several URLs is kept once, and
+    WebP/JPEG thumbnails are rendered from them on a background pool.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.root = None
+        self.index = None
+        self.size = 512
+        self.max_bytes = 20 * 1024 * 1024
+        self.timeout = 15
+        self.retry_after = 3600
+        self._executor = None
+        self._writer = None
+        self._pending = set()
+        self._registered = LRUCache(10000)
+        self._queued = {}
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+        self.http = instrumented_session()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.root = app.config.get('IMAGE_CACHE_DIR')
+        self.enabled = bool(self.root) and Image is not None and app.config.get('IMAGE_PROXY', True)
+        self.size = app.config.get('IMAGE_THUMB_SIZE', self.size)
+        self.max_bytes = app.config.get('IMAGE_MAX_BYTES', self.max_bytes)
+        self.timeout = app.config.get('IMAGE_FETCH_TIMEOUT', self.timeout)
+        self.retry_after = app.config.get('IMAGE_RETRY_AFTER', self.retry_after)
+        self._registered = LRUCache(app.config.get('IMAGE_KEY_CACHE_SIZE', 10000))
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            self.index = ImageIndex(os.path.join(self.root, 'index.sqlite'))
+            self._executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMAGE_WORKERS', 4), thread_name_prefix='thumbnail'
+            )
+            # Separate from the thumbnail pool, so registrations never wait behind slow image downloads.
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnail-index')
+        app.extensions['image_proxy'] = self
+
+    def register(self, url: str):
+        """Return the proxy key for ``url``, or ``None`` if it should be linked directly."""
+        if not self.enabled or not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+            return None
+        key = source_key(url)
+        if self._registered.get(key) is None:
+            with self._lock:
+                self._queued[key] = url
+                schedule = not self._flush_scheduled
+                self._flush_scheduled = True
+            if schedule:
+                self._writer.submit(self.flush)
+        return key
+
+    def flush(self):
+        """Store the keys queued by :meth:`register`.
+
+        Keys stay queued until they are committed, so :meth:`lookup` can
+        always find a key that was handed out.
+        """
+        with self._lock:
+            self._flush_scheduled = False
+            queued = dict(self._queued)
+        if not queued:
+            return
+        try:
+            self.index.register(queued)
+        except sqlite3.Error as e:
+            # Dropped; the next render of these images queues them again.
+            logger.warning("Could not register %d thumbnail sources: %s", len(queued), e)
+        else:
+            for key in queued:
+                self._registered.set(key, True, float('inf'))
+        with self._lock:
+            for key in queued:
+                self._queued.pop(key, None)
+
+    def thumbnail_path(self, sha256: str, fmt: str) -> str:
+        return os.path.join(self.root, 'thumbs', sha256[:2], f'{sha256}-{self.size}.{fmt}')
+
+    def original_path(self, sha256: str) -> str:
+        return os.path.join(self.root, 'originals', sha256[:2], sha256)
+
+    def lookup(self, key: str):
+        """Return ``(url, thumbnail_sha256_or_None, failed)`` or ``None`` for an unknown key.
+
+        Starts a background build when the thumbnail is missing or a previous
+        failure is older than ``retry_after``.
+        """
+        if not self.enabled:
+            return None
+        row = self.index.get(key)
+        if row is None and key in self._queued:
+            # Requested by the browser before the writer stored it.
+            self.flush()
+            row = self.index.get(key)
+        if row is None:
+            return None
+        url, sha256, error, updated_at = row
+        if sha256 and all(os.path.exists(self.thumbnail_path(sha256, fmt)) for fmt in FORMATS):
+            return url, sha256, False
+        failed = error is not None and time.time() - (updated_at or 0) < self.retry_after
+        if not failed:
+            self.schedule(key, url)
+        return url, None, failed
+
+    def schedule(self, key: str, url: str):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._build, key, url)
+
+    def _build(self, key: str, url: str):
+        try:
+            sha256 = self._fetch(url)
+            for fmt in FORMATS:
+                self._render(sha256, fmt)
+            self.index.record(key, sha256=sha256)
+        except Exception as e:
+            logger.warning("Thumbnail for %s failed: %s", url, e)
+            try:
+                self.index.record(key, error=str(e)[:200])
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _fetch(self, url: str) -> str:
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.download-')
+        try:
+            with os.fdopen(fd, 'wb') as out, self.http.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=65536):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"image larger than {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.original_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+            return sha256
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _render(self, sha256: str, fmt: str):
+        path = self.thumbnail_path(sha256, fmt)
+        if os.path.exists(path):
+            return
+        _, pil_format, options = FORMATS[fmt]
+        with Image.open(self.original_path(sha256)) as image:
+            image.seek(0)
+            thumb = ImageOps.exif_transpose(image)
+            thumb.thumbnail((self.size, self.size))
+            if pil_format == 'JPEG' or thumb.mode not in ('RGB', 'RGBA'):
+                thumb = thumb.convert('RGB' if pil_format == 'JPEG' else 'RGBA')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.thumb-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    thumb.save(out, pil_format, **options)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
@@ -0,0 +1,369 @@
+import json
+import logging
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from web3 import Web3
+
+from app import db
+from app.model import ChainEvent, IndexerCheckpoint, NFT, Offer, QuarantinedEvent, User
+from app.rpc_batch import BatchReader, batch_value
+from app.stats import CollectionStatsUpdater, token_snapshot
+from app.token_metadata import erc721_abi, image_from_metadata, load_token_metadata_many
+
+logger = logging.getLogger(__name__)
+
+SALE_EVENTS = ('NFTSold', 'ProposalAccepted')
+
+MARKETPLACE_EVENTS = (
+    'NFTListed',
+    'NFTUnlisted',
+    'NFTSold',
+    'ProposalMade',
+    'ProposalCancelled',
+    'ProposalAccepted',
+)
+
+
+class MarketplaceIndexer:
+    """Ingest marketplace events with eth_getLogs into the NFT and Offer tables.
+
+    Raw logs are stored in ``ChainEvent`` and the NFT/Offer rows of every token
+    touched by a block range are rebuilt by replaying that token's events, so a
+    reorg can be undone by deleting the orphaned events and replaying again.
+    Only blocks at least ``confirmations`` deep are indexed; if the checkpoint
+    block hash no longer matches the chain the indexer rewinds ``reorg_window``
+    blocks. A block range that fails is indexed again event by event, and
+    events that still fail are moved to ``QuarantinedEvent`` instead of
+    blocking the range forever.
+    """
+
+    CHECKPOINT = 'marketplace'
+
+    def __init__(self, w3: Web3, contract, start_block: int = 0, chunk_size: int = 100,
+                 confirmations: int = 2, reorg_window: int = 10, batch_size: int = 100):
+        self.w3 = w3
+        self.contract = contract
+        self.start_block = start_block
+        self.chunk_size = max(1, chunk_size)
+        self.confirmations = confirmations
+        self.reorg_window = reorg_window
+        self.batch_size = batch_size
+        self.events = {}
+        for name in MARKETPLACE_EVENTS:
+            event = getattr(contract.events, name)
+            self.events[event.topic] = event()
+
+    @classmethod
+    def from_app(cls, app):
+        config = app.config
+        client = app.extensions['rpc']
+        return cls(
+            client.get_w3(),
+            client.get_marketplace(),
+            start_block=config.get('INDEXER_START_BLOCK', 0),
+            chunk_size=config.get('INDEXER_CHUNK_SIZE', 100),
+            confirmations=config.get('INDEXER_CONFIRMATIONS', 2),
+            reorg_window=config.get('INDEXER_REORG_WINDOW', 10),
+            batch_size=config.get('RPC_BATCH_SIZE', 100),
+        )
+
+    def run_forever(self, poll_interval: float = 2.0):
+        while True:
+            try:
+                caught_up = self.run_once()
+            except Exception:
+                logger.exception("Indexer iteration failed")
+                db.session.rollback()
+                caught_up = True
+            if caught_up:
+                time.sleep(poll_interval)
+
+    def run_once(self, max_chunks: int = 50) -> bool:
+        """Index up to ``max_chunks`` block ranges; return True once caught up."""
+        checkpoint = self._checkpoint()
+        self._check_reorg(checkpoint)
+        head = self.w3.eth.block_number - self.confirmations
+        from_block = checkpoint.block_number + 1
+        for _ in range(max_chunks):
+            if from_block > head:
+                return True
+            to_block = min(from_block + self.chunk_size - 1, head)
+            try:
+                self.index_range(checkpoint, from_block, to_block)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Indexing blocks %d-%d failed; retrying event by event", from_block, to_block)
+                self.index_range(checkpoint, from_block, to_block, isolate=True)
+            from_block = to_block + 1
+        return from_block > head
+
+    def index_range(self, checkpoint, from_block: int, to_block: int, isolate: bool = False):
+        """Store and apply the marketplace events of one block range.
+
+        With ``isolate`` every event and every token rebuild runs in its own
+        savepoint, and whatever fails is quarantined rather than failing the range.
+        """
+        logs = self.w3.eth.get_logs({
+            'address': self.contract.address,
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'topics': [list(self.events)],
+        })
+        touched = set()
+        timestamps = {}
+        sales = {}
+        for log in logs:
+            event = self.events.get(Web3.to_hex(log['topics'][0]))
+            if event is None:
+                continue
+            if log['blockNumber'] not in timestamps:
+                timestamps[log['blockNumber']] = self.w3.eth.get_block(log['blockNumber'])['timestamp']
+            try:
+                with _savepoint(isolate):
+                    chain_event = self._store_event(event, log, timestamps[log['blockNumber']])
+            except Exception as exc:
+                if not isolate:
+                    raise
+                self._quarantine(log['blockNumber'], log['logIndex'], Web3.to_hex(log['transactionHash']),
+                                 Web3.to_json(log), exc)
+                continue
+            if chain_event.name in SALE_EVENTS:
+                sales[(chain_event.block_number, chain_event.log_index)] = (
+                    chain_event.contract_address, int(json.loads(chain_event.args)['price']),
+                    chain_event.block_timestamp,
+                )
+            touched.add((chain_event.contract_address, chain_event.token_id))
+        db.session.flush()
+
+        stats = CollectionStatsUpdater(to_block)
+        nfts = []
+        for key in sorted(touched):
+            try:
+                with _savepoint(isolate):
+                    nfts.append(self._rebuild_with_stats(key, stats))
+            except Exception as exc:
+                if not isolate:
+                    raise
+                # Set aside this token's events from the range and rebuild it from the earlier ones.
+                events = ChainEvent.query.filter_by(contract_address=key[0], token_id=key[1]) \
+                    .filter(ChainEvent.block_number.between(from_block, to_block)).all()
+                for chain_event in events:
+                    self._quarantine(chain_event.block_number, chain_event.log_index, chain_event.tx_hash,
+                                     json.dumps({'event': chain_event.name, 'args': json.loads(chain_event.args)}), exc)
+                    sales.pop((chain_event.block_number, chain_event.log_index), None)
+                    db.session.delete(chain_event)
+                db.session.flush()
+                try:
+                    with _savepoint(isolate):
+                        nfts.append(self._rebuild_with_stats(key, stats))
+                except Exception:
+                    logger.exception("Could not rebuild %s #%s; leaving it as it was", *key)
+        for contract_address, price, timestamp in sales.values():
+            stats.add_sale(contract_address, price, timestamp)
+        stats.finish()
+        self._enrich([nft for nft in nfts if nft is not None and nft.listed and not nft.symbol])
+
+        checkpoint.block_number = to_block
+        checkpoint.block_hash = Web3.to_hex(self.w3.eth.get_block(to_block)['hash'])
+        db.session.commit()
+        if logs:
+            logger.info("Indexed %d marketplace events in blocks %d-%d", len(logs), from_block, to_block)
+
+    def _store_event(self, event, log, block_timestamp: int) -> ChainEvent:
+        data = event.process_log(log)
+        args = dict(data['args'])
+        chain_event = ChainEvent(
+            block_number=log['blockNumber'],
+            block_hash=Web3.to_hex(log['blockHash']),
+            log_index=log['logIndex'],
+            tx_hash=Web3.to_hex(log['transactionHash']),
+            name=data['event'],
+            contract_address=Web3.to_checksum_address(args['nftAddress']),
+            token_id=int(args['tokenId']),
+            args=json.dumps(args),
+            block_timestamp=block_timestamp,
+        )
+        db.session.add(chain_event)
+        return chain_event
+
+    def _quarantine(self, block_number: int, log_index: int, tx_hash: str, log: str, error: Exception):
+        logger.error("Quarantined marketplace event %s (block %d, log %d): %r", tx_hash, block_number, log_index, error)
+        db.session.add(QuarantinedEvent(block_number=block_number, log_index=log_index, tx_hash=tx_hash,
+                                        log=log, error=repr(error)))
+
+    def _rebuild_tokens(self, keys, stats: CollectionStatsUpdater) -> list:
+        """Rebuild each token and feed its before/after state into the collection stats."""
+        return [self._rebuild_with_stats(key, stats) for key in sorted(keys)]
+
+    def _rebuild_with_stats(self, key, stats: CollectionStatsUpdater):
+        before = token_snapshot(NFT.query.filter_by(contract_address=key[0], token_id=key[1]).first())
+        nft = self.rebuild_token(*key)
+        stats.apply(key[0], before, token_snapshot(nft))
+        return nft
+
+    def rebuild_token(self, contract_address: str, token_id: int):
+        """Recompute one token's NFT row and offers from its stored events."""
+        events = ChainEvent.query.filter_by(contract_address=contract_address, token_id=token_id) \
+            .order_by(ChainEvent.block_number, ChainEvent.log_index).all()
+        nft = NFT.query.filter_by(contract_address=contract_address, token_id=token_id).first()
+        if nft is not None:
+            Offer.query.filter_by(nft_id=nft.id).delete()
+        if not events:
+            if nft is not None:
+                nft.listed = False
+                nft.price = nft.price_wei = None
+                nft.best_offer = nft.best_offer_wei = None
+                nft.offer_count = 0
+            return nft
+
+        owner = None
+        listed = False
+        price_wei = None
+        listed_block = None
+        offers = []
+        for event in events:
+            args = json.loads(event.args)
+            if event.name == 'NFTListed':
+                owner, listed, listed_block = args['seller'], True, event.block_number
+                price_wei = int(args['price'])
+            elif event.name == 'NFTUnlisted':
+                listed, price_wei = False, None
+            elif event.name == 'NFTSold':
+                owner, listed, price_wei = args['buyer'], False, None
+            elif event.name == 'ProposalMade':
+                for offer in _pending(offers, args['proposer']):
+                    offer.status = 'replaced'
+                offers.append(Offer(
+                    buyer_wallet=args['proposer'],
+                    offer_price=_ether(args['proposedPrice']),
+                    offer_price_wei=int(args['proposedPrice']),
+                    created_at=_block_time(event),
+                    status='pending',
+                ))
+            elif event.name == 'ProposalCancelled':
+                for offer in _pending(offers, args['proposer']):
+                    offer.status = 'cancelled'
+            elif event.name == 'ProposalAccepted':
+                for offer in _pending(offers):
+                    offer.status = 'accepted' if offer.buyer_wallet == args['buyer'] else 'refunded'
+                owner, listed, price_wei = args['buyer'], False, None
+
+        if owner is None:
+            owner = nft.owner.wallet_address if nft is not None else self._owner_of(contract_address, token_id)
+            if owner is None:
+                return None
+
+        owner_user = _get_or_create_user(owner)
+        if nft is None:
+            nft = NFT(contract_address=contract_address, token_id=token_id, owner=owner_user)
+            db.session.add(nft)
+        nft.owner = owner_user
+        nft.listed = listed
+        nft.price = _ether(price_wei)
+        nft.price_wei = price_wei
+        nft.listed_block = listed_block
+        pending = _pending(offers)
+        nft.best_offer_wei = max((offer.offer_price_wei for offer in pending), default=None)
+        nft.best_offer = _ether(nft.best_offer_wei)
+        nft.offer_count = len(pending)
+        for offer in offers:
+            offer.nft = nft
+            db.session.add(offer)
+        return nft
+
+    def rewind(self, checkpoint, to_block: int):
+        """Drop events after ``to_block`` and rebuild every token they touched."""
+        orphaned = ChainEvent.query.filter(ChainEvent.block_number > to_block)
+        stats = CollectionStatsUpdater(to_block)
+        touched = set()
+        for event in orphaned:
+            touched.add((event.contract_address, event.token_id))
+            if event.name in SALE_EVENTS and event.block_timestamp is not None:
+                price_wei = int(json.loads(event.args)['price'])
+                stats.add_sale(event.contract_address, price_wei, event.block_timestamp, sign=-1)
+        orphaned.delete(synchronize_session=False)
+        QuarantinedEvent.query.filter(QuarantinedEvent.block_number > to_block).delete(synchronize_session=False)
+        self._rebuild_tokens(touched, stats)
+        stats.finish()
+        checkpoint.block_number = to_block
+        checkpoint.block_hash = Web3.to_hex(self.w3.eth.get_block(to_block)['hash']) if to_block >= 0 else None
+        db.session.commit()
+        logger.warning("Rewound marketplace index to block %d (%d tokens rebuilt)", to_block, len(touched))
+
+    def _checkpoint(self):
+        checkpoint = db.session.get(IndexerCheckpoint, self.CHECKPOINT)
+        if checkpoint is None:
+            checkpoint = IndexerCheckpoint(name=self.CHECKPOINT, block_number=self.start_block - 1)
+            db.session.add(checkpoint)
+            db.session.commit()
+        return checkpoint
+
+    def _check_reorg(self, checkpoint):
+        if not checkpoint.block_hash or checkpoint.block_number < 0:
+            return
+        current = Web3.to_hex(self.w3.eth.get_block(checkpoint.block_number)['hash'])
+        if current != checkpoint.block_hash:
+            self.rewind(checkpoint, max(self.start_block - 1, checkpoint.block_number - self.reorg_window))
+
+    def _owner_of(self, contract_address: str, token_id: int):
+        nft_contract = self.w3.eth.contract(address=contract_address, abi=erc721_abi())
+        try:
+            return nft_contract.functions.ownerOf(token_id).call()
+        except Exception:
+            logger.warning("Could not resolve owner of %s #%s", contract_address, token_id)
+            return None
+
+    def _enrich(self, nfts):
+        """Fill symbol, tokenURI and display metadata for newly listed tokens."""
+        if not nfts:
+            return
+        reader = BatchReader(self.w3, batch_size=self.batch_size)
+        contracts = {}
+        pending = []
+        for nft in nfts:
+            if nft.contract_address not in contracts:
+                contracts[nft.contract_address] = self.w3.eth.contract(address=nft.contract_address, abi=erc721_abi())
+            nft_contract = contracts[nft.contract_address]
+            pending.append((nft, reader.add(nft_contract, 'symbol'), reader.add(nft_contract, 'tokenURI', nft.token_id)))
+        values = reader.execute()
+
+        for nft, symbol_idx, uri_idx in pending:
+            nft.symbol = batch_value(values, symbol_idx, None)
+            nft.token_uri = batch_value(values, uri_idx, None)
+        metadata = load_token_metadata_many(nft.token_uri for nft, _, _ in pending if nft.token_uri)
+        for nft, _, _ in pending:
+            token_metadata = metadata.get(nft.token_uri) or {}
+            nft.name = (token_metadata.get('name') or '')[:100] or None
+            nft.description = token_metadata.get('description')
+            image_url = image_from_metadata(token_metadata)
+            nft.image_url = image_url[:255] if image_url else None
+
+
+def _savepoint(isolate: bool):
+    return db.session.begin_nested() if isolate else nullcontext()
+
+
+def _block_time(event: ChainEvent) -> datetime:
+    # Events stored before block timestamps were recorded for every event fall back to when they were indexed.
+    if event.block_timestamp is None:
+        return event.indexed_at
+    return datetime.fromtimestamp(event.block_timestamp, timezone.utc)
+
+
+def _ether(wei):
+    return None if wei is None else float(Web3.from_wei(wei, 'ether'))
+
+
+def _pending(offers, buyer: str = None):
+    return [o for o in offers if o.status == 'pending' and (buyer is None or o.buyer_wallet == buyer)]
+
+
+def _get_or_create_user(wallet_address: str) -> User:
+    wallet_address = User.normalize_address(wallet_address)
+    user = User.query.filter_by(wallet_address=wallet_address).first()
+    if user is None:
+        user = User(wallet_address=wallet_address)
+        db.session.add(user)
+    return user
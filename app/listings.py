@@ -0,0 +1,290 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from flask import url_for
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+
+from app.chain import get_batch_reader, get_erc721_contract, get_marketplace_contract, get_w3, paged_reads, read_listings
+from app.model import NFT, User
+from app.rpc_batch import batch_value
+from app.token_metadata import image_from_metadata, load_token_metadata_many
+
+# Sortable fields per read source, the default first. A listing's position in
+# getAllListedNFTs() is not a listing time and moves when another listing is
+# removed (swap-and-pop), so the chain source cannot sort by ``listed``.
+SORT_FIELDS = {
+    'index': ('listed', 'price', 'token_id'),
+    'chain': ('token_id', 'price'),
+}
+# Types of the keyset a cursor carries after sort and order, per read source.
+CURSOR_KEYS = {
+    'index': ((int, type(None)), int),  # sort value (NULL sorts first), nft.id
+    'chain': (int, str, int),           # sort value, contract address, token id
+}
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+class ListingQueryError(ValueError):
+    pass
+
+
+class ListingQuery:
+    """Sort, filter and keyset-cursor parameters for one page of listings."""
+
+    def __init__(self, sort='listed', order='desc', limit=DEFAULT_LIMIT, cursor=None,
+                 collection=None, owner=None, min_price=None, max_price=None):
+        self.sort = sort
+        self.order = order
+        self.limit = limit
+        self.cursor = cursor
+        self.collection = collection
+        self.owner = owner
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def from_args(cls, args, source: str = 'chain'):
+        sort = args.get('sort', SORT_FIELDS[source][0])
+        if sort not in SORT_FIELDS[source]:
+            raise ListingQueryError(f"sort must be one of {', '.join(SORT_FIELDS[source])}")
+        order = args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            raise ListingQueryError("order must be 'asc' or 'desc'")
+        try:
+            limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ListingQueryError("limit must be an integer")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ListingQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+
+        cursor = None
+        if args.get('cursor'):
+            cursor = decode_cursor(args['cursor'], CURSOR_KEYS[source])
+            if cursor[:2] != [sort, order]:
+                raise ListingQueryError("cursor does not match sort/order")
+
+        return cls(
+            sort=sort,
+            order=order,
+            limit=limit,
+            cursor=cursor,
+            collection=_address_arg(args, 'collection'),
+            owner=_address_arg(args, 'owner'),
+            min_price=_price_arg(args, 'min_price'),
+            max_price=_price_arg(args, 'max_price'),
+        )
+
+    def price_matches(self, price_wei) -> bool:
+        if price_wei is None:
+            return self.min_price is None and self.max_price is None
+        if self.min_price is not None and price_wei < self.min_price:
+            return False
+        if self.max_price is not None and price_wei > self.max_price:
+            return False
+        return True
+
+
+def _address_arg(args, name):
+    from web3 import Web3
+
+    value = args.get(name)
+    if not value:
+        return None
+    if not Web3.is_address(value):
+        raise ListingQueryError(f"{name} must be an address")
+    return Web3.to_checksum_address(value)
+
+
+def _price_arg(args, name):
+    """Parse an ether amount into wei."""
+    from web3 import Web3
+
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Web3.to_wei(Decimal(value), 'ether')
+    except (InvalidOperation, ValueError):
+        raise ListingQueryError(f"{name} must be a decimal MON amount")
+
+
+def encode_cursor(query: ListingQuery, key) -> str:
+    raw = json.dumps([query.sort, query.order, *key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _has_type(item, expected) -> bool:
+    return type(item) in expected if isinstance(expected, tuple) else type(item) is expected
+
+
+def decode_cursor(cursor: str, key_types: tuple) -> list:
+    """``[sort, order, *key]`` from a cursor, checking that ``key`` has the given types.
+
+    A key type may be a tuple of the types allowed in that position.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ListingQueryError("invalid cursor")
+    if (not isinstance(value, list) or len(value) != 2 + len(key_types)
+            or not all(_has_type(item, expected) for item, expected in zip(value, (str, str, *key_types)))):
+        raise ListingQueryError("invalid cursor")
+    return value
+
+
+def _page(query: ListingQuery, items: list, keys: list) -> dict:
+    next_cursor = None
+    if len(items) > query.limit:
+        items = items[:query.limit]
+        next_cursor = encode_cursor(query, keys[query.limit - 1])
+    return {'items': items, 'next_cursor': next_cursor, 'limit': query.limit}
+
+
+def indexed_page(query: ListingQuery) -> dict:
+    """One page of listings straight from the indexed ``nft`` table."""
+    from web3 import Web3
+
+    column = {'listed': NFT.listed_block, 'price': NFT.price_wei, 'token_id': NFT.token_id}[query.sort]
+    q = NFT.query.options(joinedload(NFT.owner)).filter(NFT.listed.is_(True))
+    if query.collection:
+        q = q.filter(NFT.contract_address == query.collection)
+    if query.owner:
+        q = q.join(User, NFT.owner_id == User.id).filter(User.wallet_address == User.normalize_address(query.owner))
+    if query.min_price is not None:
+        q = q.filter(NFT.price_wei >= query.min_price)
+    if query.max_price is not None:
+        q = q.filter(NFT.price_wei <= query.max_price)
+
+    # Rows without a listing block or wei price (indexed before those columns
+    # existed) sort below every value, as SQLite orders NULLs in the index.
+    if query.cursor:
+        value, last_id = query.cursor[2], query.cursor[3]
+        if query.order == 'asc' and value is None:
+            q = q.filter(or_(column.isnot(None), NFT.id > last_id))
+        elif query.order == 'asc':
+            q = q.filter(or_(column > value, and_(column == value, NFT.id > last_id)))
+        elif value is None:
+            q = q.filter(column.is_(None), NFT.id < last_id)
+        else:
+            q = q.filter(or_(column < value, and_(column == value, NFT.id < last_id), column.is_(None)))
+    if query.order == 'asc':
+        q = q.order_by(column.asc().nulls_first(), NFT.id.asc())
+    else:
+        q = q.order_by(column.desc().nulls_last(), NFT.id.desc())
+
+    rows = q.limit(query.limit + 1).all()
+    dummy = url_for('static', filename='images/dummy.png')
+    items = [{
+        'contract_address': nft.contract_address,
+        'token_id': nft.token_id,
+        'price': str(Web3.from_wei(nft.price_wei, 'ether')) if nft.price_wei is not None else None,
+        'symbol': nft.symbol or 'Unknown',
+        'name': nft.name,
+        'image_url': nft.image_url or dummy,
+        'owner': nft.owner.wallet_address,
+    } for nft in rows]
+    keys = [[getattr(nft, column.key), nft.id] for nft in rows]
+    return _page(query, items, keys)
+
+
+def chain_page(query: ListingQuery) -> dict:
+    """One page of listings read live from the contract.
+
+    Only the calls needed to sort and filter (``getPrice`` for price sorts or
+    ranges, ``ownerOf`` for an owner filter) run for every listing; symbol,
+    tokenURI and metadata are resolved for the returned page alone. With
+    ``MARKETPLACE_PAGED_READS`` prices and owners come from ``getListings``
+    pages instead, so no per-listing call runs before the page is cut.
+    """
+    from web3 import Web3
+
+    w3 = get_w3()
+    marketplace_contract = get_marketplace_contract(w3)
+    reader = get_batch_reader(w3)
+    if paged_reads():
+        # getListings pages already carry price and owner, so nothing is read per listing to filter.
+        rows = [row for row in read_listings(reader)
+                if not query.collection or row['contract_address'] == query.collection]
+    else:
+        block_number = reader.pin_block()
+        listed_nfts, listed_token_ids = marketplace_contract.functions.getAllListedNFTs().call(
+            block_identifier=block_number
+        )
+        rows = []
+        for nft_address, token_id in zip(listed_nfts, listed_token_ids):
+            nft_address = Web3.to_checksum_address(nft_address)
+            if query.collection and nft_address != query.collection:
+                continue
+            rows.append({'contract_address': nft_address, 'token_id': token_id})
+    contracts = {}
+    for row in rows:
+        if row['contract_address'] not in contracts:
+            contracts[row['contract_address']] = get_erc721_contract(row['contract_address'])
+
+    need_price = query.sort == 'price' or query.min_price is not None or query.max_price is not None
+    if (need_price or query.owner) and not paged_reads():
+        for row in rows:
+            if need_price:
+                row['price_idx'] = reader.add(marketplace_contract, 'getPrice', row['contract_address'], row['token_id'])
+            if query.owner:
+                row['owner_idx'] = reader.add(contracts[row['contract_address']], 'ownerOf', row['token_id'])
+        values = reader.execute()
+        for row in rows:
+            if need_price:
+                row['price_wei'] = batch_value(values, row.pop('price_idx'), None)
+            if query.owner:
+                row['owner'] = batch_value(values, row.pop('owner_idx'), None)
+    if need_price or query.owner:
+        rows = [
+            row for row in rows
+            if (not need_price or query.price_matches(row['price_wei']))
+            and (not query.owner or (row['owner'] or '').lower() == query.owner.lower())
+        ]
+
+    def sort_key(row):
+        value = row.get('price_wei') or 0 if query.sort == 'price' else row['token_id']
+        return [value, row['contract_address'], row['token_id']]
+
+    descending = query.order == 'desc'
+    rows.sort(key=sort_key, reverse=descending)
+    if query.cursor:
+        last = query.cursor[2:]
+        rows = [row for row in rows if (sort_key(row) < last if descending else sort_key(row) > last)]
+    rows = rows[:query.limit + 1]
+
+    for row in rows:
+        nft_contract = contracts[row['contract_address']]
+        if 'price_wei' not in row:
+            row['price_idx'] = reader.add(marketplace_contract, 'getPrice', row['contract_address'], row['token_id'])
+        if 'owner' not in row:
+            row['owner_idx'] = reader.add(nft_contract, 'ownerOf', row['token_id'])
+        row['symbol_idx'] = reader.add(nft_contract, 'symbol')
+        row['uri_idx'] = reader.add(nft_contract, 'tokenURI', row['token_id'])
+    values = reader.execute()
+    for row in rows:
+        if 'price_idx' in row:
+            row['price_wei'] = batch_value(values, row['price_idx'], None)
+        if 'owner_idx' in row:
+            row['owner'] = batch_value(values, row['owner_idx'], None)
+        row['symbol'] = batch_value(values, row['symbol_idx'], 'Unknown')
+        row['token_uri'] = batch_value(values, row['uri_idx'], None)
+
+    metadata = load_token_metadata_many(row['token_uri'] for row in rows if row['token_uri'])
+    dummy = url_for('static', filename='images/dummy.png')
+    items = []
+    for row in rows:
+        token_metadata = metadata.get(row['token_uri']) or {}
+        items.append({
+            'contract_address': row['contract_address'],
+            'token_id': row['token_id'],
+            'price': str(Web3.from_wei(row['price_wei'], 'ether')) if row['price_wei'] is not None else None,
+            'symbol': row['symbol'],
+            'name': token_metadata.get('name'),
+            'image_url': image_from_metadata(token_metadata) or dummy,
+            'owner': row['owner'] or 'Unknown',
+        })
+    return _page(query, items, [sort_key(row) for row in rows])
@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process LRU of ``key -> (expires_at, value)``."""
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteStore:
+    """On-disk cache table shared by every worker process on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata_cache ("
+            " key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM metadata_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0]) if row[0] is not None else None
+        return row[1], value
+
+    def set(self, key, value, expires_at: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO metadata_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value) if value is not None else None, expires_at),
+        )
+        conn.commit()
+
+    def prune(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM metadata_cache WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
+
+
+class MetadataCache:
+    """Two-tier tokenURI metadata cache: in-process LRU backed by SQLite.
+
+    Failed fetches are stored as ``None`` with a short negative TTL so a dead
+    URI is not retried on every render.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, app=None):
+        self.memory = None
+        self.store = None
+        self.ttl = 86400
+        self.negative_ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._sets = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('METADATA_CACHE_TTL', self.ttl)
+        self.negative_ttl = app.config.get('METADATA_NEGATIVE_TTL', self.negative_ttl)
+        self.memory = LRUCache(app.config.get('METADATA_CACHE_SIZE', 2048))
+        path = app.config.get('METADATA_CACHE_PATH')
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.store = SQLiteStore(path)
+        app.extensions['metadata_cache'] = self
+
+    def lookup(self, key: str):
+        """Return ``(found, value)``; ``value`` is ``None`` for a cached failure."""
+        entry = self.memory.get(key) if self.memory else None
+        if entry is None and self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except sqlite3.Error:
+                entry = None
+            if entry is not None and self.memory is not None:
+                self.memory.set(key, entry[1], entry[0])
+        with self._stats_lock:
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+        return True, entry[1]
+
+    def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        if self.memory is not None:
+            self.memory.set(key, value, expires_at)
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value, expires_at)
+            self._sets += 1
+            if self._sets % self.PRUNE_EVERY == 0:
+                self.store.prune()
+        except sqlite3.Error:
+            pass
+
+    def set_failed(self, key: str):
+        self.set(key, None, ttl=self.negative_ttl)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+        }
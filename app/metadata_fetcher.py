@@ -0,0 +1,134 @@
+import asyncio
+
+from app.metrics import aiohttp_trace_config
+
+
+def ipfs_path(uri: str):
+    """Return ``<cid>/<path>`` for ipfs:// or gateway URLs, else ``None``."""
+    if not isinstance(uri, str):
+        return None
+    if uri.startswith("ipfs://"):
+        path = uri[len("ipfs://"):]
+        return path[len("ipfs/"):] if path.startswith("ipfs/") else path
+    if uri.startswith(("http://", "https://")) and "/ipfs/" in uri:
+        return uri.split("/ipfs/", 1)[1]
+    return None
+
+
+class MetadataFetcher:
+    """Resolve many tokenURIs concurrently with aiohttp.
+
+    IPFS URIs are raced across every configured gateway and the first valid
+    JSON response wins. Connection limits are enforced globally and per host,
+    and URIs pointing at the same CID share a single fetch.
+    """
+
+    def __init__(self, gateways, concurrency: int = 32, per_host: int = 8, timeout: float = 15):
+        self.gateways = [g if g.endswith('/') else g + '/' for g in gateways] or ['https://ipfs.io/ipfs/']
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get('IPFS_GATEWAYS') or ['https://ipfs.io/ipfs/'],
+            concurrency=config.get('METADATA_FETCH_CONCURRENCY', 32),
+            per_host=config.get('METADATA_FETCH_PER_HOST', 8),
+            timeout=config.get('METADATA_FETCH_TIMEOUT', 15),
+        )
+
+    def candidates(self, uri: str):
+        path = ipfs_path(uri)
+        if path is None:
+            return [uri]
+        return [gateway + path for gateway in self.gateways]
+
+    def fetch_all(self, uris) -> dict:
+        """Blocking wrapper around :meth:`fetch_all_async`."""
+        return asyncio.run(self.fetch_all_async(uris))
+
+    async def fetch_all_async(self, uris, session: 'aiohttp.ClientSession' = None) -> dict:
+        """Return ``{uri: metadata or None}`` for every URI in ``uris``."""
+        uris = list(dict.fromkeys(uris))
+        if not uris:
+            return {}
+        if session is None:
+            async with self.session() as session:
+                return await self._fetch_all(session, uris)
+        return await self._fetch_all(session, uris)
+
+    async def iter_completed_async(self, uris, session: 'aiohttp.ClientSession' = None):
+        """Yield ``(uri, metadata or None)`` for every URI in ``uris`` as soon as its fetch finishes."""
+        uris = list(dict.fromkeys(uris))
+        if not uris:
+            return
+        if session is None:
+            async with self.session() as session:
+                async for item in self._iter_completed(session, uris):
+                    yield item
+            return
+        async for item in self._iter_completed(session, uris):
+            yield item
+
+    def session(self) -> 'aiohttp.ClientSession':
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"accept": "application/json"},
+            trace_configs=[aiohttp_trace_config()],
+        )
+
+    async def _fetch_all(self, session, uris) -> dict:
+        inflight = {}
+        for uri in uris:
+            key = ipfs_path(uri) or uri
+            if key not in inflight:
+                inflight[key] = asyncio.ensure_future(self._race(session, self.candidates(uri)))
+        await asyncio.gather(*inflight.values())
+        return {uri: inflight[ipfs_path(uri) or uri].result() for uri in uris}
+
+    async def _iter_completed(self, session, uris):
+        groups = {}
+        for uri in uris:
+            groups.setdefault(ipfs_path(uri) or uri, []).append(uri)
+        tasks = {asyncio.ensure_future(self._race(session, self.candidates(group[0]))): group
+                 for group in groups.values()}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for uri in tasks[task]:
+                        yield uri, task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _race(self, session, urls):
+        pending = {asyncio.ensure_future(self._get_json(session, url)) for url in urls}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _get_json(self, session, url: str):
+        import aiohttp
+
+        try:
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    return None
+                data = await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
@@ -0,0 +1,363 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from flask import Response, before_render_template, g, request, template_rendered
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timings = contextvars.ContextVar('request_timings', default=None)
+_active = None
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _le(bound) -> str:
+    return f'le="{bound:g}"' if isinstance(bound, float) else f'le="{bound}"'
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, values)} {total:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_labels(self.labels, values, _le(bound))} {n}')
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, _le("+Inf"))} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.labels, values)} {total:g}')
+                lines.append(f'{self.name}_count{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class RequestTimings:
+    """Upstream calls and template rendering done on behalf of one Flask request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rpc = defaultdict(lambda: [0, 0.0])
+        self.http = defaultdict(lambda: [0, 0.0])
+        self.templates = [0, 0.0]
+        self._lock = threading.Lock()
+
+    def add(self, bucket: dict, key: str, seconds: float, count: int = 1):
+        with self._lock:
+            bucket[key][0] += count
+            bucket[key][1] += seconds
+
+    @staticmethod
+    def totals(bucket: dict) -> tuple:
+        return sum(c for c, _ in bucket.values()), sum(s for _, s in bucket.values())
+
+    def breakdown(self) -> str:
+        """One log line; concurrent calls overlap, so their summed time can exceed the request's."""
+        parts = []
+        for kind, bucket in (('rpc', self.rpc), ('http', self.http)):
+            if bucket:
+                count, seconds = self.totals(bucket)
+                top = sorted(bucket.items(), key=lambda item: -item[1][1])[:5]
+                detail = ', '.join(f'{key} {c}x {s * 1000:.0f}ms' for key, (c, s) in top)
+                parts.append(f'{kind} {count} calls {seconds * 1000:.0f}ms summed [{detail}]')
+        if self.templates[0]:
+            parts.append(f'templates {self.templates[1] * 1000:.0f}ms')
+        return '; '.join(parts) or 'no upstream calls'
+
+
+class Metrics:
+    """Per-request upstream timing, a slow-request log and a ``/metrics`` endpoint.
+
+    RPC calls are timed by a Web3 middleware installed below the call cache,
+    so only calls that reach the node count. Outbound HTTP is timed through
+    :func:`instrumented_session` for requests and :func:`aiohttp_trace_config`
+    for aiohttp. Histograms are kept per worker process.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_threshold = 1.0
+        self.functions = {}
+        self._pending_abis = []
+        self.requests = Histogram(
+            'http_request_duration_seconds', 'Flask request latency.', ('endpoint', 'method', 'status'))
+        self.rpc_latency = Histogram(
+            'rpc_request_duration_seconds', 'Upstream JSON-RPC request latency; batches count once.',
+            ('method', 'function'))
+        self.rpc_calls = Counter('rpc_calls_total', 'Upstream JSON-RPC calls, batched ones included.',
+                                 ('method', 'function'))
+        self.http_latency = Histogram(
+            'outbound_http_duration_seconds', 'Outbound HTTP latency to response headers.', ('host', 'status'))
+        self.template_latency = Histogram('template_render_seconds', 'Jinja template render time.', ('template',))
+        self.slow_requests = Counter('slow_requests_total', 'Requests slower than SLOW_REQUEST_THRESHOLD.',
+                                     ('endpoint',))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        global _active
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.slow_threshold = app.config.get('SLOW_REQUEST_THRESHOLD', self.slow_threshold)
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+        _active = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+        rpc = app.extensions.get('rpc')
+        if rpc is not None and rpc.urls:
+            from app.token_metadata import erc721_abi
+
+            self.register_functions(rpc.marketplace_abi or [])
+            self.register_functions(erc721_abi())
+            rpc.enable_metrics(self)
+
+    def register_functions(self, abi: list):
+        """Name eth_calls by function instead of by raw selector.
+
+        Selectors are computed on the first RPC call, not here, so that
+        registering at startup does not import the eth stack.
+        """
+        self._pending_abis.append(abi)
+
+    def resolve_functions(self):
+        from eth_utils import function_abi_to_4byte_selector, to_hex
+
+        pending, self._pending_abis = self._pending_abis, []
+        for abi in pending:
+            for item in abi:
+                if item.get('type') == 'function':
+                    self.functions[to_hex(function_abi_to_4byte_selector(item))] = item['name']
+
+    def function_name(self, method: str, params) -> str:
+        if method != 'eth_call' or not params or not isinstance(params[0], dict):
+            return ''
+        if self._pending_abis:
+            self.resolve_functions()
+        selector = str(params[0].get('data') or params[0].get('input') or '')[:10]
+        return self.functions.get(selector, selector)
+
+    def record_rpc(self, method: str, params, seconds: float):
+        function = self.function_name(method, params)
+        self.rpc_latency.observe(seconds, method, function)
+        self.rpc_calls.inc(method, function)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(timings.rpc, function or method, seconds)
+
+    def record_rpc_batch(self, requests_info, seconds: float):
+        self.rpc_latency.observe(seconds, 'batch', '')
+        names = defaultdict(int)
+        for method, params in requests_info:
+            function = self.function_name(method, params)
+            self.rpc_calls.inc(method, function)
+            names[function or method] += 1
+        timings = _timings.get()
+        if timings is not None:
+            share = seconds / max(len(requests_info), 1)
+            for name, count in names.items():
+                timings.add(timings.rpc, name, share * count, count)
+
+    def record_http(self, url: str, status, seconds: float):
+        host = urlsplit(str(url)).hostname or 'unknown'
+        self.http_latency.observe(seconds, host, status)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add(timings.http, host, seconds)
+
+    def export(self):
+        lines = []
+        for metric in (self.requests, self.rpc_latency, self.rpc_calls, self.http_latency,
+                       self.template_latency, self.slow_requests):
+            lines.extend(metric.render())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    def _before_request(self):
+        # Kept in ``g`` rather than the WSGI environ: a copied request context
+        # shares the environ but gets its own ``g`` on another thread.
+        g._metrics_token = (_timings.set(RequestTimings()), threading.get_ident())
+
+    def _after_request(self, response):
+        timings = _timings.get()
+        if timings is None:
+            return response
+        elapsed = time.perf_counter() - timings.started
+        endpoint = request.endpoint or 'unmatched'
+        self.requests.observe(elapsed, endpoint, request.method, response.status_code)
+
+        rpc_count, rpc_seconds = timings.totals(timings.rpc)
+        http_count, http_seconds = timings.totals(timings.http)
+        response.headers['Server-Timing'] = ', '.join((
+            f'rpc;dur={rpc_seconds * 1000:.1f};desc="{rpc_count} calls"',
+            f'http;dur={http_seconds * 1000:.1f};desc="{http_count} fetches"',
+            f'tpl;dur={timings.templates[1] * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ))
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            self.slow_requests.inc(endpoint)
+            logger.warning('Slow request %s %s took %.0fms: %s',
+                           request.method, request.full_path.rstrip('?'), elapsed * 1000, timings.breakdown())
+        return response
+
+    def _teardown_request(self, exc=None):
+        token, thread = g.get('_metrics_token', (None, None))
+        if token is None or thread != threading.get_ident():
+            return
+        g.pop('_metrics_token')
+        try:
+            _timings.reset(token)
+        except ValueError:
+            # Set in another context, e.g. a copied request context torn down first.
+            pass
+
+    def _before_render(self, sender, template, context, **extra):
+        context['_metrics_render_started'] = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        started = context.pop('_metrics_render_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        self.template_latency.observe(seconds, template.name or 'string')
+        timings = _timings.get()
+        if timings is not None:
+            timings.templates[0] += 1
+            timings.templates[1] += seconds
+
+
+def rpc_metrics_middleware(metrics: Metrics):
+    """Build a Web3 middleware class that times every request through ``metrics``."""
+    from web3.middleware import Web3Middleware
+
+    class RPCMetricsMiddleware(Web3Middleware):
+        def wrap_make_request(self, make_request):
+            def middleware(method, params):
+                started = time.perf_counter()
+                try:
+                    return make_request(method, params)
+                finally:
+                    metrics.record_rpc(method, params, time.perf_counter() - started)
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+            def middleware(requests_info):
+                started = time.perf_counter()
+                try:
+                    return make_batch_request(requests_info)
+                finally:
+                    metrics.record_rpc_batch(requests_info, time.perf_counter() - started)
+            return middleware
+
+        async def async_wrap_make_request(self, make_request):
+            async def middleware(method, params):
+                started = time.perf_counter()
+                try:
+                    return await make_request(method, params)
+                finally:
+                    metrics.record_rpc(method, params, time.perf_counter() - started)
+            return middleware
+
+        async def async_wrap_make_batch_request(self, make_batch_request):
+            async def middleware(requests_info):
+                started = time.perf_counter()
+                try:
+                    return await make_batch_request(requests_info)
+                finally:
+                    metrics.record_rpc_batch(requests_info, time.perf_counter() - started)
+            return middleware
+
+    return RPCMetricsMiddleware
+
+
+def _record_response(response, *args, **kwargs):
+    if _active is not None:
+        _active.record_http(response.url, response.status_code, response.elapsed.total_seconds())
+    return response
+
+
+def instrument_session(session: requests.Session) -> requests.Session:
+    """Time every response of ``session`` in the active :class:`Metrics`."""
+    session.hooks['response'].append(_record_response)
+    return session
+
+
+def instrumented_session() -> requests.Session:
+    return instrument_session(requests.Session())
+
+
+def aiohttp_trace_config() -> 'aiohttp.TraceConfig':
+    """An aiohttp trace config that times each request to its response headers."""
+    import aiohttp
+
+    async def on_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_end(session, context, params):
+        if _active is not None:
+            _active.record_http(params.url, params.response.status, time.perf_counter() - context.started)
+
+    async def on_exception(session, context, params):
+        if _active is not None:
+            _active.record_http(params.url, 'error', time.perf_counter() - context.started)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    return trace
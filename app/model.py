@@ -1,8 +1,46 @@
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 
 from app import db
 
+
+class Wei(db.TypeDecorator):
+    """Exact uint256 wei amount, stored so that SQL comparison and ORDER BY stay numeric.
+
+    PostgreSQL gets ``NUMERIC(78, 0)``. SQLite's NUMERIC silently turns
+    integers past 2**63 into REAL, so there the value is kept as a
+    zero-padded 78-digit string, which sorts the same as the number.
+    """
+    impl = db.String(78)
+    cache_ok = True
+    WIDTH = 78
+    LABEL = 'wei amounts'
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(db.Numeric(self.WIDTH, 0))
+        return dialect.type_descriptor(db.String(self.WIDTH))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = int(value)
+        if value < 0:
+            raise ValueError(f"{self.LABEL} cannot be negative")
+        return value if dialect.name == 'postgresql' else f'{value:0{self.WIDTH}d}'
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else int(value)
+
+
+class TokenId(Wei):
+    """ERC721 token id, a uint256 like wei amounts and stored the same way."""
+    cache_ok = True
+    LABEL = 'token ids'
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     wallet_address = db.Column(db.String(42), unique=True, nullable=False) 
@@ -11,18 +49,72 @@ class User(db.Model):
 
     def __repr__(self):
         return f'<User {self.wallet_address}>'
+
+    @staticmethod
+    def normalize_address(wallet_address: str) -> str:
+        return wallet_address.strip().lower()
+
+    @classmethod
+    def upsert(cls, wallet_address: str) -> int:
+        """Return the id of the user for ``wallet_address``, creating it if needed.
+
+        SQLite and PostgreSQL do this in one ``INSERT ... ON CONFLICT``
+        statement; the no-op update makes ``RETURNING`` yield existing rows too.
+        """
+        wallet_address = cls.normalize_address(wallet_address)
+        dialect = db.session.get_bind().dialect.name
+        insert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(dialect)
+        if insert is not None:
+            stmt = insert(cls).values(wallet_address=wallet_address, created_at=datetime.now(timezone.utc))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cls.wallet_address],
+                set_={'wallet_address': stmt.excluded.wallet_address},
+            ).returning(cls.id)
+            user_id = db.session.execute(stmt).scalar_one()
+            db.session.commit()
+            return user_id
+
+        user = cls.query.filter_by(wallet_address=wallet_address).first()
+        if user is None:
+            try:
+                user = cls(wallet_address=wallet_address)
+                db.session.add(user)
+                db.session.commit()
+            except IntegrityError:
+                # Lost the race to a concurrent login for the same wallet.
+                db.session.rollback()
+                user = cls.query.filter_by(wallet_address=wallet_address).one()
+        return user.id
     
 class NFT(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    token_id = db.Column(db.Integer, nullable=False)
+    token_id = db.Column(TokenId, nullable=False)
     contract_address = db.Column(db.String(42), nullable=False)
     name = db.Column(db.String(100))
     image_url = db.Column(db.String(255))
     description = db.Column(db.Text)
+    # Ether amounts for display; the *_wei columns are exact and used for filtering and ordering
     price = db.Column(db.Float, nullable=True)
+    price_wei = db.Column(Wei)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    symbol = db.Column(db.String(32))
+    token_uri = db.Column(db.Text)
+    listed = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    listed_block = db.Column(db.Integer)
+    best_offer = db.Column(db.Float)
+    best_offer_wei = db.Column(Wei)
+    offer_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     offers = db.relationship('Offer', backref='nft', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_nft_token', 'contract_address', 'token_id'),
+        db.Index('ix_nft_owner', 'owner_id'),
+        db.Index('ix_nft_collection_listed_price_wei', 'contract_address', 'listed', 'price_wei'),
+        db.Index('ix_nft_listed_price_wei', 'listed', 'price_wei'),
+        db.Index('ix_nft_listed_block', 'listed', 'listed_block'),
+        db.Index('ix_nft_collection_best_offer_wei', 'contract_address', 'best_offer_wei'),
+    )
+
     def __repr__(self):
         return f'<NFT {self.name} #{self.token_id}>'
 
@@ -31,8 +123,89 @@ class Offer(db.Model):
     nft_id = db.Column(db.Integer, db.ForeignKey('nft.id'), nullable=False)  # Note lowercase 'nft'
     buyer_wallet = db.Column(db.String(42), nullable=False)
     offer_price = db.Column(db.Float, nullable=False)
+    offer_price_wei = db.Column(Wei)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     status = db.Column(db.String(20), default='pending')
 
+    __table_args__ = (
+        db.Index('ix_offer_nft_status_price', 'nft_id', 'status', 'offer_price_wei'),
+        db.Index('ix_offer_buyer_status', 'buyer_wallet', 'status'),
+    )
+
+    def __repr__(self):
+        return f'<Offer for NFT {self.nft_id} at {self.offer_price}>'
+
+
+class ChainEvent(db.Model):
+    """Raw marketplace log, kept so indexed state can be rebuilt after a reorg."""
+    id = db.Column(db.Integer, primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    block_hash = db.Column(db.String(66), nullable=False)
+    log_index = db.Column(db.Integer, nullable=False)
+    tx_hash = db.Column(db.String(66), nullable=False)
+    name = db.Column(db.String(32), nullable=False)
+    contract_address = db.Column(db.String(42), nullable=False)
+    token_id = db.Column(TokenId, nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    block_timestamp = db.Column(db.Integer)
+    indexed_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('block_number', 'log_index'),
+        db.Index('ix_chain_event_token', 'contract_address', 'token_id'),
+    )
+
+    def __repr__(self):
+        return f'<ChainEvent {self.name} @{self.block_number}:{self.log_index}>'
+
+
+class QuarantinedEvent(db.Model):
+    """Marketplace log the indexer could not store or apply, kept aside so indexing can move past it."""
+    id = db.Column(db.Integer, primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    log_index = db.Column(db.Integer, nullable=False)
+    tx_hash = db.Column(db.String(66), nullable=False)
+    log = db.Column(db.Text, nullable=False)
+    error = db.Column(db.Text, nullable=False)
+    quarantined_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (db.UniqueConstraint('block_number', 'log_index'),)
+
+    def __repr__(self):
+        return f'<QuarantinedEvent @{self.block_number}:{self.log_index}>'
+
+
+class IndexerCheckpoint(db.Model):
+    name = db.Column(db.String(64), primary_key=True)
+    block_number = db.Column(db.Integer, nullable=False)
+    block_hash = db.Column(db.String(66))
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<IndexerCheckpoint {self.name} @{self.block_number}>'
+
+
+class CollectionStats(db.Model):
+    """Per-collection listing and offer aggregates in wei, maintained by the indexer."""
+    contract_address = db.Column(db.String(42), primary_key=True)
+    floor_price = db.Column(Wei)
+    ceiling_price = db.Column(Wei)
+    listing_count = db.Column(db.Integer, nullable=False, default=0)
+    best_offer = db.Column(Wei)
+    offer_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_block = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f'<CollectionStats {self.contract_address} floor={self.floor_price}>'
+
+
+class CollectionVolume(db.Model):
+    """Sale volume in wei per collection and UTC hour; the last 24 rows give the 24h volume."""
+    contract_address = db.Column(db.String(42), primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    volume = db.Column(Wei, nullable=False, default=0)
+    sales = db.Column(db.Integer, nullable=False, default=0)
+
     def __repr__(self):
-        return f'<Offer for NFT {self.nft_id} at {self.offer_price}>'
\ No newline at end of file
+        return f'<CollectionVolume {self.contract_address} @{self.hour}: {self.volume}>'
@@ -1,87 +1,113 @@
-import base64
-import json
-import os
-from flask import jsonify, render_template, current_app, request, session, url_for
+from flask import (
+    Response, jsonify, redirect, render_template, current_app, get_template_attribute, request, send_file, session,
+    stream_template, url_for,
+)
+from markupsafe import Markup
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from . import nfts
+from app import db, image_proxy, response_cache
+from app.chain import (
+    get_batch_reader, get_erc721_contract, get_listed_set, get_marketplace_contract, get_w3, paged_reads, read_listings,
+)
+from app.model import ChainEvent, NFT, Offer
+from app.owned_nfts import OwnedNFTCache, iter_owned_nfts, project_nft
+from app.rpc_batch import BatchCallError, batch_value
+from app.token_metadata import image_from_metadata, iter_token_metadata, load_token_metadata_many
 from urllib.parse import unquote
 import requests
-from web3 import Web3
-
-
-def _abi_path() -> str:
-    return os.path.join(current_app.root_path, 'static', 'contract-abi', 'NFTMarketplace.abi.json')
-
-
-def _get_w3() -> Web3:
-    rpc_url = current_app.config.get('MONAD_RPC_URL')
-    return Web3(Web3.HTTPProvider(rpc_url))
-
-
-def _get_marketplace_contract(w3: Web3 = None):
-    w3 = w3 or _get_w3()
-    marketplace_address = Web3.to_checksum_address(
-        current_app.config.get('NFT_MARKETPLACE_CONTRACT_ADDRESS')
-    )
-    with open(_abi_path()) as f:
-        marketplace_abi = json.load(f)
-    return w3.eth.contract(address=marketplace_address, abi=marketplace_abi)
-
-
-def _erc721_abi():
-    return [
-        {
-            "constant": True,
-            "inputs": [],
-            "name": "symbol",
-            "outputs": [{"name": "", "type": "string"}],
-            "type": "function",
-        },
-        {
-            "constant": True,
-            "inputs": [{"name": "tokenId", "type": "uint256"}],
-            "name": "tokenURI",
-            "outputs": [{"name": "", "type": "string"}],
-            "type": "function",
-        },
-        {
-            "constant": True,
-            "inputs": [{"name": "tokenId", "type": "uint256"}],
-            "name": "ownerOf",
-            "outputs": [{"name": "", "type": "address"}],
-            "type": "function",
-        },
-    ]
-
-
-def _normalize_ipfs(url: str) -> str:
-    if not isinstance(url, str):
-        return url
-    if url.startswith("ipfs://"):
-        return url.replace("ipfs://", "https://ipfs.io/ipfs/")
-    return url
-
-
-def _load_token_metadata(token_uri: str) -> dict:
-    token_uri = _normalize_ipfs(token_uri)
-    if not token_uri:
-        return {}
-    try:
-        if token_uri.startswith("data:"):
-            base64_data = token_uri.split(",", 1)[1]
-            decoded_json = base64.b64decode(base64_data).decode("utf-8")
-            return json.loads(decoded_json)
-        resp = requests.get(token_uri, timeout=15)
-        resp.raise_for_status()
-        return resp.json()
-    except Exception:
-        current_app.logger.exception("Failed to load token metadata from %s", token_uri)
-        return {}
 
 
 def _image_from_metadata(metadata: dict) -> str:
-    image_url = metadata.get("image") if isinstance(metadata, dict) else None
-    image_url = _normalize_ipfs(image_url) if image_url else None
-    return image_url or url_for('static', filename='images/dummy.png')
+    return image_from_metadata(metadata) or url_for('static', filename='images/dummy.png')
+
+
+def _read_from_index() -> bool:
+    return current_app.config.get('MARKETPLACE_READ_SOURCE') == 'index'
+
+
+def _owned_nft_cache() -> OwnedNFTCache:
+    cache = current_app.extensions.get('owned_nfts')
+    if cache is None:
+        cache = current_app.extensions.setdefault('owned_nfts', OwnedNFTCache(
+            maxsize=current_app.config.get('OWNED_NFTS_CACHE_SIZE', 512),
+            ttl=current_app.config.get('OWNED_NFTS_CACHE_TTL', 600),
+            log_range=current_app.config.get('OWNED_NFTS_LOG_RANGE', 100),
+            block_time=current_app.config.get('MONAD_BLOCK_TIME', 0.4),
+        ))
+    return cache
+
+
+def _listed_set(block_number: int) -> frozenset:
+    if _read_from_index():
+        rows = NFT.query.filter_by(listed=True).with_entities(NFT.contract_address, NFT.token_id)
+        return frozenset((addr.lower(), tid) for addr, tid in rows)
+    return get_listed_set(block_number)
+
+
+def _cache_key(name: str) -> str:
+    return f"{current_app.config.get('MARKETPLACE_READ_SOURCE', 'chain')}:{name}"
+
+
+def _cache_signal() -> int:
+    """Monotonic marker that moves whenever a marketplace event lands; newer marks cached pages stale."""
+    if _read_from_index():
+        return db.session.query(func.coalesce(func.max(ChainEvent.id), 0)).scalar()
+    return response_cache.signal.current()
+
+
+def _ether(wei):
+    """Ether amount as a string; page data is cached as JSON, which has no exact decimal type."""
+    from web3 import Web3
+
+    return None if wei is None else str(Web3.from_wei(wei, 'ether'))
+
+
+def _indexed_listings() -> list:
+    listings = NFT.query.options(joinedload(NFT.owner)).filter_by(listed=True) \
+        .order_by(NFT.listed_block.desc(), NFT.id.desc()).all()
+    return [{
+        "contract_address": nft.contract_address,
+        "token_id": nft.token_id,
+        "price": _ether(nft.price_wei),
+        "symbol": nft.symbol or "Unknown",
+        "image_url": nft.image_url or url_for('static', filename='images/dummy.png'),
+        "owner": nft.owner.wallet_address,
+    } for nft in listings]
+
+
+@nfts.app_template_filter('thumbnail')
+def thumbnail_filter(image_url):
+    """Route remote images through the local thumbnail proxy when it is enabled."""
+    key = image_proxy.register(image_url)
+    return url_for('nfts.image', key=key) if key else image_url
+
+
+@nfts.route('/image/<key>')
+def image(key):
+    found = image_proxy.lookup(key)
+    if found is None:
+        return jsonify({"error": "Unknown image"}), 404
+    source_url, sha256, failed = found
+    if sha256 is None:
+        # Not built yet (or the source could not be thumbnailed): don't let the browser cache this answer.
+        response = redirect(source_url if failed else url_for('static', filename='images/dummy.png'))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    # Only an explicit image/webp counts; every browser also sends */*.
+    fmt = 'webp' if any(mime == 'image/webp' and q > 0 for mime, q in request.accept_mimetypes) else 'jpeg'
+    response = send_file(
+        image_proxy.thumbnail_path(sha256, fmt),
+        mimetype='image/webp' if fmt == 'webp' else 'image/jpeg',
+        etag=f'{sha256}-{image_proxy.size}-{fmt}',
+        conditional=True,
+        max_age=31536000,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
 
 
 @nfts.route('/list', methods=['GET'])
@@ -96,42 +122,30 @@ def my_nfts():
     if not wallet_address:
         return jsonify({"error": "Wallet address is required"}), 400
 
-    params = {
-        "owner": wallet_address,
-        "withMetadata": "true",
-        "pageSize": 100
-    }
-    headers = {"accept": "application/json"}
-
     try:
-        response = requests.get(current_app.config.get('ALCHEMY_URL'), headers=headers, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-
-        owned_nfts = []
-        for nft in data.get("ownedNfts", []):
-            if nft["tokenType"] != "ERC721":
-                continue
-            owned_nfts.append({
-                "name": nft['contract']['name'],
-                "symbol": nft['contract']['symbol'],
-                "contract_address": nft['contract']['address'].lower(),
-                "image_url": nft.get('image', {}).get('thumbnailUrl') or url_for('static', filename='images/dummy.png'),
-                "token_id": nft['tokenId']
-            })
-
-        w3 = _get_w3()
-        marketplace_contract = _get_marketplace_contract(w3)
-        listed_nfts, listed_token_ids = marketplace_contract.functions.getAllListedNFTs().call()
-
-        listed_set = set(
-            (addr.lower(), tid)
-            for addr, tid in zip(listed_nfts, listed_token_ids)
-        )
-
-        for nft in owned_nfts:
-            key = (nft['contract_address'].lower(), int(nft['token_id']))
-            nft['listed'] = key in listed_set
+        w3 = get_w3()
+        head = w3.eth.block_number
+        cache = _owned_nft_cache()
+        owned_nfts = cache.get(w3, wallet_address, head)
+        if owned_nfts is None:
+            dummy = url_for('static', filename='images/dummy.png')
+            owned_nfts = []
+            for nft in iter_owned_nfts(
+                current_app.config.get('ALCHEMY_URL'),
+                wallet_address,
+                page_size=current_app.config.get('OWNED_NFTS_PAGE_SIZE', 100),
+                timeout=15,
+            ):
+                projected = project_nft(nft, dummy)
+                if projected is not None:
+                    owned_nfts.append(projected)
+            cache.set(wallet_address, head, owned_nfts)
+
+        listed_set = _listed_set(head)
+        owned_nfts = [
+            dict(nft, listed=(nft['contract_address'], int(nft['token_id'])) in listed_set)
+            for nft in owned_nfts
+        ]
 
         return render_template('my-nfts.html', nfts=owned_nfts)
 
@@ -146,79 +160,204 @@ def my_nfts():
 @nfts.route('/marketplace-data', methods=['GET'])
 def marketplace_data():
     try:
-        w3 = _get_w3()
-        marketplace_contract = _get_marketplace_contract(w3)
-        erc721_abi = _erc721_abi()
-        listed_nfts, listed_token_ids = marketplace_contract.functions.getAllListedNFTs().call()
+        build = _indexed_listings if _read_from_index() else _chain_listings
+        key, signal = _cache_key('marketplace'), _cache_signal()
+        if current_app.config.get('MARKETPLACE_STREAMING') and not _read_from_index():
+            found, results = response_cache.cached(key, build, signal)
+            owner = None if found else response_cache.acquire(key)
+            if owner is not None or (not found and response_cache.store is None):
+                # Only the build lock holder streams; other requests wait for the entry it stores.
+                response = Response(stream_template(
+                    'marketplace.html',
+                    cards=_stream_listing_cards(key, signal, owner is not None),
+                    current_wallet_address=session.get('wallet_address'),
+                ), headers={'X-Accel-Buffering': 'no'})
+                response.call_on_close(lambda: response_cache.release(key, owner))
+                return response
+            if not found:
+                results = response_cache.get_or_build(key, build, signal)
+        else:
+            results = response_cache.get_or_build(key, build, signal)
+        return render_template('marketplace.html', nfts=results, current_wallet_address=session.get('wallet_address'))
+
+    except Exception as e:
+        current_app.logger.exception("Unexpected error in marketplace_data")
+        return jsonify({"error": str(e)}), 500
 
-        results = []
-        for nft_address, token_id in zip(listed_nfts, listed_token_ids):
-            nft_address = Web3.to_checksum_address(nft_address)
-            nft_contract = w3.eth.contract(address=nft_address, abi=erc721_abi)
 
-            price_wei = marketplace_contract.functions.getPrice(nft_address, token_id).call()
+def _listing_rows(reader, marketplace_contract) -> list:
+    """Listed tokens as ``contract_address``/``token_id`` rows, with price and owner when paged reads provide them."""
+    from web3 import Web3
 
-            try:
-                symbol = nft_contract.functions.symbol().call()
-            except Exception:
-                symbol = "Unknown"
+    if paged_reads():
+        # Prices and owners arrive with the listing pages; only token metadata is read per listing.
+        return read_listings(reader)
+    block_number = reader.pin_block()
+    listed_nfts, listed_token_ids = marketplace_contract.functions.getAllListedNFTs().call(
+        block_identifier=block_number
+    )
+    return [
+        {'contract_address': Web3.to_checksum_address(nft_address), 'token_id': token_id}
+        for nft_address, token_id in zip(listed_nfts, listed_token_ids)
+    ]
 
-            try:
-                token_uri = nft_contract.functions.tokenURI(token_id).call()
-                metadata = _load_token_metadata(token_uri)
-                image_url = _image_from_metadata(metadata)
-            except Exception:
-                current_app.logger.exception("Error fetching metadata for token %s", token_id)
-                image_url = url_for('static', filename='images/dummy.png')
 
+def _resolve_listing_rows(reader, marketplace_contract, rows: list):
+    """Fill in ``price_wei``, ``owner``, ``symbol`` and ``token_uri`` for ``rows`` in one batched read."""
+    for row in rows:
+        nft_contract = get_erc721_contract(row['contract_address'])
+        if 'price_wei' not in row:
+            row['price_idx'] = reader.add(marketplace_contract, 'getPrice', row['contract_address'], row['token_id'])
+            row['owner_idx'] = reader.add(nft_contract, 'ownerOf', row['token_id'])
+        row['symbol_idx'] = reader.add(nft_contract, 'symbol')
+        row['uri_idx'] = reader.add(nft_contract, 'tokenURI', row['token_id'])
+    values = reader.execute()
+
+    for row in rows:
+        if 'price_idx' in row:
+            row['price_wei'] = batch_value(values, row.pop('price_idx'), None)
+            row['owner'] = batch_value(values, row.pop('owner_idx'), None)
+        row['symbol'] = batch_value(values, row.pop('symbol_idx'), "Unknown")
+        uri_idx = row.pop('uri_idx')
+        row['token_uri'] = batch_value(values, uri_idx, None)
+        if row['token_uri'] is None:
+            current_app.logger.error("Error fetching tokenURI for token %s: %s", row['token_id'], values[uri_idx])
+
+
+def _listing_result(row: dict, metadata: dict) -> dict:
+    price_wei = row['price_wei']
+    return {
+        "contract_address": row['contract_address'],
+        "token_id": row['token_id'],
+        "price": _ether(price_wei) if price_wei is not None else "Unknown",
+        "symbol": row['symbol'],
+        "image_url": _image_from_metadata(metadata),
+        "owner": row['owner'] or "Unknown"
+    }
+
+
+def _chain_listings() -> list:
+    w3 = get_w3()
+    marketplace_contract = get_marketplace_contract(w3)
+    reader = get_batch_reader(w3)
+    rows = _listing_rows(reader, marketplace_contract)
+    _resolve_listing_rows(reader, marketplace_contract, rows)
+    metadata = load_token_metadata_many(row['token_uri'] for row in rows if row['token_uri'])
+    return [_listing_result(row, metadata.get(row['token_uri']) or {}) for row in rows]
+
+
+def _stream_listing_cards(cache_key: str, signal: int, store: bool):
+    """Rendered marketplace cards, yielded as soon as each listing's data is ready.
+
+    Listings are resolved ``MARKETPLACE_STREAM_WINDOW`` at a time: one RPC
+    batch per window, then cards whose metadata is cached or inline come out
+    at once and the rest in the order their tokenURI fetches complete. Only
+    one window of rows and metadata is held at a time; the plain listing
+    data is only kept when ``store`` is set, to put in the response cache.
+    """
+    card = get_template_attribute('_macros.html', 'marketplace_nft_card')
+    wallet_address = session.get('wallet_address')
+    window = max(1, current_app.config.get('MARKETPLACE_STREAM_WINDOW', 100))
+    results = [] if store else None
+    try:
+        w3 = get_w3()
+        marketplace_contract = get_marketplace_contract(w3)
+        reader = get_batch_reader(w3)
+        rows = _listing_rows(reader, marketplace_contract)
+        for start in range(0, len(rows), window):
+            chunk = rows[start:start + window]
+            _resolve_listing_rows(reader, marketplace_contract, chunk)
+            by_uri = {}
+            for row in chunk:
+                if row['token_uri']:
+                    by_uri.setdefault(row['token_uri'], []).append(row)
+                else:
+                    yield card(_collect(results, _listing_result(row, {})), wallet_address)
+            fetched = iter_token_metadata(list(by_uri))
             try:
-                owner = nft_contract.functions.ownerOf(token_id).call()
-            except Exception:
-                owner = "Unknown"
-
-            results.append({
-                "contract_address": nft_address,
-                "token_id": token_id,
-                "price": w3.from_wei(price_wei, 'ether'),  
-                "symbol": symbol,
-                "image_url": image_url,
-                "owner": owner
-            })
+                for token_uri, metadata in fetched:
+                    for row in by_uri[token_uri]:
+                        yield card(_collect(results, _listing_result(row, metadata)), wallet_address)
+            finally:
+                fetched.close()
+    except Exception:
+        current_app.logger.exception("Streaming the marketplace failed")
+        yield Markup('<div class="alert alert-danger w-100">Some listings could not be loaded. Please refresh.</div>')
+        return
+    if results is not None:
+        response_cache.put(cache_key, results, signal)
 
-        return render_template('marketplace.html', nfts=results, current_wallet_address=session.get('wallet_address'))
 
-    except Exception as e:
-        current_app.logger.exception("Unexpected error in marketplace_data")
-        return jsonify({"error": str(e)}), 500
+def _collect(results, result: dict) -> dict:
+    if results is not None:
+        results.append(result)
+    return result
+
 
 @nfts.route('/view-proposals/<contract_address>/<token_id>')
 def view_proposals(contract_address, token_id):
-    w3 = _get_w3()
-    marketplace_contract = _get_marketplace_contract(w3)
+    from web3 import Web3
 
     contract_address = Web3.to_checksum_address(unquote(contract_address))
     token_id = int(unquote(token_id))
-    proposers, prices = marketplace_contract.functions.getProposalsForNFT(contract_address, token_id).call()
+    build = _indexed_proposals if _read_from_index() else _chain_proposals
+    data = response_cache.get_or_build(
+        _cache_key(f'offers:{contract_address}:{token_id}'),
+        lambda: build(contract_address, token_id),
+        _cache_signal(),
+    )
+
+    return render_template(
+        'view-proposals.html',
+        proposals=data['proposals'],
+        best_offer=data['best_offer'],
+        offer_count=data['offer_count'],
+        contract_address=contract_address,
+        token_id=token_id,
+        current_wallet_address=session.get('wallet_address'),
+        nft_owner_address=data['owner']
+    )
+
+
+def _chain_proposals(contract_address: str, token_id: int) -> dict:
+    # Both reads go out in one batch, pinned to the same block.
+    reader = get_batch_reader()
+    proposals_idx = reader.add(get_marketplace_contract(), 'getProposalsForNFT', contract_address, token_id)
+    owner_idx = reader.add(get_erc721_contract(contract_address), 'ownerOf', token_id)
+    values = reader.execute()
+    for value in values:
+        if isinstance(value, BatchCallError):
+            raise value
+    proposers, prices = values[proposals_idx]
 
     proposals = []
     for proposer, price in zip(proposers, prices):
         proposals.append({
             "proposer": proposer,
-            "price": Web3.from_wei(price, "ether")
+            "price": _ether(price)
         })
 
-    erc721_owner_abi = [a for a in _erc721_abi() if a["name"] == "ownerOf"]
-    nft_contract = w3.eth.contract(address=contract_address, abi=erc721_owner_abi)
-    nft_owner_address = nft_contract.functions.ownerOf(token_id).call()
+    return {
+        "proposals": proposals,
+        "owner": values[owner_idx],
+        "best_offer": _ether(max(prices)) if prices else None,
+        "offer_count": len(prices),
+    }
 
-    return render_template(
-        'view-proposals.html',
-        proposals=proposals,
-        contract_address=contract_address,
-        token_id=token_id,
-        current_wallet_address=session.get('wallet_address'),
-        nft_owner_address=nft_owner_address
-    )
+
+def _indexed_proposals(contract_address: str, token_id: int) -> dict:
+    """Pending offers plus the indexer's materialized best offer for the token."""
+    nft = NFT.query.options(joinedload(NFT.owner)) \
+        .filter_by(contract_address=contract_address, token_id=token_id).first()
+    if nft is None:
+        return {"proposals": [], "owner": None, "best_offer": None, "offer_count": 0}
+    offers = Offer.query.filter_by(nft_id=nft.id, status='pending').order_by(Offer.offer_price_wei.desc()).all()
+    return {
+        "proposals": [{"proposer": offer.buyer_wallet, "price": _ether(offer.offer_price_wei)} for offer in offers],
+        "owner": nft.owner.wallet_address,
+        "best_offer": _ether(nft.best_offer_wei),
+        "offer_count": nft.offer_count or 0,
+    }
 
 
 @nfts.route('/make_offer/<contract_address>/<token_id>')
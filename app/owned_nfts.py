@@ -0,0 +1,156 @@
+import codecs
+import json
+import math
+import re
+import time
+
+from app.metadata_cache import LRUCache
+from app.metrics import instrumented_session
+
+# keccak('Transfer(address,address,uint256)'), spelled out so importing this module does not load web3.
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+_decoder = json.JSONDecoder()
+_session = instrumented_session()
+
+
+def stream_array(chunks, key: str):
+    """Yield the elements of the top-level array ``key`` while the body downloads.
+
+    ``chunks`` is an iterable of bytes (e.g. ``response.iter_content()``). The
+    generator's return value is the rest of the document with ``key`` set to
+    an empty list, so callers can still read fields such as ``pageKey``.
+    """
+    marker = re.compile(r'(?<!\\)"%s"\s*:\s*\[' % re.escape(key))
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    head = None
+    closed = False
+    buf = ''
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        if head is None:
+            match = marker.search(buf)
+            if match is None:
+                continue
+            head, buf = buf[:match.end()], buf[match.end():]
+        if closed:
+            continue
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if buf[pos] == ']':
+                closed = True
+                break
+            try:
+                item, pos = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buf = buf[pos:]
+    buf += utf8.decode(b'', final=True)
+
+    if head is None:
+        document = json.loads(buf)
+        yield from document.get(key) or []
+        document[key] = []
+        return document
+    if not closed:
+        raise ValueError(f"Truncated JSON response while reading '{key}'")
+    return json.loads(head + buf)
+
+
+def iter_owned_nfts(url: str, owner: str, page_size: int = 100, timeout: float = 15, session=None):
+    """Yield every ``ownedNfts`` entry for ``owner``, following ``pageKey``.
+
+    Each page is streamed and parsed as it arrives, so only one NFT's raw
+    JSON is held in memory at a time.
+    """
+    http = session or _session
+    page_key = None
+    while True:
+        params = {"owner": owner, "withMetadata": "true", "pageSize": page_size}
+        if page_key:
+            params["pageKey"] = page_key
+        with http.get(url, headers={"accept": "application/json"}, params=params,
+                      timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            page = yield from stream_array(response.iter_content(chunk_size=65536), "ownedNfts")
+        page_key = page.get("pageKey")
+        if not page_key:
+            return
+
+
+def project_nft(nft: dict, dummy_image: str):
+    """The fields my-nfts.html needs from an Alchemy NFT, or ``None`` for non-ERC721 tokens."""
+    if nft.get("tokenType") != "ERC721":
+        return None
+    contract = nft.get("contract") or {}
+    return {
+        "name": contract.get("name"),
+        "symbol": contract.get("symbol"),
+        "contract_address": contract["address"].lower(),
+        "image_url": (nft.get("image") or {}).get("thumbnailUrl") or dummy_image,
+        "token_id": nft["tokenId"],
+    }
+
+
+def _wallet_topic(wallet: str) -> str:
+    return '0x' + '0' * 24 + wallet.lower().removeprefix('0x')
+
+
+def has_transfers(w3: 'Web3', wallet: str, from_block: int, to_block: int, max_range: int = 100) -> bool:
+    """Whether any ERC721 Transfer to or from ``wallet`` happened in the block range.
+
+    Providers cap the range of one eth_getLogs call, so the range is read
+    in spans of at most ``max_range`` blocks, all in one JSON-RPC batch.
+    """
+    topic = _wallet_topic(wallet)
+    filters = []
+    for start in range(from_block, to_block + 1, max_range):
+        end = min(start + max_range - 1, to_block)
+        for topics in ([TRANSFER_TOPIC, topic], [TRANSFER_TOPIC, None, topic]):
+            filters.append({'fromBlock': start, 'toBlock': end, 'topics': topics})
+    if len(filters) == 2:
+        results = [w3.eth.get_logs(f) for f in filters]
+    else:
+        with w3.batch_requests() as batch:
+            for f in filters:
+                batch.add(w3.eth.get_logs(f))
+            results = batch.execute()
+    # ERC20 Transfer shares the signature but has no indexed token id.
+    return any(len(log['topics']) == 4 for logs in results for log in logs)
+
+
+class OwnedNFTCache:
+    """Per-wallet projected NFT lists, kept until the wallet has Transfer activity.
+
+    Each entry remembers the block it was last verified at. A hit scans only
+    the blocks since then for Transfers touching the wallet, ``log_range``
+    blocks per eth_getLogs call. A gap of more than ``ttl`` seconds' worth
+    of ``block_time`` blocks means the entry outlived its TTL, so it is
+    treated as stale rather than scanned.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600, log_range: int = 100, block_time: float = 0.4):
+        self.memory = LRUCache(maxsize)
+        self.ttl = ttl
+        self.log_range = log_range
+        self.max_gap = math.ceil(ttl / block_time)
+
+    def get(self, w3: 'Web3', wallet: str, head: int):
+        key = wallet.lower()
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        expires_at, (block, nfts) = entry
+        if head > block:
+            if head - block > self.max_gap or has_transfers(w3, wallet, block + 1, head, self.log_range):
+                return None
+            self.memory.set(key, (head, nfts), expires_at)
+        return nfts
+
+    def set(self, wallet: str, head: int, nfts: list):
+        self.memory.set(wallet.lower(), (head, nfts), time.time() + self.ttl)
@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import copy_current_request_context
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseStore:
+    """SQLite-backed entries and build locks shared by every worker on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, signal INTEGER, created_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_lock ("
+            " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_signal ("
+            " name TEXT PRIMARY KEY, value INTEGER NOT NULL, checked_block INTEGER, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Return ``(value, signal, created_at)`` or ``None``."""
+        row = self._conn().execute(
+            "SELECT value, signal, created_at FROM response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key: str, value, signal: int):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, signal, created_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), signal, time.time()),
+        )
+
+    def acquire(self, key: str, ttl: float):
+        """Take the build lock for ``key``; return an owner token, or ``None`` if it is held."""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM response_lock WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO response_lock (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, owner, now + ttl),
+        )
+        return owner if cursor.rowcount == 1 else None
+
+    def release(self, key: str, owner: str):
+        self._conn().execute("DELETE FROM response_lock WHERE key = ? AND owner = ?", (key, owner))
+
+    def locked(self, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM response_lock WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def get_signal(self, name: str):
+        """Return ``(value, checked_block)`` or ``None``."""
+        return self._conn().execute(
+            "SELECT value, checked_block FROM response_signal WHERE name = ?", (name,)
+        ).fetchone()
+
+    def set_signal(self, name: str, value: int, checked_block: int):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO response_signal (name, value, checked_block, updated_at) VALUES (?, ?, ?, ?)",
+            (name, value, checked_block, time.time()),
+        )
+
+
+class MarketplaceEventSignal:
+    """Block number of the newest marketplace log, shared by every worker through the response store.
+
+    Requests only read the stored value. A daemon thread in each process
+    advances it every ``interval`` seconds; whichever worker holds the
+    store's ``signal`` lock scans the blocks since the last check. If more
+    than ``log_range`` blocks have passed, the head itself is stored, which
+    conservatively invalidates everything built before it.
+    """
+
+    NAME = 'marketplace'
+
+    def __init__(self, store=None, client=None, log_range: int = 100, interval: float = 1.0):
+        self.store = store
+        self.client = client
+        self.log_range = log_range
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        if self.store is None or self.client is None:
+            return 0
+        self._ensure_refresher()
+        try:
+            row = self.store.get_signal(self.NAME)
+        except sqlite3.Error:
+            logger.exception("Response cache signal read failed")
+            return 0
+        return row[0] if row else 0
+
+    def refresh(self):
+        """Scan the blocks since the last check, unless another worker is already doing it."""
+        lock = f'signal:{self.NAME}'
+        owner = self.store.acquire(lock, max(30.0, self.interval * 10))
+        if owner is None:
+            return
+        try:
+            w3 = self.client.get_w3()
+            head = w3.eth.block_number
+            latest, checked_block = self.store.get_signal(self.NAME) or (0, None)
+            if checked_block is not None and head <= checked_block:
+                return
+            start = head - self.log_range if checked_block is None else checked_block + 1
+            if checked_block is not None and head - start >= self.log_range:
+                latest = head
+            else:
+                logs = w3.eth.get_logs({
+                    'address': self.client.get_marketplace().address, 'fromBlock': max(start, 0), 'toBlock': head,
+                })
+                if logs:
+                    latest = max(latest, max(log['blockNumber'] for log in logs))
+            self.store.set_signal(self.NAME, latest, head)
+        finally:
+            self.store.release(lock, owner)
+
+    def _ensure_refresher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='response-cache-signal', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Refreshing the response cache signal failed")
+            time.sleep(self.interval)
+
+
+class ResponseCache:
+    """Stale-while-revalidate cache for the data behind the marketplace pages.
+
+    An entry is fresh for ``fresh_ttl`` seconds, as long as no marketplace
+    event newer than the one it was built after has been seen (the
+    ``signal``). A stale entry is still served for up to ``max_stale``
+    seconds while one request, holding the SQLite build lock, rebuilds it in
+    a background thread. Without a usable entry, the lock holder builds in
+    the foreground and every other request waits for its result instead of
+    repeating the RPC and metadata work.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, app=None):
+        self.store = None
+        self.fresh_ttl = 5
+        self.max_stale = 300
+        self.lock_ttl = 30
+        self.signal = MarketplaceEventSignal()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.fresh_ttl = app.config.get('RESPONSE_CACHE_TTL', self.fresh_ttl)
+        self.max_stale = app.config.get('RESPONSE_CACHE_MAX_STALE', self.max_stale)
+        self.lock_ttl = app.config.get('RESPONSE_CACHE_LOCK_TTL', self.lock_ttl)
+        path = app.config.get('RESPONSE_CACHE_PATH')
+        self.store = None
+        if path and self.fresh_ttl > 0:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.store = ResponseStore(path)
+        self.signal = MarketplaceEventSignal(
+            self.store, app.extensions.get('rpc'),
+            log_range=app.config.get('RESPONSE_CACHE_LOG_RANGE', 100),
+            interval=app.config.get('RESPONSE_CACHE_SIGNAL_INTERVAL', 1.0),
+        )
+        app.extensions['response_cache'] = self
+
+    def cached(self, key: str, build, signal: int = 0) -> tuple:
+        """``(found, data)`` for what :meth:`get_or_build` would serve without building in the foreground.
+
+        A stale but servable entry is returned and rebuilt in the background
+        with ``build``, as in :meth:`get_or_build`.
+        """
+        if self.store is None:
+            return False, None
+        try:
+            entry = self.store.get(key)
+        except sqlite3.Error:
+            logger.exception("Response cache read failed")
+            return False, None
+        if entry is None:
+            return False, None
+        value, built_signal, created_at = entry
+        age = time.time() - created_at
+        if age < self.fresh_ttl and (built_signal or 0) >= signal:
+            return True, value
+        if age < self.max_stale:
+            self._refresh_in_background(key, build, signal)
+            return True, value
+        return False, None
+
+    def acquire(self, key: str):
+        """Take the build lock for a build done outside :meth:`get_or_build`; ``None`` if it is held.
+
+        Also ``None`` when the cache is disabled, as there is nothing to share.
+        """
+        if self.store is None:
+            return None
+        return self.store.acquire(key, self.lock_ttl)
+
+    def release(self, key: str, owner: str):
+        if self.store is not None and owner is not None:
+            self.store.release(key, owner)
+
+    def put(self, key: str, value, signal: int = 0):
+        """Store data built outside :meth:`get_or_build`, e.g. while streaming it."""
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value, signal)
+        except sqlite3.Error:
+            logger.exception("Response cache write failed")
+
+    def get_or_build(self, key: str, build, signal: int = 0):
+        """Return cached data for ``key``, calling ``build()`` when it must be rebuilt.
+
+        ``build`` must return plain JSON data (prices as strings, not
+        ``Decimal``), so a cached entry renders exactly like a fresh one.
+        """
+        if self.store is None:
+            return build()
+        try:
+            entry = self.store.get(key)
+        except sqlite3.Error:
+            logger.exception("Response cache read failed")
+            return build()
+
+        if entry is not None:
+            value, built_signal, created_at = entry
+            age = time.time() - created_at
+            if age < self.fresh_ttl and (built_signal or 0) >= signal:
+                return value
+            if age < self.max_stale:
+                self._refresh_in_background(key, build, signal)
+                return value
+
+        owner = self.store.acquire(key, self.lock_ttl)
+        if owner is None:
+            waited = self._wait_for(key, entry[2] if entry else 0)
+            if waited is not None:
+                return waited
+            owner = self.store.acquire(key, self.lock_ttl)
+        try:
+            value = build()
+            self.store.set(key, value, signal)
+            return value
+        finally:
+            if owner is not None:
+                self.store.release(key, owner)
+
+    def _refresh_in_background(self, key: str, build, signal: int):
+        owner = self.store.acquire(key, self.lock_ttl)
+        if owner is None:
+            return
+
+        @copy_current_request_context
+        def refresh():
+            try:
+                self.store.set(key, build(), signal)
+            except Exception:
+                logger.exception("Background refresh of %s failed", key)
+            finally:
+                self.store.release(key, owner)
+
+        threading.Thread(target=refresh, name='response-cache-refresh', daemon=True).start()
+
+    def _wait_for(self, key: str, older_than: float):
+        """Wait for another worker's build of ``key``; ``None`` if it never lands."""
+        deadline = time.time() + self.lock_ttl
+        while time.time() < deadline:
+            time.sleep(self.POLL_INTERVAL)
+            entry = self.store.get(key)
+            if entry is not None and entry[2] > older_than:
+                return entry[0]
+            if not self.store.locked(key):
+                return None
+        return None
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+
+from app.call_cache import EthCallCache, call_cache_middleware
+from app.metrics import rpc_metrics_middleware
+
+
+class RPCClient:
+    """Process-wide Web3 client, marketplace ABI and contract objects.
+
+    Flask apps register it with ``init_app``; standalone scripts call
+    ``configure`` directly. The ABI is parsed and contract objects are built
+    once per process instead of on every request. The client itself, and
+    with it web3, is only created on first use (or by :meth:`build`), so
+    starting a worker does not pay for importing the eth stack.
+    """
+
+    def __init__(self, app=None):
+        self.w3 = None
+        self.urls = []
+        self.marketplace_address = None
+        self.marketplace_abi = None
+        self.marketplace = None
+        self.call_cache = None
+        self.health_interval = 0
+        self._settings = {}
+        self._middleware = []
+        self._erc721 = {}
+        self._erc721_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._health_thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        urls = app.config.get('MONAD_RPC_URLS') or [app.config.get('MONAD_RPC_URL')]
+        self.configure(
+            [url for url in urls if url],
+            marketplace_address=app.config.get('NFT_MARKETPLACE_CONTRACT_ADDRESS'),
+            abi_path=os.path.join(app.root_path, 'static', 'contract-abi', 'NFTMarketplace.abi.json'),
+            timeout=app.config.get('RPC_TIMEOUT', 15),
+            pool_size=app.config.get('RPC_POOL_SIZE', 32),
+            hedge_delay=app.config.get('RPC_HEDGE_DELAY'),
+            health_interval=app.config.get('RPC_HEALTH_INTERVAL', 0),
+        )
+        if self.urls and app.config.get('RPC_CALL_CACHE', True):
+            self.enable_call_cache(EthCallCache(
+                immutable_signatures=app.config.get('RPC_IMMUTABLE_CALLS', ('symbol()', 'name()', 'decimals()')),
+                head_ttl=app.config.get('RPC_HEAD_TTL', 1.0),
+            ))
+        app.extensions['rpc'] = self
+
+    def configure(self, urls, marketplace_address=None, abi_path=None, timeout: float = 15,
+                  pool_size: int = 32, hedge_delay: float = None, health_interval: float = 0):
+        self.w3 = None
+        self.marketplace = None
+        self.call_cache = None
+        self._middleware = []
+        self._erc721 = {}
+        self.urls = list(urls)
+        self.marketplace_address = marketplace_address
+        self.health_interval = health_interval
+        self._settings = {'timeout': timeout, 'pool_size': pool_size, 'hedge_delay': hedge_delay}
+        if abi_path and os.path.exists(abi_path):
+            with open(abi_path) as f:
+                self.marketplace_abi = json.load(f)
+        return self
+
+    def enable_call_cache(self, cache: EthCallCache):
+        """Install the block-aware eth_call cache as the innermost Web3 middleware."""
+        self.call_cache = cache
+        self._add_middleware('eth_call_cache', lambda: call_cache_middleware(cache))
+
+    def enable_metrics(self, metrics):
+        """Time every upstream RPC request; installed innermost, so call-cache hits are not counted."""
+        self._add_middleware('rpc_metrics', lambda: rpc_metrics_middleware(metrics))
+
+    def build(self):
+        """Create the Web3 client and marketplace contract now rather than on first use.
+
+        Opens no connections and starts no threads, so it is safe to call
+        before the server forks its workers.
+        """
+        if self.w3 is not None:
+            return self.w3
+        if not self.urls:
+            raise RuntimeError('No RPC URL configured (set MONAD_RPC_URL or MONAD_RPC_URLS)')
+        with self._build_lock:
+            if self.w3 is None:
+                from web3 import Web3
+                from app.rpc_provider import FailoverHTTPProvider
+
+                w3 = Web3(FailoverHTTPProvider(self.urls, **self._settings))
+                for name, middleware in self._middleware:
+                    w3.middleware_onion.inject(middleware(), name=name, layer=0)
+                if self.marketplace_address and self.marketplace_abi is not None:
+                    self.marketplace = w3.eth.contract(
+                        address=Web3.to_checksum_address(self.marketplace_address),
+                        abi=self.marketplace_abi,
+                    )
+                self.w3 = w3
+        return self.w3
+
+    def get_w3(self):
+        self.build()
+        self._ensure_health_thread()
+        return self.w3
+
+    def get_marketplace(self):
+        if self.urls:
+            self.build()
+        if self.marketplace is None:
+            raise RuntimeError('Marketplace contract is not configured (set NFT_MARKETPLACE_CONTRACT_ADDRESS)')
+        self._ensure_health_thread()
+        return self.marketplace
+
+    def erc721(self, address: str, abi: list):
+        """Return a cached contract object for an ERC721 collection."""
+        from web3 import Web3
+
+        address = Web3.to_checksum_address(address)
+        contract = self._erc721.get(address)
+        if contract is None:
+            with self._erc721_lock:
+                contract = self._erc721.setdefault(address, self.get_w3().eth.contract(address=address, abi=abi))
+        return contract
+
+    def _add_middleware(self, name: str, middleware):
+        # Injected when the client is built; layer 0 each time, so the last one added is innermost.
+        self._middleware.append((name, middleware))
+        if self.w3 is not None:
+            self.w3.middleware_onion.inject(middleware(), name=name, layer=0)
+
+    def _ensure_health_thread(self):
+        # Started lazily so each forked worker runs its own checker.
+        if not self.health_interval or len(self.w3.provider.endpoints) < 2:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name='rpc-health', daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            self.w3.provider.check_health()
+            time.sleep(self.health_interval)
+
+
+def client_from_env(marketplace_address: str = None, abi_path: str = None, default_url: str = None) -> RPCClient:
+    """Build an ``RPCClient`` for standalone scripts from the same env vars the app uses."""
+    urls = os.environ.get('MONAD_RPC_URLS') or os.environ.get('MONAD_RPC_URL') \
+        or os.environ.get('MONAD_RPC') or default_url or ''
+    return RPCClient().configure(
+        [u.strip() for u in urls.split(',') if u.strip()],
+        marketplace_address=marketplace_address,
+        abi_path=abi_path,
+        timeout=float(os.environ.get('RPC_TIMEOUT', 15)),
+        hedge_delay=float(os.environ.get('RPC_HEDGE_DELAY', 0)),
+    )
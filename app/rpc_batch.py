@@ -0,0 +1,143 @@
+# (contract address, function name) -> (selector hex, input types, output types)
+_functions = {}
+
+
+# web3's default middleware validates and formats user-supplied requests. Batched
+# eth_calls are built here already encoded, so they only go through the rest
+# (call cache, metrics); validation alone costs more than the HTTP round trips.
+SKIPPED_MIDDLEWARE = ('gas_price_strategy', 'ens_name_to_address', 'attrdict', 'validation', 'gas_estimate')
+
+
+class RawOnion:
+    """A middleware onion without :data:`SKIPPED_MIDDLEWARE`, for ``provider.batch_request_func``."""
+
+    def __init__(self, onion):
+        self._middleware = tuple(mw for mw, name in onion.middleware if name not in SKIPPED_MIDDLEWARE)
+
+    def as_tuple_of_middleware(self) -> tuple:
+        return self._middleware
+
+
+def _function_info(contract, fn_name: str) -> tuple:
+    key = (contract.address, fn_name)
+    info = _functions.get(key)
+    if info is None:
+        from eth_utils.abi import function_abi_to_4byte_selector, get_abi_input_types, get_abi_output_types
+
+        abi = contract.get_function_by_name(fn_name).abi
+        info = _functions[key] = (
+            '0x' + function_abi_to_4byte_selector(abi).hex(), get_abi_input_types(abi), get_abi_output_types(abi)
+        )
+    return info
+
+
+class BatchCallError(Exception):
+    """A single batched eth_call failed; returned in place of its result.
+
+    ``reverted`` marks calls the node executed and that failed at the block
+    (a revert or an empty return), which give the same answer every time;
+    anything else is a transport or node error worth retrying.
+    """
+
+    def __init__(self, message: str = '', reverted: bool = False):
+        super().__init__(message)
+        self.reverted = reverted
+
+
+class BatchReader:
+    """Collect contract view calls and resolve them in JSON-RPC batches.
+
+    Every call is pinned to the same block so a page built from the results
+    reflects one consistent chain state. Identical calls (same target and
+    calldata) are only sent once.
+    """
+
+    def __init__(self, w3: 'Web3', block_identifier=None, batch_size: int = 100):
+        self.w3 = w3
+        self.block_identifier = block_identifier
+        self.batch_size = max(1, int(batch_size))
+        self._calls = []
+        self._index = {}
+
+    def pin_block(self) -> int:
+        if not isinstance(self.block_identifier, int):
+            self.block_identifier = self.w3.eth.block_number
+        return self.block_identifier
+
+    def add(self, contract, fn_name: str, *args) -> int:
+        """Queue ``contract.fn_name(*args)`` and return the index of its result."""
+        # Encoded with eth_abi directly: contract.encode_abi re-resolves the ABI on every call.
+        from eth_abi import encode
+
+        selector, input_types, output_types = _function_info(contract, fn_name)
+        data = selector + encode(input_types, args).hex()
+        key = (contract.address, data)
+        if key in self._index:
+            return self._index[key]
+        self._calls.append((contract.address, data, output_types))
+        self._index[key] = len(self._calls) - 1
+        return self._index[key]
+
+    def execute(self) -> list:
+        """Run all queued calls; failed calls yield a ``BatchCallError`` instance."""
+        block = hex(self.pin_block())
+        results = []
+        for start in range(0, len(self._calls), self.batch_size):
+            chunk = self._calls[start:start + self.batch_size]
+            results.extend(self._execute_chunk(chunk, block))
+        self._calls = []
+        self._index = {}
+        return results
+
+    def _execute_chunk(self, chunk, block: str) -> list:
+        batch = [("eth_call", [{"to": to, "data": data}, block]) for to, data, _ in chunk]
+        try:
+            # Go through the middleware stack so call caching/instrumentation applies.
+            send_batch = self.w3.provider.batch_request_func(self.w3, RawOnion(self.w3.middleware_onion))
+            responses = send_batch(batch)
+        except Exception as e:
+            return [BatchCallError(str(e)) for _ in chunk]
+
+        if not isinstance(responses, list):
+            # Endpoint rejected the batch as a whole; fall back to single calls.
+            return [self._call_one(to, data, output_types, block) for to, data, output_types in chunk]
+
+        return [self._decode(output_types, response) for (_, _, output_types), response in zip(chunk, responses)]
+
+    def _call_one(self, to: str, data: str, output_types, block: str):
+        from web3.exceptions import ContractLogicError
+
+        try:
+            raw = self.w3.eth.call({"to": to, "data": data}, block_identifier=int(block, 16))
+        except ContractLogicError as e:
+            return BatchCallError(str(e), reverted=True)
+        except Exception as e:
+            return BatchCallError(str(e))
+        return self._decode(output_types, {"result": raw})
+
+    def _decode(self, output_types, response):
+        error = response.get("error")
+        if error:
+            return BatchCallError(str(error), reverted=_is_revert(error))
+        if response.get("result") in (None, "0x"):
+            return BatchCallError("empty result", reverted=response.get("result") == "0x")
+        from hexbytes import HexBytes
+
+        try:
+            values = self.w3.codec.decode(output_types, HexBytes(response["result"]))
+        except Exception as e:
+            return BatchCallError(str(e))
+        return values[0] if len(values) == 1 else values
+
+
+def _is_revert(error) -> bool:
+    # Geth-style nodes report reverts as code 3; others only say so in the message.
+    if not isinstance(error, dict):
+        return False
+    return error.get("code") == 3 or 'revert' in str(error.get("message", "")).lower()
+
+
+def batch_value(values: list, index: int, default):
+    """Return ``values[index]`` unless that batched call failed."""
+    value = values[index]
+    return default if isinstance(value, BatchCallError) else value
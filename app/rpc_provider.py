@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to send to two endpoints at once.
+READ_METHODS = frozenset({
+    'eth_blockNumber',
+    'eth_call',
+    'eth_chainId',
+    'eth_estimateGas',
+    'eth_gasPrice',
+    'eth_getBalance',
+    'eth_getBlockByNumber',
+    'eth_getCode',
+    'eth_getLogs',
+    'eth_getTransactionCount',
+    'eth_getTransactionReceipt',
+    'net_version',
+    'web3_clientVersion',
+})
+
+
+class RPCEndpoint:
+    """One upstream RPC URL with its own keep-alive pool and health stats."""
+
+    def __init__(self, url: str, pool_size: int = 32):
+        self.url = url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.latency = None
+        self.failures = 0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def record_success(self, elapsed: float):
+        with self._lock:
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            self.failures = 0
+            self.down_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.down_until = time.monotonic() + min(60, 2 ** self.failures)
+
+    def __repr__(self):
+        return f'<RPCEndpoint {self.url} latency={self.latency} failures={self.failures}>'
+
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    """JSON-RPC over HTTP across several endpoints.
+
+    Requests go to the healthy endpoint with the lowest smoothed latency and
+    fail over to the next one on connection errors, timeouts or HTTP errors.
+    Endpoints that fail are skipped for an exponential cool-down. When
+    ``hedge_delay`` is set, read-only requests still pending after that many
+    seconds are also sent to the next endpoint and the first answer wins.
+    """
+
+    def __init__(self, urls, timeout: float = 15, pool_size: int = 32, hedge_delay: float = None):
+        super().__init__()
+        if not urls:
+            raise ValueError('At least one RPC URL is required')
+        self.endpoints = [RPCEndpoint(url, pool_size) for url in urls]
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay or None
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='rpc-hedge')
+
+    @property
+    def endpoint_uri(self) -> str:
+        return self.ranked()[0].url
+
+    def ranked(self) -> list:
+        healthy = [e for e in self.endpoints if e.healthy]
+        down = [e for e in self.endpoints if not e.healthy]
+        healthy.sort(key=lambda e: e.latency if e.latency is not None else 0.0)
+        down.sort(key=lambda e: e.down_until)
+        return healthy + down
+
+    def make_request(self, method, params):
+        payload = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(self._send(payload, method in READ_METHODS))
+
+    def make_batch_request(self, batch_requests):
+        payload = self.encode_batch_rpc_request(batch_requests)
+        hedgeable = all(method in READ_METHODS for method, _ in batch_requests)
+        response = self.decode_rpc_response(self._send(payload, hedgeable))
+        if isinstance(response, list):
+            response.sort(key=lambda r: r.get('id') or 0)
+        return response
+
+    def check_health(self):
+        """Probe every endpoint with eth_blockNumber to refresh latency and health."""
+        payload = self.encode_rpc_request('eth_blockNumber', [])
+        for endpoint in self.endpoints:
+            try:
+                self._post(endpoint, payload)
+            except Exception:
+                logger.warning('RPC endpoint %s failed health check', endpoint.url)
+
+    def _send(self, payload: bytes, hedgeable: bool) -> bytes:
+        endpoints = self.ranked()
+        if hedgeable and self.hedge_delay and len(endpoints) > 1:
+            try:
+                return self._hedged(payload, endpoints[0], endpoints[1])
+            except Exception:
+                endpoints = endpoints[2:]
+                if not endpoints:
+                    raise
+        error = None
+        for endpoint in endpoints:
+            try:
+                return self._post(endpoint, payload)
+            except Exception as e:
+                error = e
+                logger.warning('RPC endpoint %s failed: %s', endpoint.url, e)
+        raise error
+
+    def _hedged(self, payload: bytes, primary, backup) -> bytes:
+        futures = [self._executor.submit(self._post, primary, payload)]
+        done, _ = wait(futures, timeout=self.hedge_delay)
+        if not done or futures[0].exception() is not None:
+            futures.append(self._executor.submit(self._post, backup, payload))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _post(self, endpoint: RPCEndpoint, payload: bytes) -> bytes:
+        started = time.perf_counter()
+        try:
+            response = endpoint.session.post(
+                endpoint.url,
+                data=payload,
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            endpoint.record_failure()
+            raise
+        endpoint.record_success(time.perf_counter() - started)
+        return response.content
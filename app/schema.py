@@ -0,0 +1,169 @@
+from sqlalchemy import Float, Integer, MetaData, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from app import db
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect)}'
+    default = column.server_default
+    if default is not None:
+        arg = default.arg
+        ddl += f" DEFAULT '{arg}'" if isinstance(arg, str) else f' DEFAULT {arg.compile(dialect=dialect)}'
+    return ddl
+
+
+def upgrade_schema():
+    """Create missing tables, columns and indexes introduced after the database was created.
+
+    Apart from widening old ``token_id`` columns and recreating the derived
+    collection aggregates, only additive changes are applied, so it is safe
+    to run on every start.
+    """
+    move_aggregates_to_wei()
+    db.create_all()
+    widen_token_ids()
+    dialect = db.engine.dialect
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                conn.execute(text(
+                    f'ALTER TABLE {dialect.identifier_preparer.quote(table.name)} '
+                    f'ADD COLUMN {_column_ddl(column, dialect)}'
+                ))
+            indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+    normalize_wallet_addresses()
+    backfill_wei_columns()
+
+
+def move_aggregates_to_wei():
+    """Drop collection aggregate tables created with ether float columns, and the float price indexes.
+
+    The aggregates are derived data, so the tables are recreated empty by
+    :func:`upgrade_schema` and refilled from the NFT rows and stored sale
+    events by :func:`~app.stats.ensure_collection_stats`.
+    """
+    from app.model import CollectionStats, CollectionVolume, NFT
+
+    quote = db.engine.dialect.identifier_preparer.quote
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, column in ((CollectionStats.__table__, 'floor_price'), (CollectionVolume.__table__, 'volume')):
+            if not inspector.has_table(table.name):
+                continue
+            columns = {c['name']: c for c in inspector.get_columns(table.name)}
+            if isinstance(columns[column]['type'], Float):
+                table.drop(conn)
+        if inspector.has_table(NFT.__tablename__):
+            for index in inspector.get_indexes(NFT.__tablename__):
+                if index['name'] in ('ix_nft_collection_listed_price', 'ix_nft_collection_best_offer'):
+                    conn.execute(text(f'DROP INDEX {quote(index["name"])}'))
+
+
+def widen_token_ids():
+    """Move ``token_id`` columns created as INTEGER to :class:`~app.model.TokenId` storage.
+
+    Token ids are uint256 and overflow a 64-bit INTEGER. PostgreSQL alters
+    the column in place. SQLite cannot change a column's type and its
+    INTEGER affinity would turn the padded strings back into numbers, so the
+    table is copied into a new one; its indexes are recreated afterwards by
+    :func:`upgrade_schema`.
+    """
+    from app.model import ChainEvent, NFT, TokenId
+
+    dialect = db.engine.dialect
+    quote = dialect.identifier_preparer.quote
+    inspector = inspect(db.engine)
+    for table in (NFT.__table__, ChainEvent.__table__):
+        columns = {c['name']: c for c in inspector.get_columns(table.name)}
+        if not isinstance(columns['token_id']['type'], Integer):
+            continue
+        with db.engine.begin() as conn:
+            if dialect.name == 'postgresql':
+                conn.execute(text(
+                    f'ALTER TABLE {quote(table.name)} ALTER COLUMN token_id TYPE {table.c.token_id.type.compile(dialect)}'
+                ))
+                continue
+            if dialect.name != 'sqlite':
+                continue
+            for index in inspector.get_indexes(table.name):
+                conn.execute(text(f'DROP INDEX {quote(index["name"])}'))
+            metadata = MetaData()
+            for foreign_key in table.foreign_keys:
+                # Referenced tables only resolve the copy's foreign keys; they are not created.
+                foreign_key.column.table.to_metadata(metadata)
+            copy = table.to_metadata(metadata, name=f'{table.name}__widened')
+            conn.execute(CreateTable(copy))
+            names = [quote(name) for name in columns if name in table.c]
+            values = [f"printf('%0{TokenId.WIDTH}d', token_id)" if name == quote('token_id') else name for name in names]
+            conn.execute(text(
+                f'INSERT INTO {quote(copy.name)} ({", ".join(names)}) '
+                f'SELECT {", ".join(values)} FROM {quote(table.name)}'
+            ))
+            conn.execute(text(f'DROP TABLE {quote(table.name)}'))
+            conn.execute(text(f'ALTER TABLE {quote(copy.name)} RENAME TO {quote(table.name)}'))
+
+
+def normalize_wallet_addresses():
+    """Lowercase ``user.wallet_address``, merging users that differed only in case.
+
+    Logins and the indexer look users up by the lowercase address, so rows
+    stored in checksum or mixed case would otherwise be duplicated.
+    """
+    from sqlalchemy import func
+
+    from app.model import NFT, User
+
+    if not User.query.filter(User.wallet_address != func.lower(User.wallet_address)).first():
+        return
+    keep = {}
+    for user in User.query.order_by(User.id):
+        address = User.normalize_address(user.wallet_address)
+        if address not in keep:
+            keep[address] = user
+            continue
+        NFT.query.filter_by(owner_id=user.id).update({'owner_id': keep[address].id})
+        db.session.delete(user)
+    db.session.flush()
+    for address, user in keep.items():
+        if user.wallet_address != address:
+            user.wallet_address = address
+    db.session.commit()
+
+
+def backfill_wei_columns(batch_size: int = 1000):
+    """Fill the exact ``*_wei`` price columns of rows indexed before they existed.
+
+    The values are converted from the old ether floats, so they carry those
+    floats' rounding; the indexer writes exact amounts from the event data
+    the next time it rebuilds a token.
+    """
+    from decimal import Decimal
+
+    from web3 import Web3
+
+    from app.model import NFT, Offer
+
+    def to_wei(value):
+        return None if value is None else Web3.to_wei(Decimal(repr(value)), 'ether')
+
+    columns = (
+        (NFT, NFT.price, NFT.price_wei),
+        (NFT, NFT.best_offer, NFT.best_offer_wei),
+        (Offer, Offer.offer_price, Offer.offer_price_wei),
+    )
+    for model, ether, wei in columns:
+        while True:
+            rows = model.query.filter(ether.isnot(None), wei.is_(None)).limit(batch_size).all()
+            if not rows:
+                break
+            for row in rows:
+                setattr(row, wei.key, to_wei(getattr(row, ether.key)))
+            db.session.commit()
@@ -0,0 +1,690 @@
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain, islice
+
+from flask import current_app, url_for
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+MAX_QUERY_LENGTH = 200
+MAX_OFFSET = 10000
+BUILD_BATCH = 500
+_WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text) -> list:
+    """Lowercase words and numbers in ``text``."""
+    return _WORD.findall(str(text).lower()) if text not in (None, '') else []
+
+
+def metadata_traits(metadata) -> list:
+    """``[trait_type, value]`` pairs from token metadata ``attributes``.
+
+    Accepts the usual list of ``{"trait_type", "value"}`` objects as well as
+    a plain ``{trait: value}`` mapping; attributes without a value are skipped.
+    """
+    attributes = metadata.get('attributes') if isinstance(metadata, dict) else None
+    if isinstance(attributes, dict):
+        attributes = [{'trait_type': k, 'value': v} for k, v in attributes.items()]
+    traits = []
+    for item in attributes if isinstance(attributes, list) else []:
+        if not isinstance(item, dict) or item.get('value') in (None, ''):
+            continue
+        traits.append([str(item.get('trait_type') or 'Property')[:64], str(item['value'])[:128]])
+    return traits
+
+
+def make_document(contract_address: str, token_id: int, symbol=None, metadata=None, image_url=None) -> dict:
+    """The searchable form of one listed token."""
+    metadata = metadata if isinstance(metadata, dict) else {}
+    name = str(metadata.get('name') or '')[:100] or None
+    traits = metadata_traits(metadata)
+    title = dict.fromkeys(tokenize(name) + tokenize(symbol) + [str(token_id)])
+    body = dict.fromkeys(
+        word for word in tokenize(str(metadata.get('description') or '')[:2000])
+        + [word for _, value in traits for word in tokenize(value)]
+        if word not in title
+    )
+    return {
+        'contract_address': contract_address,
+        'token_id': token_id,
+        'name': name,
+        'symbol': symbol,
+        'image_url': image_url,
+        'title': ' '.join(title),
+        'body': ' '.join(body),
+        'traits': traits,
+    }
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+class SearchQuery:
+    """Text, collection and trait filters plus offset paging for :meth:`SearchIndex.search`.
+
+    Every word of ``text`` must match (the last one as a prefix, for
+    search-as-you-type). ``traits`` maps a trait type to accepted values:
+    values of one type are alternatives, different types must all match.
+    """
+
+    def __init__(self, text: str = '', collection: str = None, traits=None, offset: int = 0, limit: int = DEFAULT_LIMIT):
+        self.text = text
+        self.terms = tokenize(text)
+        self.collection = collection
+        self.traits = {}
+        for trait_type, values in (traits or {}).items():
+            self.traits.setdefault(trait_type.casefold(), set()).update(v.casefold() for v in values)
+        self.offset = offset
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args):
+        from web3 import Web3
+
+        text = args.get('q', '')
+        if len(text) > MAX_QUERY_LENGTH:
+            raise SearchQueryError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+        collection = args.get('collection') or None
+        if collection and not Web3.is_address(collection):
+            raise SearchQueryError("collection must be an address")
+        traits = {}
+        for trait in args.getlist('trait'):
+            trait_type, sep, value = trait.partition(':')
+            if not sep or not trait_type or not value:
+                raise SearchQueryError("trait must look like 'type:value'")
+            traits.setdefault(trait_type, []).append(value)
+        try:
+            offset = int(args.get('offset', 0))
+            limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise SearchQueryError("offset and limit must be integers")
+        if not 0 <= offset <= MAX_OFFSET:
+            raise SearchQueryError(f"offset must be between 0 and {MAX_OFFSET}")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise SearchQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+        return cls(text=text, collection=collection, traits=traits, offset=offset, limit=limit)
+
+
+class SearchIndex:
+    """In-process inverted index over listed tokens, for ``/api/search``.
+
+    Names, symbols and token ids, descriptions and trait values are indexed
+    word by word; trait ``(type, value)`` pairs and collections have postings
+    of their own, which give the facet counts. Postings are sets of doc ids.
+    :meth:`refresh` keeps the index in step with the listed tokens and only
+    reads the ones listed since its last run; the index is saved as a
+    gzipped JSON snapshot so a restarted worker does not rebuild it.
+    Tokens whose tokenURI or metadata could not be read are indexed with
+    what is known and kept in a retry set that every refresh reads again.
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.refresh_interval = 5.0
+        self.snapshot_interval = 60.0
+        self.facet_limit = 20
+        self.source = None
+        self.marker = None
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._builder = None
+        self.clear()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get('SEARCH_SNAPSHOT_PATH')
+        self.refresh_interval = app.config.get('SEARCH_REFRESH_INTERVAL', self.refresh_interval)
+        self.snapshot_interval = app.config.get('SEARCH_SNAPSHOT_INTERVAL', self.snapshot_interval)
+        self.facet_limit = app.config.get('SEARCH_FACET_LIMIT', self.facet_limit)
+        if app.config.get('MARKETPLACE_READ_SOURCE') == 'index':
+            self.source = 'index'
+        else:
+            self.source = f"chain:{(app.config.get('NFT_MARKETPLACE_CONTRACT_ADDRESS') or '').lower()}"
+        self._loaded = False
+        self.clear()
+        app.extensions['search_index'] = self
+
+    def clear(self):
+        with self._lock:
+            self.docs = {}         # doc id -> document; ids only grow, so dict order is indexing order
+            self.ids = {}          # (lowercase contract, token id) -> doc id
+            self.words = {}        # word -> ids of docs containing it anywhere
+            self.titles = {}       # word -> ids of docs with it in the name, symbol or token id
+            self.traits = {}       # casefolded (type, value) -> doc ids
+            self.trait_labels = {}  # casefolded (type, value) -> (type, value) as first seen
+            self.collections = {}  # lowercase contract -> doc ids
+            self._doc_traits = {}
+            self._vocabulary = None
+            self._next_id = 0
+            self.retry = {}        # (lowercase contract, token id) -> row to resolve again
+            self.marker = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has been built or loaded; before that searches see a partial index."""
+        return self.marker is not None
+
+    def add(self, doc: dict):
+        """Index ``doc`` (from :func:`make_document`), replacing any earlier version of the token."""
+        with self._lock:
+            self._add(doc)
+
+    def remove(self, contract_address: str, token_id: int) -> bool:
+        with self._lock:
+            return self._remove((contract_address.lower(), token_id))
+
+    def _add(self, doc: dict):
+        key = (doc['contract_address'].lower(), doc['token_id'])
+        self._remove(key)
+        doc_id = self._next_id
+        self._next_id += 1
+        self.docs[doc_id] = doc
+        self.ids[key] = doc_id
+        title = doc['title'].split()
+        for word in title:
+            self.titles.setdefault(word, set()).add(doc_id)
+        for word in chain(title, doc['body'].split()):
+            ids = self.words.get(word)
+            if ids is None:
+                ids = self.words[word] = set()
+                self._vocabulary = None
+            ids.add(doc_id)
+        trait_keys = []
+        for trait_type, value in doc['traits']:
+            trait_key = (trait_type.casefold(), value.casefold())
+            self.traits.setdefault(trait_key, set()).add(doc_id)
+            self.trait_labels.setdefault(trait_key, (trait_type, value))
+            trait_keys.append(trait_key)
+        self._doc_traits[doc_id] = tuple(dict.fromkeys(trait_keys))
+        self.collections.setdefault(key[0], set()).add(doc_id)
+
+    def _remove(self, key) -> bool:
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return False
+        doc = self.docs.pop(doc_id)
+        title = doc['title'].split()
+        _discard(self.titles, title, doc_id)
+        if _discard(self.words, chain(title, doc['body'].split()), doc_id):
+            self._vocabulary = None
+        trait_keys = self._doc_traits.pop(doc_id)
+        _discard(self.traits, trait_keys, doc_id)
+        for trait_key in trait_keys:
+            if trait_key not in self.traits:
+                self.trait_labels.pop(trait_key, None)
+        _discard(self.collections, (key[0],), doc_id)
+        return True
+
+    def search(self, query: SearchQuery) -> dict:
+        """``docs`` of the requested page, ``total`` matches and facet counts.
+
+        Docs whose name, symbol or token id match every word come first,
+        most recently indexed first within each group. ``facets`` counts trait
+        values among the matches, per trait type ignoring that type's own
+        filter so other values of it can still be picked; ``collections``
+        counts matches per collection.
+        """
+        with self._lock:
+            words = [self._expand(term, prefix=i == len(query.terms) - 1) for i, term in enumerate(query.terms)]
+            base = None
+            for expanded in words:
+                base = _intersect(base, _union(self.words, expanded))
+            if query.collection:
+                base = _intersect(base, self.collections.get(query.collection.lower(), set()))
+            selected = {
+                trait_type: _union(self.traits, [(trait_type, value) for value in values])
+                for trait_type, values in query.traits.items()
+            }
+            matches = base
+            for ids in sorted(selected.values(), key=len):
+                matches = _intersect(matches, ids)
+
+            if matches is None:
+                total = len(self.docs)
+                page = list(islice(reversed(self.docs), query.offset, query.offset + query.limit))
+            else:
+                total = len(matches)
+                page = self._rank(matches, words, query.offset, query.limit)
+
+            facets = self._facets(matches, exclude=selected)
+            for trait_type in selected:
+                others = base
+                for other, ids in selected.items():
+                    if other != trait_type:
+                        others = _intersect(others, ids)
+                facets.update(self._facets(others, only=trait_type))
+            return {
+                'docs': [self.docs[doc_id] for doc_id in page],
+                'total': total,
+                'facets': facets,
+                'collections': self._collection_counts(matches),
+            }
+
+    def _expand(self, term: str, prefix: bool) -> list:
+        """Indexed words matching ``term``: itself, or every word it starts when used as a prefix."""
+        if not prefix or len(term) < 2:
+            return [term]
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.words)
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, term)
+        end = start
+        while end < len(vocabulary) and vocabulary[end].startswith(term):
+            end += 1
+        return vocabulary[start:end]
+
+    def _rank(self, matches: set, words: list, offset: int, limit: int) -> list:
+        wanted = offset + limit
+        if not words:
+            return heapq.nlargest(wanted, matches)[offset:]
+        titled = matches
+        for expanded in words:
+            titled = titled & _union(self.titles, expanded)
+        page = heapq.nlargest(wanted, titled)
+        if len(page) < wanted:
+            page += heapq.nlargest(wanted - len(page), matches - titled)
+        return page[offset:]
+
+    def _facets(self, ids, exclude=(), only=None) -> dict:
+        if ids is None:
+            counts = {trait_key: len(doc_ids) for trait_key, doc_ids in self.traits.items()}
+        else:
+            postings = {trait_key: doc_ids for trait_key, doc_ids in self.traits.items()
+                        if (only is None and trait_key[0] not in exclude) or trait_key[0] == only}
+            per_doc = sum(map(len, self.traits.values())) / max(len(self.docs), 1)
+            counts = _count(ids, postings, per_doc,
+                            lambda: chain.from_iterable(map(self._doc_traits.__getitem__, ids)))
+        grouped = {}
+        for trait_key, count in counts.items():
+            if (only is None and trait_key[0] not in exclude) or trait_key[0] == only:
+                grouped.setdefault(trait_key[0], []).append((count, trait_key))
+        facets = {}
+        for values in grouped.values():
+            values.sort(key=lambda item: (-item[0], item[1]))
+            label = self.trait_labels[values[0][1]][0]
+            facets[label] = [{'value': self.trait_labels[trait_key][1], 'count': count}
+                             for count, trait_key in values[:self.facet_limit]]
+        return facets
+
+    def _collection_counts(self, ids) -> list:
+        if ids is None:
+            counts = {contract: len(doc_ids) for contract, doc_ids in self.collections.items()}
+        else:
+            counts = _count(ids, self.collections, 1,
+                            lambda: (self.docs[doc_id]['contract_address'].lower() for doc_id in ids))
+        result = []
+        for contract, count in sorted(counts.items(), key=lambda item: -item[1])[:self.facet_limit]:
+            doc = self.docs[next(iter(self.collections[contract]))]
+            result.append({'contract_address': doc['contract_address'], 'symbol': doc['symbol'], 'count': count})
+        return result
+
+    def refresh(self, force: bool = False) -> bool:
+        """Bring the index in line with the listed tokens; return whether it changed.
+
+        Runs at most every ``SEARCH_REFRESH_INTERVAL`` seconds unless
+        ``force``d. Unlisted tokens are dropped and only newly listed ones,
+        plus those in the retry set, are read (symbol, tokenURI and cached
+        metadata), ``BUILD_BATCH`` at a time. While one thread refreshes,
+        the others keep searching the current index and never wait for it.
+        """
+        if not force and self.ready and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self._loaded:
+                self.load()
+            marker, listed = _listed_tokens(self.source, self.marker)
+            with self._lock:
+                indexed = set(self.ids)
+                retry = dict(self.retry)
+            removed, added = set(), []
+            if listed is not None:
+                removed = indexed - listed.keys()
+                added = sorted(listed.keys() - indexed, key=lambda key: (listed[key].get('listed_block') or 0, key))
+                retry = {key: listed[key] for key in retry if key in listed}
+            with self._lock:
+                for key in removed:
+                    self._remove(key)
+            rows = [listed[key] for key in added] + list(retry.values())
+            incomplete = {}
+            for start in range(0, len(rows), BUILD_BATCH):
+                docs, failed = _resolve_documents(rows[start:start + BUILD_BATCH])
+                incomplete.update(failed)
+                # Added batch by batch, so searches during a first build already see part of the index.
+                with self._lock:
+                    for doc in docs:
+                        self._add(doc)
+            with self._lock:
+                self.retry = incomplete
+                if listed is not None:
+                    self.marker = marker
+            fixed = retry.keys() - incomplete.keys()
+            changed = bool(removed or added or fixed)
+            if changed:
+                logger.info("Search index: %d added, %d removed, %d completed on retry, %d listed, %d to retry",
+                            len(added), len(removed), len(fixed), len(self), len(incomplete))
+            self._refreshed_at = time.monotonic()
+            if changed and self.path and time.monotonic() - self._saved_at >= self.snapshot_interval:
+                self.save_in_background()
+            return changed
+        finally:
+            self._refresh_lock.release()
+
+    def prepare(self, app):
+        """Get ready for a search without waiting on the chain.
+
+        Loads the snapshot if there is one, then refreshes inline (at most
+        every ``SEARCH_REFRESH_INTERVAL``); with nothing to start from, the
+        first build runs in the background instead.
+        """
+        if not self._loaded and self._refresh_lock.acquire(blocking=False):
+            try:
+                if not self._loaded:
+                    self.load()
+            finally:
+                self._refresh_lock.release()
+        if self.ready:
+            self.refresh()
+        else:
+            self.refresh_in_background(app)
+
+    def refresh_in_background(self, app):
+        """Run :meth:`refresh` in a daemon thread, unless one is already running."""
+        with self._lock:
+            if self._builder is not None and self._builder.is_alive():
+                return
+            self._builder = threading.Thread(target=self._refresh_logged, args=(app,), name='search-index-build',
+                                             daemon=True)
+            self._builder.start()
+
+    def _refresh_logged(self, app):
+        try:
+            with app.app_context():
+                self.refresh(force=True)
+        except Exception:
+            logger.exception("Building the search index failed")
+
+    def status(self) -> dict:
+        return {'state': 'ready' if self.ready else 'building', 'indexed': len(self), 'pending': len(self.retry)}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'format': SNAPSHOT_FORMAT,
+                'source': self.source,
+                'marker': self.marker,
+                'docs': [[doc['contract_address'], doc['token_id'], doc['name'], doc['symbol'], doc['image_url'],
+                          doc['title'], doc['body'], doc['traits']] for doc in self.docs.values()],
+                'retry': list(self.retry.values()),
+            }
+
+    def save(self, path: str = None, snapshot: dict = None):
+        """Write the snapshot atomically, so other workers never read a partial file."""
+        path = path or self.path
+        snapshot = snapshot or self.snapshot()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.search-index-')
+        try:
+            with os.fdopen(fd, 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as out:
+                out.write(json.dumps(snapshot, separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._saved_at = time.monotonic()
+
+    def save_in_background(self):
+        # Copied under the lock here; compressing and writing happen off the request thread.
+        snapshot = self.snapshot()
+        self._saved_at = time.monotonic()
+        threading.Thread(target=self._save_logged, args=(self.path, snapshot), name='search-snapshot',
+                         daemon=True).start()
+
+    def _save_logged(self, path: str, snapshot: dict):
+        try:
+            self.save(path, snapshot)
+        except Exception:
+            logger.exception("Could not write the search index snapshot to %s", path)
+
+    def load(self, path: str = None) -> bool:
+        """Replace the index with the snapshot at ``path``; False if it is missing or for another source."""
+        self._loaded = True
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with gzip.open(path, 'rb') as f:
+                snapshot = json.loads(f.read())
+        except (OSError, ValueError):
+            logger.exception("Ignoring unreadable search index snapshot %s", path)
+            return False
+        if snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('source') != self.source:
+            return False
+        self.clear()
+        with self._lock:
+            for contract_address, token_id, name, symbol, image_url, title, body, traits in snapshot['docs']:
+                self._add({
+                    'contract_address': contract_address, 'token_id': token_id, 'name': name, 'symbol': symbol,
+                    'image_url': image_url, 'title': title, 'body': body, 'traits': traits,
+                })
+            self.retry = {(row['contract_address'].lower(), row['token_id']): row for row in snapshot.get('retry', [])}
+            self.marker = snapshot.get('marker')
+        return True
+
+
+def search_page(index: SearchIndex, query: SearchQuery) -> dict:
+    """One ``/api/search`` response: the matching listings with live price and owner, and the facets.
+
+    Until the index is first built, which happens in the background, the
+    response covers the tokens indexed so far and ``index.state`` is ``building``.
+    """
+    index.prepare(current_app._get_current_object())
+    result = index.search(query)
+    docs = result.pop('docs')
+    live = _live_listings(index.source, docs)
+    dummy = url_for('static', filename='images/dummy.png')
+    items = []
+    for doc in docs:
+        price, owner = live.get((doc['contract_address'].lower(), doc['token_id']), (None, None))
+        items.append({
+            'contract_address': doc['contract_address'],
+            'token_id': doc['token_id'],
+            'price': price,
+            'symbol': doc['symbol'] or 'Unknown',
+            'name': doc['name'],
+            'image_url': doc['image_url'] or dummy,
+            'owner': owner or 'Unknown',
+            'traits': [{'trait_type': trait_type, 'value': value} for trait_type, value in doc['traits']],
+        })
+    return {'items': items, 'total': result['total'], 'offset': query.offset, 'limit': query.limit,
+            'facets': result['facets'], 'collections': result['collections'], 'index': index.status()}
+
+
+def _live_listings(source: str, docs: list) -> dict:
+    """``{(lowercase contract, token id): (price in MON, owner)}`` for one page of docs.
+
+    Prices change on relisting, so they are read for the page at hand
+    instead of being kept in the index.
+    """
+    if not docs:
+        return {}
+    from web3 import Web3
+
+    if source == 'index':
+        from sqlalchemy import tuple_
+        from sqlalchemy.orm import joinedload
+        from app.model import NFT
+
+        keys = [(doc['contract_address'], doc['token_id']) for doc in docs]
+        rows = NFT.query.options(joinedload(NFT.owner)).filter(
+            NFT.listed.is_(True), tuple_(NFT.contract_address, NFT.token_id).in_(keys))
+        return {
+            (nft.contract_address.lower(), nft.token_id): (
+                str(Web3.from_wei(nft.price_wei, 'ether')) if nft.price_wei is not None else None,
+                nft.owner.wallet_address,
+            ) for nft in rows
+        }
+
+    from app.chain import get_batch_reader, get_erc721_contract, get_marketplace_contract
+    from app.rpc_batch import batch_value
+
+    marketplace_contract = get_marketplace_contract()
+    reader = get_batch_reader()
+    pending = [(
+        doc,
+        reader.add(marketplace_contract, 'getPrice', doc['contract_address'], doc['token_id']),
+        reader.add(get_erc721_contract(doc['contract_address']), 'ownerOf', doc['token_id']),
+    ) for doc in docs]
+    values = reader.execute()
+    live = {}
+    for doc, price_idx, owner_idx in pending:
+        price_wei = batch_value(values, price_idx, None)
+        live[(doc['contract_address'].lower(), doc['token_id'])] = (
+            str(Web3.from_wei(price_wei, 'ether')) if price_wei is not None else None,
+            batch_value(values, owner_idx, None),
+        )
+    return live
+
+
+def _discard(postings: dict, keys, doc_id: int) -> bool:
+    """Remove ``doc_id`` from each posting, dropping postings left empty; True if any was dropped."""
+    dropped = False
+    for key in keys:
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del postings[key]
+                dropped = True
+    return dropped
+
+
+def _union(postings: dict, keys) -> set:
+    sets = [postings[key] for key in keys if key in postings]
+    if len(sets) == 1:
+        return sets[0]
+    return set().union(*sets)
+
+
+def _intersect(ids, other: set) -> set:
+    """``ids & other``, where ``ids`` of ``None`` stands for every document."""
+    return other if ids is None else ids & other
+
+
+def _count(ids: set, postings: dict, per_doc: float, keys_of_ids) -> dict:
+    """How many of ``ids`` are in each posting.
+
+    Intersects ``ids`` with every posting when that is cheaper than counting
+    the ``per_doc`` keys of each doc in ``ids`` one by one (``keys_of_ids()``),
+    as it is for broad matches: an intersection step costs about a quarter
+    of a count.
+    """
+    if sum(min(len(ids), len(doc_ids)) for doc_ids in postings.values()) < 4 * len(ids) * per_doc:
+        counts = {key: len(ids & doc_ids) for key, doc_ids in postings.items()}
+        return {key: count for key, count in counts.items() if count}
+    return Counter(keys_of_ids())
+
+
+def _listed_tokens(source: str, marker):
+    """``(marker, {key: row})`` of the listed tokens, or ``(marker, None)`` when nothing changed since ``marker``.
+
+    The marker is the block read at for the chain, or the indexer checkpoint
+    for the indexed tables; rows hold what is already known of each token.
+    """
+    if source == 'index':
+        from app import db
+        from app.indexer import MarketplaceIndexer
+        from app.model import IndexerCheckpoint, NFT
+
+        checkpoint = db.session.get(IndexerCheckpoint, MarketplaceIndexer.CHECKPOINT)
+        current = checkpoint.block_number if checkpoint is not None else None
+        if current is not None and current == marker:
+            return marker, None
+        rows = db.session.query(NFT.contract_address, NFT.token_id, NFT.listed_block, NFT.symbol, NFT.token_uri,
+                                NFT.name, NFT.description, NFT.image_url).filter(NFT.listed.is_(True))
+        return current, {
+            (row.contract_address.lower(), row.token_id): row._asdict() for row in rows
+        }
+
+    from web3 import Web3
+    from app.chain import get_listed_set, get_w3
+
+    block_number = get_w3().eth.block_number
+    if block_number == marker:
+        return marker, None
+    return block_number, {
+        key: {'contract_address': Web3.to_checksum_address(key[0]), 'token_id': key[1]}
+        for key in get_listed_set(block_number)
+    }
+
+
+def _resolve_documents(rows: list) -> tuple:
+    """Documents for newly listed tokens: one batched symbol/tokenURI read, then their metadata.
+
+    Returns ``(docs, failed)``; ``failed`` maps the tokens whose tokenURI or
+    metadata could not be read to the row to resolve them from next time.
+    """
+    if not rows:
+        return [], {}
+    from app.chain import get_batch_reader, get_erc721_contract
+    from app.rpc_batch import BatchCallError, batch_value
+    from app.token_metadata import image_from_metadata, load_token_metadata_many
+
+    failed = {}
+    unresolved = [row for row in rows if 'token_uri' not in row]
+    if unresolved:
+        reader = get_batch_reader()
+        for row in unresolved:
+            nft_contract = get_erc721_contract(row['contract_address'])
+            row['symbol_idx'] = reader.add(nft_contract, 'symbol')
+            row['uri_idx'] = reader.add(nft_contract, 'tokenURI', row['token_id'])
+        values = reader.execute()
+        for row in unresolved:
+            uri_idx = row.pop('uri_idx')
+            row['symbol'] = batch_value(values, row.pop('symbol_idx'), None)
+            row['token_uri'] = batch_value(values, uri_idx, None)
+            if isinstance(values[uri_idx], BatchCallError) and not values[uri_idx].reverted:
+                # Read both again next time.
+                failed[_row_key(row)] = {'contract_address': row['contract_address'], 'token_id': row['token_id']}
+
+    metadata = load_token_metadata_many(row['token_uri'] for row in rows if row['token_uri'])
+    docs = []
+    for row in rows:
+        token_metadata = dict(metadata.get(row['token_uri']) or {})
+        if row['token_uri'] and not token_metadata:
+            failed.setdefault(_row_key(row), dict(row))
+        # The indexed tables already hold name and description; metadata only adds the traits then.
+        for field in ('name', 'description'):
+            if row.get(field) and not token_metadata.get(field):
+                token_metadata[field] = row[field]
+        image_url = row.get('image_url') or image_from_metadata(token_metadata)
+        docs.append(make_document(row['contract_address'], row['token_id'], row.get('symbol'), token_metadata,
+                                  image_url))
+    return docs, failed
+
+
+def _row_key(row: dict) -> tuple:
+    return row['contract_address'].lower(), row['token_id']
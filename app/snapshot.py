@@ -0,0 +1,311 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+
+from app.rpc_batch import BatchCallError, BatchReader
+from app.token_metadata import erc721_abi
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; without it only JSONL snapshots are available
+    pa = None
+
+FORMATS = ('jsonl', 'parquet')
+COMPARED_FIELDS = ('price_wei', 'owner', 'best_offer_wei', 'proposal_count', 'proposals')
+
+
+class SnapshotError(Exception):
+    """The snapshot cannot be written or resumed as requested."""
+
+
+def meta_path(path: str) -> str:
+    return path.rstrip('/') + '.meta.json'
+
+
+def _parquet_schema():
+    return pa.schema([
+        ('position', pa.int64()),
+        ('block', pa.int64()),
+        ('contract', pa.string()),
+        ('token_id', pa.string()),
+        ('price_wei', pa.string()),
+        ('owner', pa.string()),
+        ('proposal_count', pa.int64()),
+        ('best_offer_wei', pa.string()),
+        ('proposals', pa.list_(pa.struct([('proposer', pa.string()), ('price_wei', pa.string())]))),
+        ('error', pa.string()),
+    ])
+
+
+class JSONLWriter:
+    """One JSON object per line, appended chunk by chunk; ``offset`` marks the last complete chunk."""
+
+    def __init__(self, path: str, offset: int = 0):
+        self.file = open(path, 'r+b' if offset else 'wb')
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def write(self, index: int, rows: list) -> int:
+        self.file.write(b''.join(json.dumps(row, separators=(',', ':')).encode() + b'\n' for row in rows))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """A directory of ``part-NNNNN.parquet`` files, one per chunk, each written atomically."""
+
+    def __init__(self, path: str, offset: int = 0):
+        if pa is None:
+            raise SnapshotError('Parquet output needs pyarrow (pip install pyarrow)')
+        self.path = path
+        self.schema = _parquet_schema()
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, index: int, rows: list) -> int:
+        part = os.path.join(self.path, f'part-{index:05d}.parquet')
+        pq.write_table(pa.Table.from_pylist(rows, schema=self.schema), part + '.tmp')
+        os.replace(part + '.tmp', part)
+        return index + 1
+
+    def close(self):
+        pass
+
+
+WRITERS = {'jsonl': JSONLWriter, 'parquet': ParquetWriter}
+
+
+class SnapshotExporter:
+    """Dump every listing, its price, owner and proposals as of one block.
+
+    The block is pinned up front and every read runs against it, so the
+    snapshot is consistent even while the marketplace keeps trading.
+    Listings are read in chunks of ``chunk_size``; up to ``workers`` chunks
+    are in flight at once, each resolved with JSON-RPC batches, and rows are
+    written in listing order as chunks complete, so memory stays bounded by
+    the chunks in flight. Progress is recorded in ``<output>.meta.json``
+    after every chunk, which is what :meth:`export` resumes from.
+
+    Calls that fail without reverting are retried up to ``retries`` times.
+    A chunk that still has such failures is not written: the export stops
+    with a :class:`SnapshotError` and ``--resume`` starts again from that
+    chunk. Reverted calls are final and recorded in the row's ``error``.
+    """
+
+    def __init__(self, client, chunk_size: int = 500, workers: int = 4, batch_size: int = 100,
+                 retries: int = 3, retry_delay: float = 0.5):
+        self.client = client
+        self.w3 = client.get_w3()
+        self.marketplace = client.get_marketplace()
+        self.chunk_size = max(1, chunk_size)
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+
+    def export(self, path: str, fmt: str = 'jsonl', block: int = None, resume: bool = False, progress=None) -> dict:
+        """Write the snapshot to ``path`` and return its metadata."""
+        meta = self._load_meta(path, fmt) if resume else None
+        if meta is None:
+            block = block if block is not None else self.w3.eth.block_number
+            meta = {
+                'version': 1,
+                'format': fmt,
+                'block': block,
+                'block_hash': Web3.to_hex(self.w3.eth.get_block(block)['hash']),
+                'chain_id': self.w3.eth.chain_id,
+                'marketplace': self.marketplace.address,
+                'chunk_size': self.chunk_size,
+                'listings': None,
+                'rows': 0,
+                'offset': 0,
+                'complete': False,
+                'started_at': int(time.time()),
+            }
+        elif meta['complete']:
+            return meta
+
+        block = meta['block']
+        listed_nfts, listed_token_ids = self.marketplace.functions.getAllListedNFTs().call(block_identifier=block)
+        listings = list(zip(listed_nfts, listed_token_ids))
+        if meta['listings'] is None:
+            meta['listings'] = len(listings)
+        elif meta['listings'] != len(listings):
+            raise SnapshotError(f"block {block} now has {len(listings)} listings, the snapshot started with "
+                                f"{meta['listings']}; start a new snapshot")
+
+        chunk_size = meta['chunk_size']
+        first_chunk = meta['rows'] // chunk_size
+        starts = range(first_chunk * chunk_size, len(listings), chunk_size)
+        writer = WRITERS[fmt](path, meta['offset'])
+        self._save_meta(path, meta)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='snapshot') as executor:
+                window = deque()
+                starts = iter(starts)
+                index = first_chunk
+                try:
+                    while True:
+                        while len(window) < self.workers * 2:
+                            start = next(starts, None)
+                            if start is None:
+                                break
+                            chunk = listings[start:start + chunk_size]
+                            window.append(executor.submit(self.read_chunk, block, start, chunk))
+                        if not window:
+                            break
+                        rows = window.popleft().result()
+                        meta['offset'] = writer.write(index, rows)
+                        meta['rows'] = index * chunk_size + len(rows)
+                        index += 1
+                        self._save_meta(path, meta)
+                        if progress:
+                            progress(meta)
+                except BaseException:
+                    # Unwritten chunks are read again on resume; don't wait for the queued ones.
+                    for future in window:
+                        future.cancel()
+                    raise
+        finally:
+            writer.close()
+        meta['complete'] = True
+        meta['finished_at'] = int(time.time())
+        self._save_meta(path, meta)
+        return meta
+
+    def read_chunk(self, block: int, start: int, listings: list) -> list:
+        """Rows for ``listings`` (positions ``start``...) read at ``block``."""
+        reader = BatchReader(self.w3, block_identifier=block, batch_size=self.batch_size)
+        calls = []
+
+        def add(contract, fn_name, *args):
+            index = reader.add(contract, fn_name, *args)
+            if index == len(calls):
+                calls.append((contract, fn_name, *args))
+            return index
+
+        pending = []
+        for nft_address, token_id in listings:
+            nft_address = Web3.to_checksum_address(nft_address)
+            pending.append((
+                nft_address,
+                token_id,
+                add(self.marketplace, 'getPrice', nft_address, token_id),
+                add(self.client.erc721(nft_address, erc721_abi()), 'ownerOf', token_id),
+                add(self.marketplace, 'getProposalsForNFT', nft_address, token_id),
+            ))
+        values = self._retry_failed(block, calls, reader.execute())
+        failed = [v for v in values if isinstance(v, BatchCallError) and not v.reverted]
+        if failed:
+            raise SnapshotError(f"{len(failed)} calls for listings {start}-{start + len(listings) - 1} still failed "
+                                f"after {self.retries} retries ({failed[0]}); rerun with --resume")
+
+        rows = []
+        for position, (nft_address, token_id, price_idx, owner_idx, proposals_idx) in enumerate(pending, start):
+            price, owner, proposals = values[price_idx], values[owner_idx], values[proposals_idx]
+            errors = [str(v) for v in (price, owner, proposals) if isinstance(v, BatchCallError)]
+            proposers, prices = ([], []) if isinstance(proposals, BatchCallError) else proposals
+            rows.append({
+                'position': position,
+                'block': block,
+                'contract': nft_address,
+                'token_id': str(token_id),
+                'price_wei': None if isinstance(price, BatchCallError) else str(price),
+                'owner': None if isinstance(owner, BatchCallError) else owner,
+                'proposal_count': len(prices),
+                'best_offer_wei': str(max(prices)) if prices else None,
+                'proposals': [{'proposer': p, 'price_wei': str(v)} for p, v in zip(proposers, prices)],
+                'error': '; '.join(errors) or None,
+            })
+        return rows
+
+    def _retry_failed(self, block: int, calls: list, values: list) -> list:
+        """Re-send the calls in ``values`` that failed without reverting, with growing delays."""
+        for attempt in range(self.retries):
+            failed = [i for i, v in enumerate(values) if isinstance(v, BatchCallError) and not v.reverted]
+            if not failed:
+                break
+            time.sleep(self.retry_delay * 2 ** attempt)
+            reader = BatchReader(self.w3, block_identifier=block, batch_size=self.batch_size)
+            indexes = [reader.add(*calls[i]) for i in failed]
+            retried = reader.execute()
+            for i, index in zip(failed, indexes):
+                values[i] = retried[index]
+        return values
+
+    def _load_meta(self, path: str, fmt: str):
+        try:
+            with open(meta_path(path)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta.get('format') != fmt or meta.get('marketplace') != self.marketplace.address:
+            raise SnapshotError(f"{path} is a {meta.get('format')} snapshot of {meta.get('marketplace')}; "
+                                f"cannot resume it as {fmt} of {self.marketplace.address}")
+        if not meta['complete']:
+            block_hash = Web3.to_hex(self.w3.eth.get_block(meta['block'])['hash'])
+            if block_hash != meta['block_hash']:
+                raise SnapshotError(f"block {meta['block']} was reorganized since the snapshot started")
+        return meta
+
+    @staticmethod
+    def _save_meta(path: str, meta: dict):
+        tmp = meta_path(path) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, meta_path(path))
+
+
+def read_rows(path: str):
+    """Yield the rows of a JSONL snapshot file or a Parquet snapshot directory."""
+    if os.path.isdir(path):
+        if pa is None:
+            raise SnapshotError('Reading Parquet snapshots needs pyarrow (pip install pyarrow)')
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.parquet'):
+                yield from pq.read_table(os.path.join(path, name)).to_pylist()
+        return
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _key(row: dict) -> tuple:
+    return row['contract'].lower(), row['token_id']
+
+
+def _compared(row: dict) -> dict:
+    values = {field: row.get(field) for field in COMPARED_FIELDS}
+    if values['owner']:
+        values['owner'] = values['owner'].lower()
+    return values
+
+
+def diff_snapshots(old_path: str, new_path: str):
+    """Yield ``added``, ``removed`` and ``changed`` records between two snapshots.
+
+    Only the older snapshot is held in memory, reduced to the compared
+    fields; the newer one is streamed.
+    """
+    old = {_key(row): _compared(row) for row in read_rows(old_path)}
+    for row in read_rows(new_path):
+        key = _key(row)
+        current = _compared(row)
+        before = old.pop(key, None)
+        if before is None:
+            yield {'change': 'added', 'contract': row['contract'], 'token_id': row['token_id'], **current}
+            continue
+        fields = {name: [before[name], current[name]] for name in COMPARED_FIELDS if before[name] != current[name]}
+        if fields:
+            yield {'change': 'changed', 'contract': row['contract'], 'token_id': row['token_id'], 'fields': fields}
+    for (contract, token_id), before in old.items():
+        yield {'change': 'removed', 'contract': Web3.to_checksum_address(contract), 'token_id': token_id, **before}
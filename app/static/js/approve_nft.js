@@ -1,9 +1,8 @@
 import { ethers } from "https://cdn.jsdelivr.net/npm/ethers@6.8.1/dist/ethers.min.js";
+import { loadMarketplace } from "./bootstrap.js";
 
 
-const contract_response = await fetch('/api/marketplace_contract_address');
-const marketplace_contract_dict = await contract_response.json();
-const MARKETPLACE_ADDRESS = marketplace_contract_dict['contract_address']
+const { address: MARKETPLACE_ADDRESS } = await loadMarketplace();
 
 // ERC-721 minimal ABI for approval + interface check
 const ERC721_ABI = [
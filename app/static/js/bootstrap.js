@@ -0,0 +1,35 @@
+// Loads network config, marketplace ABI and contract address from the single
+// cacheable /api/bootstrap document. Every page script imports this module, so
+// the browser fetches it at most once per page (and usually from HTTP cache).
+
+let bootstrapPromise = null;
+
+function bootstrapUrl() {
+    const meta = document.querySelector('meta[name="bootstrap-url"]');
+    return meta ? meta.content : '/api/bootstrap';
+}
+
+export function loadBootstrap() {
+    if (!bootstrapPromise) {
+        bootstrapPromise = fetch(bootstrapUrl())
+            .then(resp => {
+                if (!resp.ok) throw new Error('Failed to fetch bootstrap config');
+                return resp.json();
+            })
+            .then(cfg => {
+                // Ensure chainId is a hex string like '0x279f'
+                if (typeof cfg.network.chainId === 'number') cfg.network.chainId = '0x' + cfg.network.chainId.toString(16);
+                return cfg;
+            })
+            .catch(err => {
+                bootstrapPromise = null;
+                throw err;
+            });
+    }
+    return bootstrapPromise;
+}
+
+export async function loadMarketplace() {
+    const cfg = await loadBootstrap();
+    return { abi: cfg.abi, address: cfg.contract_address };
+}
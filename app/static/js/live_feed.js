@@ -0,0 +1,51 @@
+// Subscribes to /api/events and patches the marketplace and proposals pages
+// in place: cards for unlisted/sold NFTs and withdrawn proposals disappear,
+// and new listings or offers show a notice with a reload link.
+
+const root = document.getElementById('liveFeed');
+const notice = document.getElementById('liveFeedNotice');
+
+function showNotice(text) {
+    if (!notice) return;
+    notice.textContent = text + ' ';
+    const link = document.createElement('a');
+    link.href = window.location.href;
+    link.textContent = 'Reload';
+    notice.appendChild(link);
+    notice.classList.remove('d-none');
+}
+
+function removeCard(selector) {
+    const card = root.querySelector(selector);
+    if (card) (card.closest('.col') || card).remove();
+}
+
+const marketplaceHandlers = {
+    NFTListed: () => showNotice('New NFTs were listed.'),
+    NFTUnlisted: e => removeCard(`[data-nft="${e.contract_address.toLowerCase()}:${e.token_id}"]`),
+    NFTSold: e => removeCard(`[data-nft="${e.contract_address.toLowerCase()}:${e.token_id}"]`),
+};
+
+const proposalHandlers = {
+    ProposalMade: () => showNotice('A new proposal was made.'),
+    ProposalCancelled: e => removeCard(`[data-proposer="${e.args.proposer.toLowerCase()}"]`),
+    ProposalAccepted: () => showNotice('A proposal was accepted.'),
+    NFTSold: () => showNotice('This NFT was sold.'),
+    NFTUnlisted: () => showNotice('This NFT was unlisted.'),
+};
+
+function subscribe() {
+    if (!root || !window.EventSource) return;
+    const handlers = root.dataset.page === 'proposals' ? proposalHandlers : marketplaceHandlers;
+    const params = new URLSearchParams({ events: Object.keys(handlers).join(',') });
+    if (root.dataset.collection) params.set('collection', root.dataset.collection);
+    if (root.dataset.tokenId) params.set('token_id', root.dataset.tokenId);
+
+    const source = new EventSource(`/api/events?${params}`);
+    for (const [name, handler] of Object.entries(handlers)) {
+        source.addEventListener(name, msg => handler(JSON.parse(msg.data)));
+    }
+    source.addEventListener('reset', () => showNotice('This page is out of date.'));
+}
+
+subscribe();
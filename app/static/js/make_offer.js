@@ -1,13 +1,11 @@
 import { ethers } from "https://cdn.jsdelivr.net/npm/ethers@6.8.1/dist/ethers.min.js";
+import { loadBootstrap, loadMarketplace } from "./bootstrap.js";
 
 let MONAD_TESTNET = null;
 
 async function loadNetworkConfig() {
     try {
-        const resp = await fetch('/api/network_config');
-        if (!resp.ok) throw new Error('Failed to fetch network config');
-        const cfg = await resp.json();
-        if (typeof cfg.chainId === 'number') cfg.chainId = '0x' + cfg.chainId.toString(16);
+        const cfg = (await loadBootstrap()).network;
         MONAD_TESTNET = cfg;
         return cfg;
     } catch (err) {
@@ -67,12 +65,7 @@ document.addEventListener('click', async function (e) {
             await window.ethereum.request({ method: 'eth_requestAccounts' });
             const signer = await provider.getSigner();
 
-            const response = await fetch('/api/marketplace_abi');
-            if (!response.ok) throw new Error('Failed to load marketplace ABI');
-            const contractAbi = await response.json();
-            const contract_response = await fetch('/api/marketplace_contract_address');
-            const marketplace_contract_dict = await contract_response.json()
-            const marketplace_contract = marketplace_contract_dict['contract_address']
+            const { abi: contractAbi, address: marketplace_contract } = await loadMarketplace();
             const contract = new ethers.Contract(marketplace_contract, contractAbi, signer);
 
             const tx = await contract.proposeNFTPrice(
@@ -1,4 +1,5 @@
 import { ethers } from "https://cdn.jsdelivr.net/npm/ethers@6.8.1/dist/ethers.min.js";
+import { loadBootstrap } from "./bootstrap.js";
 
 const walletConnectBtn = document.getElementById('walletConnectBtn');
 const walletDisconnectBtn = document.getElementById('walletDisconnectBtn');
@@ -7,11 +8,7 @@ let MONAD_TESTNET = null;
 
 async function loadNetworkConfig() {
     try {
-        const resp = await fetch('/api/network_config');
-        if (!resp.ok) throw new Error('Failed to fetch network config');
-        const cfg = await resp.json();
-        // Ensure chainId is a hex string like '0x279f'
-        if (typeof cfg.chainId === 'number') cfg.chainId = '0x' + cfg.chainId.toString(16);
+        const cfg = (await loadBootstrap()).network;
         MONAD_TESTNET = cfg;
         return cfg;
     } catch (err) {
@@ -0,0 +1,203 @@
+import time
+
+from sqlalchemy import func
+
+from app import db
+from app.model import ChainEvent, CollectionStats, CollectionVolume, NFT, Offer
+
+HOUR = 3600
+
+
+def token_snapshot(nft) -> tuple:
+    """``(listed, price_wei, best_offer_wei, offer_count)`` of an NFT row, or of an absent one."""
+    if nft is None:
+        return False, None, None, 0
+    return bool(nft.listed), nft.price_wei, nft.best_offer_wei, nft.offer_count or 0
+
+
+def _ether(wei):
+    from web3 import Web3
+
+    return None if wei is None else str(Web3.from_wei(wei, 'ether'))
+
+
+class CollectionStatsUpdater:
+    """Apply per-token changes to ``CollectionStats`` without rescanning a collection.
+
+    Counts move by the token's delta. Floor, ceiling and best offer only
+    need an indexed MIN/MAX query when the token holding the current
+    extreme moved away from it; otherwise they are updated in place.
+    """
+
+    def __init__(self, block_number: int = None):
+        self.block_number = block_number
+        self._rows = {}
+        self._dirty = {}
+
+    def _row(self, contract_address: str) -> CollectionStats:
+        row = self._rows.get(contract_address)
+        if row is None:
+            row = db.session.get(CollectionStats, contract_address)
+            if row is None:
+                row = CollectionStats(contract_address=contract_address, listing_count=0, offer_count=0)
+                db.session.add(row)
+            self._rows[contract_address] = row
+        return row
+
+    def apply(self, contract_address: str, before: tuple, after: tuple):
+        if before == after:
+            return
+        row = self._row(contract_address)
+        dirty = self._dirty.setdefault(contract_address, set())
+        was_listed, old_price, old_offer, old_offers = before
+        is_listed, new_price, new_offer, new_offers = after
+
+        row.listing_count += int(is_listed) - int(was_listed)
+        row.offer_count += new_offers - old_offers
+
+        old_price = old_price if was_listed else None
+        new_price = new_price if is_listed else None
+        if old_price != new_price:
+            if new_price is not None:
+                if row.floor_price is None or new_price < row.floor_price:
+                    row.floor_price = new_price
+                if row.ceiling_price is None or new_price > row.ceiling_price:
+                    row.ceiling_price = new_price
+            if old_price is not None and old_price == row.floor_price and new_price != old_price:
+                dirty.add('floor_price')
+            if old_price is not None and old_price == row.ceiling_price and new_price != old_price:
+                dirty.add('ceiling_price')
+
+        if old_offer != new_offer:
+            if new_offer is not None and (row.best_offer is None or new_offer > row.best_offer):
+                row.best_offer = new_offer
+            if old_offer is not None and old_offer == row.best_offer and new_offer != old_offer:
+                dirty.add('best_offer')
+
+    def add_sale(self, contract_address: str, price_wei: int, timestamp: int, sign: int = 1):
+        """Add (or with ``sign=-1`` remove) one sale in its hourly volume bucket."""
+        hour = int(timestamp) // HOUR
+        bucket = db.session.get(CollectionVolume, (contract_address, hour))
+        if bucket is None:
+            bucket = CollectionVolume(contract_address=contract_address, hour=hour, volume=0, sales=0)
+            db.session.add(bucket)
+        bucket.volume = max(0, bucket.volume + sign * price_wei)
+        bucket.sales = max(0, bucket.sales + sign)
+
+    def finish(self):
+        """Recompute the extremes whose holder moved; call after the NFT rows are flushed."""
+        db.session.flush()
+        for contract_address, fields in self._dirty.items():
+            row = self._rows[contract_address]
+            listed = NFT.query.filter_by(contract_address=contract_address, listed=True)
+            if 'floor_price' in fields:
+                row.floor_price = listed.with_entities(func.min(NFT.price_wei)).scalar()
+            if 'ceiling_price' in fields:
+                row.ceiling_price = listed.with_entities(func.max(NFT.price_wei)).scalar()
+            if 'best_offer' in fields:
+                row.best_offer = db.session.query(func.max(NFT.best_offer_wei)) \
+                    .filter(NFT.contract_address == contract_address).scalar()
+        for row in self._rows.values():
+            row.updated_block = self.block_number
+        self._rows = {}
+        self._dirty = {}
+
+
+def rebuild_collection_stats(block_number: int = None):
+    """Recompute every token's offer stats, every collection row and the hourly volume from scratch.
+
+    Only needed once, for databases indexed before the aggregates existed
+    or while they were still ether floats; the indexer keeps them current
+    afterwards.
+    """
+    import json
+
+    from web3 import Web3
+
+    from app.indexer import SALE_EVENTS
+
+    offers = dict(
+        (nft_id, (best, count)) for nft_id, best, count in db.session.query(
+            Offer.nft_id, func.max(Offer.offer_price_wei), func.count(Offer.id)
+        ).filter(Offer.status == 'pending').group_by(Offer.nft_id)
+    )
+    for nft in NFT.query:
+        nft.best_offer_wei, nft.offer_count = offers.get(nft.id, (None, 0))
+        nft.best_offer = None if nft.best_offer_wei is None else float(Web3.from_wei(nft.best_offer_wei, 'ether'))
+    db.session.flush()
+
+    CollectionStats.query.delete()
+    rows = db.session.query(
+        NFT.contract_address,
+        func.min(NFT.price_wei).filter(NFT.listed.is_(True)),
+        func.max(NFT.price_wei).filter(NFT.listed.is_(True)),
+        func.count(NFT.id).filter(NFT.listed.is_(True)),
+        func.max(NFT.best_offer_wei),
+        func.coalesce(func.sum(NFT.offer_count), 0),
+    ).group_by(NFT.contract_address)
+    for contract_address, floor, ceiling, listings, best_offer, offer_count in rows:
+        db.session.add(CollectionStats(
+            contract_address=contract_address,
+            floor_price=floor,
+            ceiling_price=ceiling,
+            listing_count=listings,
+            best_offer=best_offer,
+            offer_count=offer_count,
+            updated_block=block_number,
+        ))
+
+    CollectionVolume.query.delete()
+    stats = CollectionStatsUpdater(block_number)
+    sales = ChainEvent.query.filter(ChainEvent.name.in_(SALE_EVENTS), ChainEvent.block_timestamp.isnot(None))
+    for event in sales:
+        stats.add_sale(event.contract_address, int(json.loads(event.args)['price']), event.block_timestamp)
+    db.session.commit()
+
+
+def ensure_collection_stats(block_number: int = None):
+    if CollectionStats.query.first() is None and NFT.query.first() is not None:
+        rebuild_collection_stats(block_number)
+
+
+def volume_24h(contract_address: str, now: float = None) -> tuple:
+    """``(volume_wei, sales)`` over the last 24 hourly buckets.
+
+    Summed in Python: SQL SUM over the stored wei amounts would overflow
+    or fall back to floating point.
+    """
+    since = int(now or time.time()) // HOUR - 23
+    buckets = db.session.query(CollectionVolume.volume, CollectionVolume.sales) \
+        .filter(CollectionVolume.contract_address == contract_address, CollectionVolume.hour >= since).all()
+    return sum(volume for volume, _ in buckets), sum(sales for _, sales in buckets)
+
+
+def collection_stats(contract_address: str):
+    row = db.session.get(CollectionStats, contract_address)
+    if row is None:
+        return None
+    volume, sales = volume_24h(contract_address)
+    return {
+        'contract_address': row.contract_address,
+        'floor_price': _ether(row.floor_price),
+        'ceiling_price': _ether(row.ceiling_price),
+        'listing_count': row.listing_count,
+        'best_offer': _ether(row.best_offer),
+        'offer_count': row.offer_count,
+        'volume_24h': _ether(volume),
+        'sales_24h': sales,
+        'updated_block': row.updated_block,
+    }
+
+
+def token_stats(contract_address: str, token_id: int):
+    nft = NFT.query.filter_by(contract_address=contract_address, token_id=token_id).first()
+    if nft is None:
+        return None
+    return {
+        'contract_address': nft.contract_address,
+        'token_id': nft.token_id,
+        'listed': nft.listed,
+        'price': _ether(nft.price_wei),
+        'best_offer': _ether(nft.best_offer_wei),
+        'offer_count': nft.offer_count or 0,
+    }
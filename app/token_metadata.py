@@ -0,0 +1,182 @@
+import asyncio
+import base64
+import json
+import queue
+import threading
+
+from flask import current_app
+
+from app import metadata_cache
+from app.metadata_fetcher import MetadataFetcher
+from app.metrics import instrumented_session
+
+http = instrumented_session()
+
+
+def erc721_abi():
+    return [
+        {
+            "constant": True,
+            "inputs": [],
+            "name": "symbol",
+            "outputs": [{"name": "", "type": "string"}],
+            "type": "function",
+        },
+        {
+            "constant": True,
+            "inputs": [{"name": "tokenId", "type": "uint256"}],
+            "name": "tokenURI",
+            "outputs": [{"name": "", "type": "string"}],
+            "type": "function",
+        },
+        {
+            "constant": True,
+            "inputs": [{"name": "tokenId", "type": "uint256"}],
+            "name": "ownerOf",
+            "outputs": [{"name": "", "type": "address"}],
+            "type": "function",
+        },
+    ]
+
+
+def normalize_ipfs(url: str) -> str:
+    if not isinstance(url, str):
+        return url
+    if url.startswith("ipfs://"):
+        gateways = current_app.config.get('IPFS_GATEWAYS') or ['https://ipfs.io/ipfs/']
+        return MetadataFetcher(gateways).candidates(url)[0]
+    return url
+
+
+def load_token_metadata(token_uri: str) -> dict:
+    token_uri = normalize_ipfs(token_uri)
+    if not token_uri:
+        return {}
+    if token_uri.startswith("data:"):
+        try:
+            base64_data = token_uri.split(",", 1)[1]
+            decoded_json = base64.b64decode(base64_data).decode("utf-8")
+            return json.loads(decoded_json)
+        except Exception:
+            current_app.logger.exception("Failed to decode inline token metadata")
+            return {}
+
+    found, metadata = metadata_cache.lookup(token_uri)
+    if found:
+        return metadata or {}
+    try:
+        resp = http.get(token_uri, timeout=15)
+        resp.raise_for_status()
+        metadata = resp.json()
+    except Exception:
+        current_app.logger.exception("Failed to load token metadata from %s", token_uri)
+        metadata_cache.set_failed(token_uri)
+        return {}
+    metadata_cache.set(token_uri, metadata)
+    return metadata
+
+
+def _split_cached(token_uris) -> tuple:
+    """``({token_uri: metadata}, {token_uri: normalized URL})``: what is known now, and what must be fetched."""
+    metadata = {}
+    to_fetch = {}
+    for token_uri in set(token_uris):
+        normalized = normalize_ipfs(token_uri)
+        if not normalized or normalized.startswith("data:"):
+            metadata[token_uri] = load_token_metadata(token_uri)
+            continue
+        found, cached = metadata_cache.lookup(normalized)
+        if found:
+            metadata[token_uri] = cached or {}
+        else:
+            to_fetch[token_uri] = normalized
+    return metadata, to_fetch
+
+
+def _store_fetched(normalized: str, value) -> dict:
+    if value is None:
+        current_app.logger.error("Failed to load token metadata from %s", normalized)
+        metadata_cache.set_failed(normalized)
+        return {}
+    metadata_cache.set(normalized, value)
+    return value
+
+
+def load_token_metadata_many(token_uris) -> dict:
+    """Resolve many tokenURIs at once: cache first, then one concurrent fetch for the rest."""
+    metadata, to_fetch = _split_cached(token_uris)
+    if to_fetch:
+        runtime = current_app.extensions.get('aio')
+        if runtime is not None and runtime.enabled:
+            fetched = runtime.fetch_metadata(to_fetch.keys())
+        else:
+            fetched = MetadataFetcher.from_config(current_app.config).fetch_all(to_fetch.keys())
+        for token_uri, normalized in to_fetch.items():
+            metadata[token_uri] = _store_fetched(normalized, fetched.get(token_uri))
+    return metadata
+
+
+def iter_token_metadata(token_uris):
+    """Yield ``(token_uri, metadata)``: cached and inline ones first, then the rest as each fetch completes.
+
+    Fetches run concurrently on the shared event loop with ``ASYNC_VIEWS``,
+    otherwise on a short-lived loop in a helper thread.
+    """
+    metadata, to_fetch = _split_cached(token_uris)
+    yield from metadata.items()
+    if not to_fetch:
+        return
+
+    runtime = current_app.extensions.get('aio')
+    shared = runtime is not None and runtime.enabled
+    fetcher = runtime.fetcher if shared else MetadataFetcher.from_config(current_app.config)
+    completed = queue.Queue()
+    uris = list(to_fetch)
+
+    async def pump():
+        try:
+            session = runtime.metadata_session if shared else None
+            async for item in fetcher.iter_completed_async(uris, session=session):
+                completed.put(item)
+        finally:
+            completed.put(None)
+
+    if shared:
+        stop = runtime.submit(pump()).cancel
+    else:
+        # The task copies this context, so the request's outbound HTTP metrics still see the fetches.
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(pump())
+
+        def run():
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        def stop():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # the loop already finished
+
+        threading.Thread(target=run, name='metadata-fetch', daemon=True).start()
+
+    try:
+        while (item := completed.get()) is not None:
+            token_uri, value = item
+            yield token_uri, _store_fetched(to_fetch.pop(token_uri), value)
+    finally:
+        # Stops the fetches still in flight when the consumer goes away early (e.g. the client disconnected).
+        stop()
+    for token_uri, normalized in to_fetch.items():
+        yield token_uri, _store_fetched(normalized, None)
+
+
+def image_from_metadata(metadata: dict):
+    """Return the gateway URL of the metadata image, or ``None`` if it has none."""
+    image_url = metadata.get("image") if isinstance(metadata, dict) else None
+    return normalize_ipfs(image_url) if image_url else None
@@ -0,0 +1,42 @@
+import importlib
+import time
+
+from app import metrics, rpc, search_index
+from app.rpc_batch import _function_info
+
+# Imported on the request paths that need them; loaded up front here instead.
+HEAVY_MODULES = ('web3', 'eth_abi', 'eth_utils.abi', 'hexbytes', 'aiohttp')
+
+
+def warm_up(app):
+    """Do the first-request work of a worker once, before the server forks.
+
+    Imports the eth and aiohttp stacks, builds the Web3 client and contract
+    objects, resolves function selectors, loads the search index snapshot
+    and compiles every template, so workers forked afterwards (``gunicorn
+    --preload``) share the result instead of each paying for it on their
+    first request. Opens no connections and starts no threads or event loops.
+    """
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+    if rpc.urls:
+        rpc.build()
+        if rpc.marketplace is not None:
+            for item in rpc.marketplace_abi:
+                if item.get('type') == 'function' and item.get('stateMutability') in ('view', 'pure'):
+                    _function_info(rpc.marketplace, item['name'])
+        if rpc.call_cache is not None:
+            # Hashed on first access.
+            rpc.call_cache.immutable_selectors
+    metrics.resolve_functions()
+    search_index.load()
+
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        from app.api.views import _bootstrap_payload
+
+        _bootstrap_payload()
+    app.logger.info('Warm-up finished in %.0f ms', (time.perf_counter() - started) * 1000)
@@ -0,0 +1,252 @@
+"""Benchmark the marketplace, my-NFTs and proposals pages against local fake upstreams.
+
+    python -m benchmarks.app_bench [--listings 200] [--owned 300] [--requests 50]
+                                   [--rpc-latency 0.005] [--http-latency 0.02] [--async-views]
+                                   [--paged-reads] [--streaming]
+                                   [--output results.json] [--compare baseline.json]
+
+Each scenario gets a fresh app with empty caches. Its first request is the
+cold one and the remaining requests give the warm p50/p99; ``cold ttfb`` is
+how long the cold request took to send its first body chunk, which only
+differs from ``cold ms`` for streamed pages. Peak memory is
+that of a cold request, measured with tracemalloc in a separate app. Upstream calls are counted separately for the
+cold request and for the warm ones. ``--compare`` exits with status 1 when a
+scenario got slower (or made more upstream calls) than the baseline by more
+than ``--threshold``.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import MARKETPLACE, OWNER, FakeMonadRPC, FakeNFTHttp, Tokens, load_seed
+
+SCENARIOS = ('marketplace', 'mine', 'proposals')
+
+
+def make_app(rpc: FakeMonadRPC, http: FakeNFTHttp, directory: str, response_cache: bool, async_views: bool = False,
+             paged_reads: bool = False, streaming: bool = False):
+    import app.chain
+    from app import create_app, db
+    from config import TestingConfig, config
+
+    class BenchmarkConfig(TestingConfig):
+        SECRET_KEY = 'benchmark'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{directory}/app.sqlite'
+        MONAD_RPC_URL = rpc.url
+        MONAD_RPC_URLS = [rpc.url]
+        RPC_HEALTH_INTERVAL = 0
+        NFT_MARKETPLACE_CONTRACT_ADDRESS = MARKETPLACE
+        ALCHEMY_URL = f'{http.url}/nft/v3/benchmark/getNFTsForOwner'
+        METADATA_CACHE_PATH = f'{directory}/metadata-cache.sqlite'
+        RESPONSE_CACHE_PATH = f'{directory}/response-cache.sqlite'
+        RESPONSE_CACHE_TTL = TestingConfig.RESPONSE_CACHE_TTL if response_cache else 0
+        IMAGE_PROXY = False
+        IMAGE_CACHE_DIR = f'{directory}/image-cache'
+        MARKETPLACE_READ_SOURCE = 'chain'
+        SLOW_REQUEST_THRESHOLD = 0
+        ASYNC_VIEWS = async_views
+        MARKETPLACE_PAGED_READS = paged_reads
+        MARKETPLACE_STREAMING = streaming
+
+    config['benchmark'] = BenchmarkConfig
+    # The listed-set snapshot is per process; clear it so every scenario starts cold.
+    app.chain._listed_snapshot = (None, frozenset())
+    flask_app = create_app('benchmark')
+    with flask_app.app_context():
+        db.create_all()
+    return flask_app
+
+
+def _upstream(rpc: FakeMonadRPC, http: FakeNFTHttp) -> dict:
+    calls = {f'rpc.{name}': n for name, n in rpc.calls.items()}
+    calls.update({f'http.{name}': n for name, n in http.calls.items()})
+    return dict(sorted(calls.items()))
+
+
+def _summary(calls: dict) -> dict:
+    return {
+        'rpc_http_requests': calls.get('rpc.http', 0),
+        'rpc_calls': sum(n for name, n in calls.items()
+                         if name.startswith('rpc.') and name != 'rpc.http' and ':' not in name),
+        'http_requests': sum(n for name, n in calls.items() if name.startswith('http.')),
+    }
+
+
+def _cold_client(name: str, rpc: FakeMonadRPC, http: FakeNFTHttp, directory: str, args):
+    client = make_app(rpc, http, directory, args.response_cache, args.async_views, args.paged_reads,
+                      args.streaming).test_client()
+    if name == 'mine':
+        with client.session_transaction() as session:
+            session['wallet_address'] = OWNER.lower()
+    rpc.reset()
+    http.reset()
+    return client
+
+
+def _get(client, name: str, path: str) -> float:
+    """Fetch ``path`` and return the seconds until its first body chunk."""
+    started = time.perf_counter()
+    response = client.get(path, buffered=False)
+    first_byte = None
+    body = []
+    try:
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            body.append(chunk)
+    finally:
+        response.close()
+    if response.status_code != 200:
+        text = b''.join(c if isinstance(c, bytes) else c.encode() for c in body).decode(errors='replace')
+        raise RuntimeError(f'{name}: {path} returned {response.status_code}: {text[:200]}')
+    return first_byte or 0.0
+
+
+def run_scenario(name: str, path: str, args, rpc: FakeMonadRPC, http: FakeNFTHttp) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        client = _cold_client(name, rpc, http, directory, args)
+        started = time.perf_counter()
+        cold_ttfb_ms = _get(client, name, path) * 1000
+        cold_ms = (time.perf_counter() - started) * 1000
+        cold_calls = _upstream(rpc, http)
+
+        rpc.reset()
+        http.reset()
+        samples = []
+        for _ in range(max(args.requests - 1, 1)):
+            started = time.perf_counter()
+            _get(client, name, path)
+            samples.append((time.perf_counter() - started) * 1000)
+        warm_calls = _upstream(rpc, http)
+
+    # tracemalloc slows Python down several times, so memory gets its own cold run.
+    with tempfile.TemporaryDirectory() as directory:
+        client = _cold_client(name, rpc, http, directory, args)
+        tracemalloc.start()
+        try:
+            _get(client, name, path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    samples.sort()
+    return {
+        'path': path,
+        'cold_ms': round(cold_ms, 2),
+        'cold_ttfb_ms': round(cold_ttfb_ms, 2),
+        'p50_ms': round(statistics.median(samples), 2),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        'peak_kib': round(peak / 1024),
+        'cold': {**_summary(cold_calls), 'calls': cold_calls},
+        'warm': {**_summary(warm_calls), 'requests': len(samples), 'calls': warm_calls},
+    }
+
+
+def run(args) -> dict:
+    seed = load_seed(args.seed)
+    listed = Tokens(seed, args.listings)
+    owned = Tokens(seed, args.owned)
+    http = FakeNFTHttp(listed, owned.raw, latency=args.http_latency).start()
+    rpc = FakeMonadRPC(listed, http.url, proposals=args.proposals, latency=args.rpc_latency).start()
+    contract, token_id = listed.items[0]
+    paths = {
+        'marketplace': '/nfts/marketplace-data',
+        'mine': '/nfts/mine',
+        'proposals': f'/nfts/view-proposals/{contract}/{token_id}',
+    }
+    try:
+        scenarios = {name: run_scenario(name, paths[name], args, rpc, http) for name in args.scenarios}
+    finally:
+        rpc.stop()
+        http.stop()
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'listings': args.listings,
+            'owned': args.owned,
+            'proposals': args.proposals,
+            'requests': args.requests,
+            'rpc_latency': args.rpc_latency,
+            'http_latency': args.http_latency,
+            'response_cache': args.response_cache,
+            'async_views': args.async_views,
+            'paged_reads': args.paged_reads,
+            'streaming': args.streaming,
+        },
+        'scenarios': scenarios,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        metrics = [(key, current[key], before[key]) for key in ('cold_ms', 'p50_ms', 'p99_ms', 'peak_kib')]
+        # Warm calls are compared per request, so runs with different --requests still line up.
+        metrics += [(f'{phase}.{key}', round(current[phase][key] / current[phase].get('requests', 1), 2),
+                     round(before[phase][key] / before[phase].get('requests', 1), 2))
+                    for phase in ('cold', 'warm') for key in ('rpc_calls', 'http_requests')]
+        for key, now, then in metrics:
+            if now > then * (1 + threshold) and now - then > 0.5:
+                regressions.append(f'{name} {key}: {then} -> {now}')
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'scenario':<12}{'cold ms':>10}{'cold ttfb':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>10}"
+          f"{'cold rpc/http':>15}{'warm rpc/http':>15}")
+    for name, r in results['scenarios'].items():
+        warm = r['warm']
+        print(f"{name:<12}{r['cold_ms']:>10}{r.get('cold_ttfb_ms', ''):>10}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['peak_kib']:>10}"
+              f"{r['cold']['rpc_calls']:>9}/{r['cold']['http_requests']:<5}"
+              f"{warm['rpc_calls'] / warm['requests']:>9.1f}/{warm['http_requests'] / warm['requests']:<5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--listings', type=int, default=200, help='tokens listed on the fake marketplace')
+    parser.add_argument('--owned', type=int, default=300, help='NFTs the fake Alchemy API returns for the wallet')
+    parser.add_argument('--proposals', type=int, default=5, help='proposals per NFT')
+    parser.add_argument('--requests', type=int, default=50, help='requests per scenario, the first one cold')
+    parser.add_argument('--rpc-latency', type=float, default=0.005, help='seconds added to each RPC HTTP request')
+    parser.add_argument('--http-latency', type=float, default=0.02, help='seconds added to each metadata/Alchemy request')
+    parser.add_argument('--no-response-cache', dest='response_cache', action='store_false',
+                        help='disable the page data cache so warm requests rebuild too')
+    parser.add_argument('--async-views', action='store_true',
+                        help='run with ASYNC_VIEWS so batches and metadata go through the shared event loop')
+    parser.add_argument('--paged-reads', action='store_true',
+                        help='run with MARKETPLACE_PAGED_READS so listings come from getListings pages')
+    parser.add_argument('--streaming', action='store_true',
+                        help='run with MARKETPLACE_STREAMING so the marketplace page is streamed card by card')
+    parser.add_argument('--seed', help='getNFTsForOwner JSON to seed tokens from (default: nfts.json)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --output run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression for --compare')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
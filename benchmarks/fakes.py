@@ -0,0 +1,265 @@
+"""Local stand-ins for the Monad RPC, tokenURI hosts and the Alchemy NFT API.
+
+Both servers are seeded from ``nfts.json`` (a captured ``getNFTsForOwner``
+response), count every upstream request they answer, and can add a fixed
+latency to each HTTP request to imitate a remote endpoint.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKETPLACE = '0x02F54869f96E809828d68c3D6D88482d00Aa08ae'
+OWNER = '0x2222222222222222222222222222222222222222'
+PROPOSER = '0x3333333333333333333333333333333333333333'
+CHAIN_ID = 10143
+
+
+def _selector(signature: str) -> str:
+    return Web3.keccak(text=signature).hex().removeprefix('0x')[:8]
+
+
+def load_seed(path: str = None) -> list:
+    """ERC721 entries of ``nfts.json`` as ``(checksum contract, token id, metadata, raw entry)``."""
+    with open(path or os.path.join(BASE_DIR, 'nfts.json')) as f:
+        owned = json.load(f)['ownedNfts']
+    seed = []
+    for nft in owned:
+        if nft.get('tokenType') != 'ERC721':
+            continue
+        raw = nft.get('raw') or {}
+        metadata = raw.get('metadata')
+        metadata = dict(metadata) if isinstance(metadata, dict) else {}
+        if not metadata.get('image'):
+            metadata = dict(metadata, image=(nft.get('image') or {}).get('originalUrl'))
+        metadata.setdefault('name', nft.get('name'))
+        seed.append((Web3.to_checksum_address(nft['contract']['address']), int(nft['tokenId']), metadata, nft))
+    return seed
+
+
+class Tokens:
+    """``count`` tokens cycled from the seed; repeats get token ids shifted by ``2**200``."""
+
+    def __init__(self, seed: list, count: int):
+        self.items = []
+        self.metadata = {}
+        self.raw = []
+        for i in range(count):
+            contract, token_id, metadata, raw = seed[i % len(seed)]
+            token_id += (i // len(seed)) << 200
+            self.items.append((contract, token_id))
+            self.metadata[(contract.lower(), token_id)] = metadata
+            self.raw.append(dict(raw, tokenId=str(token_id)))
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # A deep accept backlog, so bursts of concurrent clients are not reset.
+    request_queue_size = 1024
+
+
+class _Server:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.httpd = None
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.calls[name] += n
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._respond(self, 'GET')
+
+            def do_POST(self):
+                server._respond(self, 'POST')
+
+            def log_message(self, *args):
+                pass
+
+        Handler.protocol_version = 'HTTP/1.1'
+        self.httpd = _HTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    def _respond(self, handler, method: str):
+        if self.latency:
+            time.sleep(self.latency)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        status, payload = self.handle(method, handler.path, body)
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def handle(self, method: str, path: str, body: bytes):
+        raise NotImplementedError
+
+
+class FakeMonadRPC(_Server):
+    """JSON-RPC node serving the marketplace and ERC721 contracts for ``tokens``.
+
+    ``calls`` counts HTTP requests under ``http`` and each JSON-RPC call
+    (batched ones included) under its method, with ``eth_call`` further
+    split by function name.
+    """
+
+    def __init__(self, tokens: Tokens, metadata_url: str, proposals: int = 5,
+                 block_number: int = 1_000_000, latency: float = 0.0):
+        super().__init__(latency)
+        self.tokens = tokens
+        self.metadata_url = metadata_url
+        self.proposals = proposals
+        self.block_number = block_number
+        self.calls_by_selector = {
+            _selector(sig): name for sig, name in (
+                ('getAllListedNFTs()', 'getAllListedNFTs'),
+                ('getPrice(address,uint256)', 'getPrice'),
+                ('getProposalsForNFT(address,uint256)', 'getProposalsForNFT'),
+                ('getListingCount()', 'getListingCount'),
+                ('getListings(uint256,uint256)', 'getListings'),
+                ('symbol()', 'symbol'),
+                ('name()', 'name'),
+                ('tokenURI(uint256)', 'tokenURI'),
+                ('ownerOf(uint256)', 'ownerOf'),
+            )
+        }
+
+    def handle(self, method, path, body):
+        self.count('http')
+        request = json.loads(body)
+        if isinstance(request, list):
+            return 200, [self._call(r) for r in request]
+        return 200, self._call(request)
+
+    def _call(self, request: dict) -> dict:
+        method, params = request['method'], request.get('params', [])
+        self.count(method)
+        try:
+            result = self._dispatch(method, params)
+        except ValueError as exc:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': 3, 'message': str(exc)}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def _dispatch(self, method: str, params: list):
+        if method == 'eth_chainId':
+            return hex(CHAIN_ID)
+        if method == 'net_version':
+            return str(CHAIN_ID)
+        if method == 'eth_blockNumber':
+            return hex(self.block_number)
+        if method == 'eth_getLogs':
+            return []
+        if method == 'eth_getBlockByNumber':
+            number = self.block_number if params[0] == 'latest' else int(params[0], 16)
+            return self._block(number)
+        if method == 'eth_call':
+            return '0x' + self._eth_call(params[0]['to'], params[0]['data']).hex()
+        raise ValueError(f'unsupported method {method}')
+
+    def _eth_call(self, to: str, data: str) -> bytes:
+        name = self.calls_by_selector.get(data[2:10])
+        if name is None:
+            raise ValueError('execution reverted')
+        self.count(f'eth_call:{name}')
+        args = bytes.fromhex(data[10:])
+        if name == 'getAllListedNFTs':
+            return encode(['address[]', 'uint256[]'], [
+                [contract for contract, _ in self.tokens.items],
+                [token_id for _, token_id in self.tokens.items],
+            ])
+        if name == 'getPrice':
+            _, token_id = decode(['address', 'uint256'], args)
+            return encode(['uint256'], [self._price(token_id)])
+        if name == 'getListingCount':
+            return encode(['uint256'], [len(self.tokens.items)])
+        if name == 'getListings':
+            offset, limit = decode(['uint256', 'uint256'], args)
+            best_offer = self.proposals * 10 ** 15 if self.proposals else 0
+            return encode(['(address,uint256,uint256,address,uint256,uint256)[]'], [[
+                (contract, token_id, self._price(token_id), OWNER, self.proposals, best_offer)
+                for contract, token_id in self.tokens.items[offset:offset + min(limit, 100)]
+            ]])
+        if name == 'getProposalsForNFT':
+            return encode(['address[]', 'uint256[]'], [
+                [PROPOSER] * self.proposals,
+                [(i + 1) * 10 ** 15 for i in range(self.proposals)],
+            ])
+        if name in ('symbol', 'name'):
+            return encode(['string'], ['BENCH'])
+        (token_id,) = decode(['uint256'], args)
+        if name == 'ownerOf':
+            return encode(['address'], [OWNER])
+        return encode(['string'], [f'{self.metadata_url}/meta/{to.lower()}/{token_id}'])
+
+    @staticmethod
+    def _price(token_id: int) -> int:
+        return (token_id % 1000 + 1) * 10 ** 16
+
+    @staticmethod
+    def _block(number: int) -> dict:
+        zero = lambda n: '0x' + '00' * n
+        return {
+            'number': hex(number), 'hash': Web3.keccak(text=str(number)).hex(), 'parentHash': zero(32),
+            'timestamp': hex(1_700_000_000 + number), 'transactions': [], 'gasLimit': '0x0', 'gasUsed': '0x0',
+            'miner': zero(20), 'difficulty': '0x0', 'extraData': '0x', 'logsBloom': zero(256),
+            'nonce': zero(8), 'sha3Uncles': zero(32), 'stateRoot': zero(32), 'transactionsRoot': zero(32),
+            'receiptsRoot': zero(32), 'size': '0x0', 'uncles': [], 'mixHash': zero(32), 'baseFeePerGas': '0x0',
+        }
+
+
+class FakeNFTHttp(_Server):
+    """tokenURI metadata at ``/meta/<contract>/<token id>`` and Alchemy ``getNFTsForOwner`` at ``/nft/v3/<key>/...``."""
+
+    def __init__(self, tokens: Tokens = None, owned: list = None, latency: float = 0.0):
+        super().__init__(latency)
+        self.tokens = tokens
+        self.owned = owned or []
+
+    def handle(self, method, path, body):
+        url = urlparse(path)
+        if url.path.startswith('/meta/'):
+            self.count('metadata')
+            _, _, contract, token_id = url.path.split('/')
+            metadata = self.tokens.metadata.get((contract, int(token_id)))
+            if metadata is None:
+                return 404, {'error': 'unknown token'}
+            return 200, metadata
+        if url.path.endswith('/getNFTsForOwner'):
+            self.count('alchemy')
+            query = parse_qs(url.query)
+            size = int(query.get('pageSize', ['100'])[0])
+            start = int(query.get('pageKey', ['0'])[0])
+            page = self.owned[start:start + size]
+            next_key = str(start + size) if start + size < len(self.owned) else None
+            return 200, {'ownedNfts': page, 'totalCount': len(self.owned), 'pageKey': next_key}
+        self.count('not_found')
+        return 404, {'error': 'not found'}
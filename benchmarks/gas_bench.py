@@ -0,0 +1,164 @@
+"""Compare marketplace gas costs before and after a contract change on a local EVM.
+
+    python -m benchmarks.gas_bench [--sizes 10,1000,10000] [--baseline old.vy] [--output gas.json]
+
+Both versions of ``contracts/NFTMarketplace.vy`` are deployed on titanoboa's
+in-process EVM next to a minimal ERC721. For every size N the marketplace is
+filled with N listings, and unlisting, buying and accepting a proposal on the
+middle listing are measured, along with cancelling the middle one of
+min(N, 1000) proposals on a single token. Figures are execution gas as
+reported by the EVM, without the 21k intrinsic transaction cost. The
+baseline defaults to the previous committed revision of the contract.
+Needs ``pip install titanoboa`` and vyper 0.4.3.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import boa
+except ImportError:  # titanoboa is only needed for this benchmark
+    boa = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTRACT = 'contracts/NFTMarketplace.vy'
+PRICE = 10 ** 15
+MAX_PROPOSALS = 1000
+
+MOCK_ERC721 = """
+# @version 0.4.3
+default_owner: public(address)
+owners: HashMap[uint256, address]
+
+@deploy
+def __init__(owner: address):
+    self.default_owner = owner
+
+@view
+@external
+def ownerOf(tokenId: uint256) -> address:
+    owner: address = self.owners[tokenId]
+    if owner == empty(address):
+        return self.default_owner
+    return owner
+
+@view
+@external
+def getApproved(tokenId: uint256) -> address:
+    return empty(address)
+
+@view
+@external
+def isApprovedForAll(owner: address, operator: address) -> bool:
+    return True
+
+@external
+def transferFrom(sender: address, receiver: address, tokenId: uint256):
+    self.owners[tokenId] = receiver
+"""
+
+
+def baseline_source(path: str = None) -> str:
+    """The contract at ``path``, or the last committed revision before the current one."""
+    if path:
+        with open(path) as f:
+            return f.read()
+    revisions = subprocess.run(['git', 'log', '-n', '2', '--format=%H', '--', CONTRACT],
+                               cwd=ROOT, check=True, capture_output=True, text=True).stdout.split()
+    # With uncommitted edits the latest commit is the baseline; otherwise the one before it.
+    dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD', '--', CONTRACT], cwd=ROOT).returncode != 0
+    revision = revisions[0] if dirty else revisions[-1]
+    return subprocess.run(['git', 'show', f'{revision}:{CONTRACT}'],
+                          cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+
+def gas_of(contract, fn: str, *args, **kwargs) -> int:
+    getattr(contract, fn)(*args, **kwargs)
+    return contract._computation.get_gas_used()
+
+
+def measure(source: str, sizes: list, progress=None) -> dict:
+    """``{N: {operation: gas}}`` for one version of the marketplace."""
+    seller = boa.env.generate_address('seller')
+    boa.env.eoa = seller
+    nft = boa.loads(MOCK_ERC721, seller)
+    market = boa.loads(source)
+    results = {}
+    listed = 0
+    for size in sorted(sizes):
+        for token_id in range(listed, size - 1):
+            market.setNFTPrice(nft.address, token_id, PRICE)
+        listed = size
+        middle = size // 2
+        proposers = min(size, MAX_PROPOSALS)
+        # The N-th listing is the measured one, so a full 10k marketplace still has room for it.
+        row = {'setNFTPrice (new listing)': gas_of(market, 'setNFTPrice', nft.address, size - 1, PRICE)}
+        with boa.env.anchor():
+            row['unlistNFT'] = gas_of(market, 'unlistNFT', nft.address, middle)
+        with boa.env.anchor():
+            buyer = boa.env.generate_address('buyer')
+            boa.env.set_balance(buyer, PRICE)
+            with boa.env.prank(buyer):
+                row['buyNFT'] = gas_of(market, 'buyNFT', nft.address, middle, value=PRICE)
+        with boa.env.anchor():
+            buyer = boa.env.generate_address('bidder')
+            boa.env.set_balance(buyer, PRICE)
+            with boa.env.prank(buyer):
+                market.proposeNFTPrice(nft.address, middle, PRICE, value=PRICE)
+            row['acceptNFTProposal (1 proposal)'] = gas_of(market, 'acceptNFTProposal', nft.address, middle, buyer)
+        with boa.env.anchor():
+            bidders = []
+            for _ in range(proposers):
+                bidder = boa.env.generate_address()
+                boa.env.set_balance(bidder, PRICE)
+                with boa.env.prank(bidder):
+                    market.proposeNFTPrice(nft.address, middle, PRICE, value=PRICE)
+                bidders.append(bidder)
+            with boa.env.prank(bidders[proposers // 2]):
+                row[f'cancelProposalNFTPrice (middle of {proposers})'] = gas_of(
+                    market, 'cancelProposalNFTPrice', nft.address, middle)
+        results[size] = row
+        if progress:
+            progress(size)
+    return results
+
+
+def print_table(before: dict, after: dict):
+    print(f"{'N':>6}  {'operation':<42} {'before':>12} {'after':>12} {'change':>8}")
+    for size in sorted(before):
+        for name, old in before[size].items():
+            new = after[size][name]
+            print(f"{size:>6}  {name:<42} {old:>12,} {new:>12,} {(new - old) / old:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,1000,10000', help='comma-separated listing counts')
+    parser.add_argument('--baseline', help='contract source to compare against (default: previous git revision)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+    if boa is None:
+        sys.exit('This benchmark needs titanoboa and vyper 0.4.3 (pip install titanoboa)')
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    with open(os.path.join(ROOT, CONTRACT)) as f:
+        current = f.read()
+    variants = {'before': baseline_source(args.baseline), 'after': current}
+    results = {}
+    for name, source in variants.items():
+        started = time.perf_counter()
+        with boa.env.anchor():
+            results[name] = measure(source, sizes, lambda size: print(f'{name}: {size} listings', file=sys.stderr))
+        print(f'{name}: measured in {time.perf_counter() - started:.0f}s', file=sys.stderr)
+
+    print_table(results['before'], results['after'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({name: {str(size): row for size, row in rows.items()} for name, rows in results.items()}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Compare the legacy and the tuned database schema on a synthetic marketplace.
+
+    python -m benchmarks.schema_bench [--rows 100000] [--json]
+
+"legacy" is the schema before exact wei columns: float prices, no covering
+indexes for token lookups or offers, and SQLite's default rollback journal
+with ``synchronous=FULL``. "tuned" uses the ``*_wei`` columns, the
+composite indexes and the WAL pragmas from ``config.py``.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert, select, text
+from sqlalchemy.orm import Session
+
+from app import db
+from app.database import sqlite_pragmas
+from app.model import NFT, Offer, User
+
+NEW_INDEXES = (
+    'ix_nft_token', 'ix_nft_owner', 'ix_nft_collection_listed_price_wei', 'ix_nft_listed_price_wei',
+    'ix_nft_listed_block', 'ix_offer_nft_status_price', 'ix_offer_buyer_status',
+)
+VARIANTS = {
+    'legacy': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_CACHE_SIZE': 2000},
+    'tuned': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL',
+              'SQLITE_CACHE_SIZE': 65536, 'SQLITE_MMAP_SIZE': 256 * 1024 * 1024},
+}
+WEI = 10 ** 18
+
+
+def make_engine(path: str, pragmas: dict):
+    engine = create_engine(f'sqlite:///{path}')
+    statements = sqlite_pragmas(pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(f'PRAGMA {statement}')
+        cursor.close()
+
+    return engine
+
+
+def seed(engine, rows: int, legacy: bool, rng: random.Random):
+    db.metadata.create_all(engine, tables=[User.__table__, NFT.__table__, Offer.__table__])
+    with engine.begin() as conn:
+        if legacy:
+            for name in NEW_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+            # The float column's collection index, which the wei one replaced.
+            conn.execute(text('CREATE INDEX ix_nft_collection_listed_price ON nft (contract_address, listed, price)'))
+        users = [{'id': i + 1, 'wallet_address': f'0x{i + 1:040x}'} for i in range(rows // 20)]
+        conn.execute(insert(User.__table__), users)
+        nfts = []
+        for i in range(rows):
+            listed = rng.random() < 0.3
+            price_wei = rng.randrange(1, 10_000) * WEI // 100 if listed else None
+            nfts.append({
+                'id': i + 1, 'token_id': i, 'contract_address': f'0x{i % 50:040x}',
+                'owner_id': rng.randrange(len(users)) + 1, 'listed': listed,
+                'listed_block': i if listed else None,
+                'price': price_wei / WEI if listed else None,
+                'price_wei': None if legacy else price_wei,
+                'offer_count': 0,
+            })
+        conn.execute(insert(NFT.__table__), nfts)
+        offers = []
+        for i in range(rows):
+            price_wei = rng.randrange(1, 10_000) * WEI // 1000
+            offers.append({
+                'nft_id': rng.randrange(rows) + 1, 'buyer_wallet': users[rng.randrange(len(users))]['wallet_address'],
+                'offer_price': price_wei / WEI, 'offer_price_wei': None if legacy else price_wei,
+                'status': 'pending' if rng.random() < 0.5 else 'cancelled',
+            })
+        conn.execute(insert(Offer.__table__), offers)
+        conn.execute(text('ANALYZE'))
+
+
+def queries(legacy: bool, rows: int):
+    price = NFT.price if legacy else NFT.price_wei
+    offer_price = Offer.offer_price if legacy else Offer.offer_price_wei
+    low, high = (10.0, 12.0) if legacy else (10 * WEI, 12 * WEI)
+    return {
+        'token_lookup': lambda rng: select(NFT.id).where(
+            NFT.contract_address == f'0x{(n := rng.randrange(rows)) % 50:040x}', NFT.token_id == n),
+        'collection_floor_page': lambda rng: select(NFT.id).where(
+            NFT.contract_address == f'0x{rng.randrange(50):040x}', NFT.listed.is_(True)
+        ).order_by(price.asc(), NFT.id.asc()).limit(25),
+        'price_range_page': lambda rng: select(NFT.id).where(
+            NFT.listed.is_(True), price >= low, price <= high).order_by(price.asc(), NFT.id.asc()).limit(25),
+        'recent_listings_page': lambda rng: select(NFT.id).where(NFT.listed.is_(True))
+        .order_by(NFT.listed_block.desc(), NFT.id.desc()).offset(rng.randrange(1000)).limit(25),
+        'token_pending_offers': lambda rng: select(Offer.id).where(
+            Offer.nft_id == rng.randrange(rows) + 1, Offer.status == 'pending').order_by(offer_price.desc()),
+        'buyer_pending_offers': lambda rng: select(Offer.id).where(
+            Offer.buyer_wallet == f'0x{rng.randrange(rows // 20) + 1:040x}', Offer.status == 'pending'),
+    }
+
+
+def timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def run_variant(name: str, rows: int, repeat: int, writes: int, directory: str) -> dict:
+    legacy = name == 'legacy'
+    rng = random.Random(42)
+    path = os.path.join(directory, f'{name}.sqlite')
+    engine = make_engine(path, VARIANTS[name])
+    started = time.perf_counter()
+    seed(engine, rows, legacy, rng)
+    results = {'seed_s': round(time.perf_counter() - started, 2)}
+
+    with Session(engine) as session:
+        for label, build in queries(legacy, rows).items():
+            results[label] = timed(lambda: session.execute(build(rng)).all(), repeat)
+
+        # One commit per indexed event, as the indexer does.
+        counter = iter(range(rows, rows + writes))
+
+        def write():
+            session.execute(NFT.__table__.update().where(NFT.id == rng.randrange(rows) + 1).values(
+                listed=True, listed_block=next(counter), price=1.5, price_wei=None if legacy else 3 * WEI // 2))
+            session.commit()
+
+        results['commit_per_event'] = timed(write, writes)
+    engine.dispose()
+    results['db_bytes'] = sum(
+        os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p)
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {name: run_variant(name, args.rows, args.repeat, args.writes, directory) for name in VARIANTS}
+
+    if args.json:
+        print(json.dumps({'rows': args.rows, 'results': results}, indent=2))
+        return
+    print(f"{'scenario':<24}{'legacy p50/p99 ms':>22}{'tuned p50/p99 ms':>22}")
+    for label, legacy in results['legacy'].items():
+        tuned = results['tuned'][label]
+        if isinstance(legacy, dict):
+            print(f"{label:<24}{legacy['p50_ms']:>12.3f} /{legacy['p99_ms']:>8.3f}"
+                  f"{tuned['p50_ms']:>12.3f} /{tuned['p99_ms']:>8.3f}")
+        else:
+            print(f"{label:<24}{legacy:>22}{tuned:>22}")
+
+
+if __name__ == '__main__':
+    main()
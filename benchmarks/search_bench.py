@@ -0,0 +1,135 @@
+"""Time the in-memory search index on a synthetic marketplace.
+
+    python -m benchmarks.search_bench [--tokens 50000] [--collections 40] [--queries 200] [--json]
+
+Builds the index from generated tokens (names, descriptions and 6 traits
+each, spread over ``--collections`` collections), then reports the build
+time, the snapshot size with its save and load times, incremental
+updates, and p50/p99 latency of typical queries with facet counts.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.search_index import SearchIndex, SearchQuery, make_document
+
+WORDS = ('ape', 'punk', 'cat', 'robot', 'dragon', 'wizard', 'ghost', 'pixel', 'cosmic', 'golden', 'shadow', 'neon',
+         'monad', 'frog', 'bear', 'knight', 'samurai', 'alien', 'crystal', 'lucky')
+TRAITS = {
+    'Background': ('Blue', 'Red', 'Gold', 'Purple', 'Green', 'Black', 'White', 'Orange'),
+    'Eyes': ('Laser', 'Sleepy', 'Wide', 'Angry', 'Closed', 'Wink', '3D', 'Hypnotic', 'Sad', 'Happy'),
+    'Hat': ('None', 'Cap', 'Crown', 'Beanie', 'Halo', 'Horns', 'Bandana', 'Top Hat', 'Helmet'),
+    'Mouth': ('Smile', 'Grin', 'Pipe', 'Bubblegum', 'Frown', 'Fangs'),
+    'Clothes': tuple(f'Outfit {i}' for i in range(40)),
+    'Rarity': ('Common', 'Uncommon', 'Rare', 'Epic', 'Legendary'),
+}
+QUERIES = {
+    'all': {},
+    'word': {'text': 'dragon'},
+    'prefix': {'text': 'dra'},
+    'two words': {'text': 'golden wiz'},
+    'trait': {'traits': {'Background': ['Gold']}},
+    'two traits': {'traits': {'Background': ['Gold', 'Red'], 'Hat': ['Crown']}},
+    'word + trait': {'text': 'punk', 'traits': {'Eyes': ['Laser']}},
+    'collection + trait': {'collection': None, 'traits': {'Rarity': ['Legendary']}},
+    'deep page': {'text': 'cat', 'offset': 2000},
+}
+
+
+def make_tokens(count: int, collections: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    contracts = [f'0x{rng.getrandbits(160):040x}' for _ in range(collections)]
+    docs = []
+    for token_id in range(count):
+        contract = contracts[token_id % collections]
+        name = f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} #{token_id}'
+        metadata = {
+            'name': name,
+            'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+            'attributes': [{'trait_type': trait, 'value': rng.choice(values)} for trait, values in TRAITS.items()],
+        }
+        docs.append(make_document(contract, token_id, f'COL{token_id % collections}', metadata,
+                                  f'https://ipfs.io/ipfs/{token_id}.png'))
+    return docs
+
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)
+
+
+def run(args) -> dict:
+    docs = make_tokens(args.tokens, args.collections)
+    index = SearchIndex()
+    started = time.perf_counter()
+    for doc in docs:
+        index.add(doc)
+    results = {'tokens': args.tokens, 'build_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'search-index.json.gz')
+        results['snapshot_save_ms'] = round(timed(lambda: index.save(path), 1)[0], 1)
+        results['snapshot_kib'] = round(os.path.getsize(path) / 1024)
+        results['snapshot_load_ms'] = round(timed(lambda: SearchIndex().load(path), 1)[0], 1)
+
+    # One refresh's worth of churn: 100 tokens unlisted and 100 listed.
+    churn = make_tokens(100, args.collections, seed=11)
+    for i, doc in enumerate(churn):
+        doc['token_id'] = args.tokens + i
+
+    def update():
+        for doc in docs[:100]:
+            index.remove(doc['contract_address'], doc['token_id'])
+        for doc in churn:
+            index.add(doc)
+        for doc in churn:
+            index.remove(doc['contract_address'], doc['token_id'])
+        for doc in docs[:100]:
+            index.add(doc)
+    results['update_200_ms'] = round(statistics.median(timed(update, 5)) / 2, 2)
+
+    queries = {}
+    for name, params in QUERIES.items():
+        if 'collection' in params:
+            params = dict(params, collection=docs[0]['contract_address'])
+        query = SearchQuery(**params)
+        samples = timed(lambda: index.search(query), args.queries)
+        queries[name] = {
+            'matches': index.search(query)['total'],
+            'p50_ms': round(statistics.median(samples), 2),
+            'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+        }
+    results['queries'] = queries
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=50000, help='listed tokens to index')
+    parser.add_argument('--collections', type=int, default=40)
+    parser.add_argument('--queries', type=int, default=200, help='repetitions per query')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['tokens']} tokens: build {results['build_ms']} ms, snapshot {results['snapshot_kib']} KiB "
+          f"(save {results['snapshot_save_ms']} ms, load {results['snapshot_load_ms']} ms), "
+          f"100 removes + 100 adds {results['update_200_ms']} ms")
+    print(f"{'query':<20}{'matches':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, r in results['queries'].items():
+        print(f"{name:<20}{r['matches']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Measure worker cold start: imports, app creation, warm-up and first requests.
+
+    python -m benchmarks.startup_bench [--runs 5] [--listings 50] [--output startup.json]
+
+Every run is a fresh Python process, as a newly started worker would be.
+It times ``import app``, ``create_app()``, the optional preload warm-up and
+then the first and second request to a few pages, against the same local
+fake RPC node and metadata server as ``app_bench``. Runs are done without
+and with ``warm_up`` (what ``PRELOAD_WARMUP`` runs before gunicorn forks)
+and the medians are reported, along with which heavy modules were already
+imported once the app was created.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('web3', 'eth_abi', 'eth_account', 'aiohttp', 'requests', 'sqlalchemy', 'PIL')
+MODES = {'lazy': [], 'warmup': ['--warmup']}
+
+
+def child(args):
+    """One worker start, run in its own interpreter; prints its timings as JSON."""
+    import tempfile
+
+    timings = {}
+    started = time.perf_counter()
+    from app import create_app, db
+    from config import TestingConfig, config
+    timings['import_ms'] = (time.perf_counter() - started) * 1000
+
+    directory = tempfile.mkdtemp(prefix='startup-bench-')
+
+    class StartupConfig(TestingConfig):
+        SECRET_KEY = 'benchmark'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{directory}/app.sqlite'
+        MONAD_RPC_URL = args.rpc_url
+        MONAD_RPC_URLS = [args.rpc_url]
+        RPC_HEALTH_INTERVAL = 0
+        NFT_MARKETPLACE_CONTRACT_ADDRESS = args.marketplace
+        METADATA_CACHE_PATH = f'{directory}/metadata-cache.sqlite'
+        RESPONSE_CACHE_PATH = f'{directory}/response-cache.sqlite'
+        RESPONSE_CACHE_TTL = 0
+        IMAGE_PROXY = False
+        MARKETPLACE_READ_SOURCE = 'chain'
+        SLOW_REQUEST_THRESHOLD = 0
+
+    config['startup'] = StartupConfig
+    phase = time.perf_counter()
+    flask_app = create_app('startup')
+    timings['create_app_ms'] = (time.perf_counter() - phase) * 1000
+    timings['loaded_after_create'] = [name for name in HEAVY_MODULES if name in sys.modules]
+    if args.warmup:
+        from app.warmup import warm_up
+        phase = time.perf_counter()
+        warm_up(flask_app)
+        timings['warmup_ms'] = (time.perf_counter() - phase) * 1000
+    timings['ready_ms'] = (time.perf_counter() - started) * 1000
+
+    with flask_app.app_context():
+        db.create_all()
+    client = flask_app.test_client()
+    for name, path in (('index', '/'), ('bootstrap', '/api/bootstrap'), ('marketplace', '/nfts/marketplace-data'),
+                       ('proposals', f'/nfts/view-proposals/{args.token_contract}/{args.token_id}')):
+        for attempt in ('first', 'second'):
+            phase = time.perf_counter()
+            response = client.get(path)
+            timings[f'{name}_{attempt}_ms'] = (time.perf_counter() - phase) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}')
+    print(json.dumps(timings))
+
+
+def run_mode(flags: list, args, rpc, token) -> list:
+    runs = []
+    for _ in range(args.runs):
+        command = [sys.executable, '-m', 'benchmarks.startup_bench', '--child', '--rpc-url', rpc.url,
+                   '--marketplace', args.marketplace, '--token-contract', token[0], '--token-id', str(token[1])]
+        started = time.perf_counter()
+        output = subprocess.run(command + flags, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings['process_ms'] = (time.perf_counter() - started) * 1000
+        runs.append(timings)
+    return runs
+
+
+def summarize(runs: list) -> dict:
+    summary = {key: round(statistics.median(run[key] for run in runs), 1)
+               for key in runs[0] if key.endswith('_ms')}
+    summary['loaded_after_create'] = runs[0]['loaded_after_create']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per mode')
+    parser.add_argument('--listings', type=int, default=50, help='tokens listed on the fake marketplace')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warmup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--rpc-url', help=argparse.SUPPRESS)
+    parser.add_argument('--marketplace', help=argparse.SUPPRESS)
+    parser.add_argument('--token-contract', help=argparse.SUPPRESS)
+    parser.add_argument('--token-id', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    # Imported here: the child processes must not inherit web3 from the fakes.
+    from benchmarks.fakes import MARKETPLACE, FakeMonadRPC, FakeNFTHttp, Tokens, load_seed
+
+    args.marketplace = MARKETPLACE
+    listed = Tokens(load_seed(), args.listings)
+    http = FakeNFTHttp(listed).start()
+    rpc = FakeMonadRPC(listed, http.url).start()
+    try:
+        results = {mode: summarize(run_mode(MODES[mode], args, rpc, listed.items[0])) for mode in args.modes}
+    finally:
+        rpc.stop()
+        http.stop()
+
+    # Only warm-up runs have a warmup_ms column.
+    keys = list(max(results.values(), key=len))
+    print(f"{'median ms':<24}" + ''.join(f'{mode:>12}' for mode in results))
+    for key in keys:
+        if key.endswith('_ms'):
+            print(f'{key[:-3]:<24}' + ''.join(f"{results[mode].get(key, ''):>12}" for mode in results))
+    for mode, summary in results.items():
+        print(f"{mode}: loaded after create_app: {', '.join(summary['loaded_after_create']) or '-'}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""List, reprice, unlist or approve many NFTs from one account.
+
+    python bulk_tx.py manifest.csv [--dry-run] [--max-pending 32] [--output results.jsonl]
+
+The manifest is a CSV file with a header row, or a JSON list of objects,
+with the columns ``action`` (list, set_price, unlist, approve, approve_all),
+``contract``, ``token_id`` and, for list/set_price, ``price`` in MON or
+``price_wei``. Transactions are signed with ``PRIVATE_KEY`` and sent to the
+marketplace at ``NFT_MARKETPLACE_CONTRACT_ADDRESS`` over ``MONAD_RPC_URL``.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import Counter
+
+from dotenv import load_dotenv
+from eth_account import Account
+from web3 import Web3
+
+from app.bulk_tx import BulkSender, ManifestError, load_manifest
+from app.rpc import RPCClient, client_from_env
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('manifest', help='CSV or JSON file of operations')
+    parser.add_argument('--rpc-url', help='JSON-RPC endpoint (default: MONAD_RPC_URLS / MONAD_RPC_URL)')
+    parser.add_argument('--marketplace', default=os.environ.get('NFT_MARKETPLACE_CONTRACT_ADDRESS'),
+                        help='marketplace contract address')
+    parser.add_argument('--dry-run', action='store_true', help='validate and estimate gas without sending')
+    parser.add_argument('--max-pending', type=int, default=32, help='unmined transactions in flight at once')
+    parser.add_argument('--gas-price-gwei', type=float, help='fixed gas price (default: eth_gasPrice)')
+    parser.add_argument('--gas-margin', type=float, default=1.2, help='multiplier on each gas estimate')
+    parser.add_argument('--fallback-gas', type=int,
+                        help='gas limit to use when estimation reverts, e.g. before a pending approval is mined')
+    parser.add_argument('--replace-after', type=float, default=60, help='seconds before a stuck tx is re-sent')
+    parser.add_argument('--max-replacements', type=int, default=3)
+    parser.add_argument('--price-bump', type=float, default=1.125, help='gas price multiplier per replacement')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between receipt polls')
+    parser.add_argument('--output', help='write one JSON result per operation to this file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    try:
+        operations = load_manifest(args.manifest)
+    except (OSError, ManifestError) as e:
+        sys.exit(f'Invalid manifest: {e}')
+    private_key = os.environ.get('PRIVATE_KEY')
+    if not private_key:
+        sys.exit('PRIVATE_KEY is not set')
+    if not args.marketplace:
+        sys.exit('Marketplace address missing (set NFT_MARKETPLACE_CONTRACT_ADDRESS or --marketplace)')
+
+    abi_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contracts', 'NFTMarketplace.abi.json')
+    if args.rpc_url:
+        client = RPCClient().configure([args.rpc_url], args.marketplace, abi_path)
+    else:
+        client = client_from_env(args.marketplace, abi_path)
+    w3 = client.get_w3()
+    account = Account.from_key(private_key)
+    sender = BulkSender(
+        w3, account, client.get_marketplace(),
+        max_pending=args.max_pending,
+        gas_margin=args.gas_margin,
+        gas_price=Web3.to_wei(args.gas_price_gwei, 'gwei') if args.gas_price_gwei else None,
+        fallback_gas=args.fallback_gas,
+        replace_after=args.replace_after,
+        max_replacements=args.max_replacements,
+        price_bump=args.price_bump,
+        poll_interval=args.poll_interval,
+    )
+    print(f"{len(operations)} operations from {account.address}")
+
+    output = open(args.output, 'w') if args.output else None
+
+    def report(op):
+        print(f"line {op.line} {op.action} {op.contract} #{op.token_id}: {op.status}"
+              + (f" {op.tx_hash}" if op.tx_hash else '') + (f" ({op.error})" if op.error else ''))
+        if output:
+            output.write(json.dumps(op.to_dict()) + '\n')
+            output.flush()
+
+    try:
+        if args.dry_run:
+            for op in sender.estimate(operations):
+                report(op)
+        else:
+            sender.run(operations, on_update=report)
+    finally:
+        if output:
+            output.close()
+
+    totals = Counter(op.status for op in operations)
+    print(', '.join(f'{status}: {n}' for status, n in sorted(totals.items())))
+    if set(totals) - {'mined', 'estimated'}:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,28 @@ class Config:
     BOOTSTRAP_BOOTSWATCH_THEME  = 'pulse'
     ALCHEMY_API_KEY = os.environ.get('ALCHEMY_API_KEY')
     ALCHEMY_URL = f"https://monad-testnet.g.alchemy.com/nft/v3/{ALCHEMY_API_KEY}/getNFTsForOwner"
+    # /nfts/mine: Alchemy page size and per-wallet cache (dropped on the wallet's next Transfer)
+    OWNED_NFTS_PAGE_SIZE = int(os.environ.get('OWNED_NFTS_PAGE_SIZE', 100))
+    OWNED_NFTS_CACHE_SIZE = int(os.environ.get('OWNED_NFTS_CACHE_SIZE', 512))
+    OWNED_NFTS_CACHE_TTL = int(os.environ.get('OWNED_NFTS_CACHE_TTL', 600))
+    # Max blocks per eth_getLogs request when checking a cached wallet for Transfers
+    OWNED_NFTS_LOG_RANGE = int(os.environ.get('OWNED_NFTS_LOG_RANGE', 100))
     NFT_MARKETPLACE_CONTRACT_ADDRESS = os.environ.get('NFT_MARKETPLACE_CONTRACT_ADDRESS')
     # Prefer MONAD_RPC_URL, fallback to MONAD_RPC for compatibility
     MONAD_RPC_URL = os.environ.get('MONAD_RPC_URL') or os.environ.get('MONAD_RPC')
+    # Optional comma-separated failover list for server-side reads; defaults to MONAD_RPC_URL
+    MONAD_RPC_URLS = [u.strip() for u in (os.environ.get('MONAD_RPC_URLS') or MONAD_RPC_URL or '').split(',') if u.strip()]
+    RPC_TIMEOUT = float(os.environ.get('RPC_TIMEOUT', 15))
+    RPC_POOL_SIZE = int(os.environ.get('RPC_POOL_SIZE', 32))
+    # Seconds before a slow read is also sent to the next endpoint (0 disables hedging)
+    RPC_HEDGE_DELAY = float(os.environ.get('RPC_HEDGE_DELAY', 0))
+    RPC_HEALTH_INTERVAL = float(os.environ.get('RPC_HEALTH_INTERVAL', 30))
+    # Block-aware eth_call cache; immutable calls are cached forever, the rest per block
+    RPC_CALL_CACHE = os.environ.get('RPC_CALL_CACHE', '1') not in ('0', 'false', 'False')
+    RPC_HEAD_TTL = float(os.environ.get('RPC_HEAD_TTL', 1.0))
+    RPC_IMMUTABLE_CALLS = [s.strip() for s in os.environ.get(
+        'RPC_IMMUTABLE_CALLS', 'symbol();name();decimals()'
+    ).split(';') if s.strip()]
     MONAD_CHAIN_ID = os.environ.get('MONAD_CHAIN_ID', 10143)
     MONAD_CHAIN_NAME = os.environ.get('MONAD_CHAIN_NAME', 'Monad Testnet')
     MONAD_NATIVE_NAME = os.environ.get('MONAD_NATIVE_NAME', 'Monad')
@@ -22,6 +41,88 @@ class Config:
     MONAD_NATIVE_DECIMALS = os.environ.get('MONAD_NATIVE_DECIMALS', 18)
     MONAD_EXPLORER_URL = os.environ.get('MONAD_EXPLORER_URL', 'https://testnet.monadexplorer.com/')
     MONAD_BLOCK_GAS_LIMIT = os.environ.get('MONAD_BLOCK_GAS_LIMIT', 150000000)
+    # Seconds per block, for turning cache lifetimes into block counts
+    MONAD_BLOCK_TIME = float(os.environ.get('MONAD_BLOCK_TIME', 0.4))
+    # Max eth_calls per JSON-RPC batch when reading marketplace listings
+    RPC_BATCH_SIZE = int(os.environ.get('RPC_BATCH_SIZE', 100))
+    # tokenURI metadata cache (in-process LRU + SQLite file shared by workers)
+    METADATA_CACHE_PATH = os.environ.get('METADATA_CACHE_PATH') or \
+        os.path.join(base_dir, 'metadata-cache.sqlite')
+    METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 2048))
+    METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 86400))
+    METADATA_NEGATIVE_TTL = int(os.environ.get('METADATA_NEGATIVE_TTL', 300))
+    # IPFS gateways raced for tokenURI metadata; the first one is also used for image links
+    IPFS_GATEWAYS = [g.strip() for g in os.environ.get(
+        'IPFS_GATEWAYS', 'https://ipfs.io/ipfs/,https://dweb.link/ipfs/,https://gateway.pinata.cloud/ipfs/'
+    ).split(',') if g.strip()]
+    METADATA_FETCH_CONCURRENCY = int(os.environ.get('METADATA_FETCH_CONCURRENCY', 32))
+    METADATA_FETCH_PER_HOST = int(os.environ.get('METADATA_FETCH_PER_HOST', 8))
+    METADATA_FETCH_TIMEOUT = float(os.environ.get('METADATA_FETCH_TIMEOUT', 15))
+    # /nfts/image thumbnail proxy (needs Pillow); originals and thumbnails live under IMAGE_CACHE_DIR
+    IMAGE_PROXY = os.environ.get('IMAGE_PROXY', '1') not in ('0', 'false', 'False')
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR') or os.path.join(base_dir, 'image-cache')
+    IMAGE_THUMB_SIZE = int(os.environ.get('IMAGE_THUMB_SIZE', 512))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 4))
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+    IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 15))
+    IMAGE_RETRY_AFTER = int(os.environ.get('IMAGE_RETRY_AFTER', 3600))
+    # Image keys a worker remembers as registered, so rendering them again writes nothing
+    IMAGE_KEY_CACHE_SIZE = int(os.environ.get('IMAGE_KEY_CACHE_SIZE', 10000))
+    # Event indexer (indexer.py); set the start block to the marketplace deploy block
+    INDEXER_START_BLOCK = int(os.environ.get('INDEXER_START_BLOCK', 0))
+    INDEXER_CHUNK_SIZE = int(os.environ.get('INDEXER_CHUNK_SIZE', 100))
+    INDEXER_CONFIRMATIONS = int(os.environ.get('INDEXER_CONFIRMATIONS', 2))
+    INDEXER_REORG_WINDOW = int(os.environ.get('INDEXER_REORG_WINDOW', 10))
+    INDEXER_POLL_INTERVAL = float(os.environ.get('INDEXER_POLL_INTERVAL', 2))
+    # Live marketplace event feed (/api/events, Server-Sent Events); one poller per worker process
+    FEED_POLL_INTERVAL = float(os.environ.get('FEED_POLL_INTERVAL', 2))
+    FEED_CONFIRMATIONS = int(os.environ.get('FEED_CONFIRMATIONS', 1))
+    FEED_BACKFILL_BLOCKS = int(os.environ.get('FEED_BACKFILL_BLOCKS', 1000))
+    FEED_BUFFER_SIZE = int(os.environ.get('FEED_BUFFER_SIZE', 2000))
+    FEED_CLIENT_QUEUE = int(os.environ.get('FEED_CLIENT_QUEUE', 256))
+    FEED_HEARTBEAT = float(os.environ.get('FEED_HEARTBEAT', 15))
+    # Stale-while-revalidate cache for marketplace/proposal page data (0 disables)
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH') or \
+        os.path.join(base_dir, 'response-cache.sqlite')
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 5))
+    RESPONSE_CACHE_MAX_STALE = float(os.environ.get('RESPONSE_CACHE_MAX_STALE', 300))
+    RESPONSE_CACHE_LOCK_TTL = float(os.environ.get('RESPONSE_CACHE_LOCK_TTL', 30))
+    RESPONSE_CACHE_LOG_RANGE = int(os.environ.get('RESPONSE_CACHE_LOG_RANGE', 100))
+    # How often one worker checks for new marketplace events that make cached pages stale
+    RESPONSE_CACHE_SIGNAL_INTERVAL = float(os.environ.get('RESPONSE_CACHE_SIGNAL_INTERVAL', 1.0))
+    # Request instrumentation: /metrics histograms and a warning log for requests slower than the threshold
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') not in ('0', 'false', 'False')
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+    # Shared per-process event loop for RPC batches and metadata fetches (serve with gunicorn -k gthread)
+    ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') not in ('0', 'false', 'False')
+    ASYNC_RPC_CONNECTIONS = int(os.environ.get('ASYNC_RPC_CONNECTIONS', 100))
+    ASYNC_BATCH_CONCURRENCY = int(os.environ.get('ASYNC_BATCH_CONCURRENCY', 8))
+    # Database engine: SQLite pragmas applied to each connection, pool sizing for server databases
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', 65536))  # KiB per connection
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # 'chain' reads listings/proposals live over RPC, 'index' serves them from the indexed tables
+    MARKETPLACE_READ_SOURCE = os.environ.get('MARKETPLACE_READ_SOURCE', 'chain')
+    # Stream the marketplace page card by card as listings resolve, MARKETPLACE_STREAM_WINDOW listings per RPC batch
+    MARKETPLACE_STREAMING = os.environ.get('MARKETPLACE_STREAMING', '0') not in ('0', 'false', 'False')
+    MARKETPLACE_STREAM_WINDOW = int(os.environ.get('MARKETPLACE_STREAM_WINDOW', 100))
+    # Read listings with the contract's paginated getListings() (needs a marketplace deployed with it)
+    MARKETPLACE_PAGED_READS = os.environ.get('MARKETPLACE_PAGED_READS', '0') not in ('0', 'false', 'False')
+    LISTINGS_PAGE_SIZE = min(int(os.environ.get('LISTINGS_PAGE_SIZE', 100)), 100)  # contract caps pages at 100
+    # /api/search: in-memory index over listed NFTs, refreshed at most every SEARCH_REFRESH_INTERVAL seconds
+    # and saved to SEARCH_SNAPSHOT_PATH (at most every SEARCH_SNAPSHOT_INTERVAL) for fast worker restarts
+    SEARCH_SNAPSHOT_PATH = os.environ.get('SEARCH_SNAPSHOT_PATH') or os.path.join(base_dir, 'search-index.json.gz')
+    SEARCH_REFRESH_INTERVAL = float(os.environ.get('SEARCH_REFRESH_INTERVAL', 5))
+    SEARCH_SNAPSHOT_INTERVAL = float(os.environ.get('SEARCH_SNAPSHOT_INTERVAL', 60))
+    SEARCH_FACET_LIMIT = int(os.environ.get('SEARCH_FACET_LIMIT', 20))
+    # Import web3, build contracts and compile templates when manage.py loads (pair with gunicorn --preload)
+    PRELOAD_WARMUP = os.environ.get('PRELOAD_WARMUP', '0') not in ('0', 'false', 'False')
 
     @staticmethod
     def init_app(app):
@@ -35,6 +136,7 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'OFF')
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(base_dir, 'data-test.sqlite')
 
@@ -49,6 +49,15 @@ event Withdraw:
     to: indexed(address)
     amount: uint256
 
+# -------- Structs --------
+struct Listing:
+    nftAddress: address
+    tokenId: uint256
+    price: uint256
+    seller: address
+    proposalCount: uint256
+    bestOffer: uint256
+
 # -------- Storage --------
 prices: public(HashMap[address, HashMap[uint256, uint256]])
 proposals: public(HashMap[address, HashMap[uint256, HashMap[address, uint256]]])
@@ -57,10 +66,16 @@ proposals: public(HashMap[address, HashMap[uint256, HashMap[address, uint256]]])
 listedNFTs: DynArray[address, 10000]
 listedTokenIds: DynArray[uint256, 10000]
 listedCount: uint256
+# 1-based position of each listing in listedNFTs/listedTokenIds; 0 = not listed
+listingIndex: HashMap[address, HashMap[uint256, uint256]]
 
 # Proposal tracking
 proposalAddresses: HashMap[address, HashMap[uint256, DynArray[address, 1000]]]
 proposalCount: HashMap[address, HashMap[uint256, uint256]]
+# 1-based position of each proposer in proposalAddresses; 0 = no proposal
+proposerIndex: HashMap[address, HashMap[uint256, HashMap[address, uint256]]]
+# Highest pending proposal, kept up to date on every change so views never scan the proposals
+bestOffer: HashMap[address, HashMap[uint256, uint256]]
 
 # Marketplace settings
 owner: public(address)
@@ -68,6 +83,9 @@ fee_bps: public(uint256)
 collected_fees: public(uint256)
 
 MAX_PROPOSALS: constant(uint256) = 1000
+MAX_PAGE: constant(uint256) = 100
+# Gas forwarded to each ownerOf in a listings page, so a token that burns gas cannot exhaust the page's budget
+OWNER_OF_GAS: constant(uint256) = 50000
 
 # -------- Constructor --------
 @deploy
@@ -86,6 +104,38 @@ def _is_approved_or_owner_for_market(nft_addr: address, seller: address, tokenId
         return True
     return False
 
+# ownerOf that yields empty(address) instead of reverting, so one broken token cannot fail a whole page.
+@view
+@internal
+def _owner_of(nftAddress: address, tokenId: uint256) -> address:
+    success: bool = False
+    response: Bytes[32] = b""
+    success, response = raw_call(
+        nftAddress,
+        abi_encode(tokenId, method_id=method_id("ownerOf(uint256)")),
+        max_outsize=32,
+        gas=OWNER_OF_GAS,
+        is_static_call=True,
+        revert_on_failure=False,
+    )
+    if not success or len(response) != 32:
+        return empty(address)
+    return abi_decode(response, address)
+
+# Full scan, only run when the current best offer is withdrawn or lowered; the caller pays for it.
+@view
+@internal
+def _scan_best_offer(nftAddress: address, tokenId: uint256) -> uint256:
+    best: uint256 = 0
+    count: uint256 = self.proposalCount[nftAddress][tokenId]
+    for i: uint256 in range(MAX_PROPOSALS):
+        if i >= count:
+            break
+        amount: uint256 = self.proposals[nftAddress][tokenId][self.proposalAddresses[nftAddress][tokenId][i]]
+        if amount > best:
+            best = amount
+    return best
+
 @internal
 def _take_fee(amount: uint256) -> uint256:
     if self.fee_bps == 0:
@@ -94,34 +144,37 @@ def _take_fee(amount: uint256) -> uint256:
     self.collected_fees += fee
     return amount - fee
 
+# Swap-and-pop: move the last entry into the removed slot, so removal costs the same at any size.
 @internal
 def _remove_listing(nftAddress: address, tokenId: uint256):
-    for i: uint256 in range(10000):
-        if i >= self.listedCount:
-            break
-        if self.listedNFTs[i] == nftAddress and self.listedTokenIds[i] == tokenId:
-            last_index: uint256 = self.listedCount - 1
-            if i != last_index:
-                self.listedNFTs[i] = self.listedNFTs[last_index]
-                self.listedTokenIds[i] = self.listedTokenIds[last_index]
-            self.listedNFTs.pop()
-            self.listedTokenIds.pop()
-            self.listedCount -= 1
-            break
+    index: uint256 = self.listingIndex[nftAddress][tokenId]
+    if index == 0:
+        return
+    last_index: uint256 = self.listedCount - 1
+    if index - 1 != last_index:
+        moved_nft: address = self.listedNFTs[last_index]
+        moved_token: uint256 = self.listedTokenIds[last_index]
+        self.listedNFTs[index - 1] = moved_nft
+        self.listedTokenIds[index - 1] = moved_token
+        self.listingIndex[moved_nft][moved_token] = index
+    self.listedNFTs.pop()
+    self.listedTokenIds.pop()
+    self.listedCount -= 1
+    self.listingIndex[nftAddress][tokenId] = 0
 
 @internal
 def _remove_proposal(nftAddress: address, tokenId: uint256, proposer: address):
-    count: uint256 = self.proposalCount[nftAddress][tokenId]
-    for i: uint256 in range(MAX_PROPOSALS):
-        if i >= count:
-            break
-        if self.proposalAddresses[nftAddress][tokenId][i] == proposer:
-            last_index: uint256 = count - 1
-            if i != last_index:
-                self.proposalAddresses[nftAddress][tokenId][i] = self.proposalAddresses[nftAddress][tokenId][last_index]
-            self.proposalAddresses[nftAddress][tokenId].pop()
-            self.proposalCount[nftAddress][tokenId] -= 1
-            break
+    index: uint256 = self.proposerIndex[nftAddress][tokenId][proposer]
+    if index == 0:
+        return
+    last_index: uint256 = self.proposalCount[nftAddress][tokenId] - 1
+    if index - 1 != last_index:
+        moved: address = self.proposalAddresses[nftAddress][tokenId][last_index]
+        self.proposalAddresses[nftAddress][tokenId][index - 1] = moved
+        self.proposerIndex[nftAddress][tokenId][moved] = index
+    self.proposalAddresses[nftAddress][tokenId].pop()
+    self.proposalCount[nftAddress][tokenId] -= 1
+    self.proposerIndex[nftAddress][tokenId][proposer] = 0
 
 # -------- Listing --------
 @external
@@ -129,9 +182,12 @@ def setNFTPrice(nftAddress: address, tokenId: uint256, price: uint256):
     nftContract: ERC721_Interface = ERC721_Interface(nftAddress)
     assert staticcall nftContract.ownerOf(tokenId) == msg.sender, "Only owner can list"
     self.prices[nftAddress][tokenId] = price
-    self.listedNFTs.append(nftAddress)
-    self.listedTokenIds.append(tokenId)
-    self.listedCount += 1
+    # Re-listing only updates the price; the token keeps its slot.
+    if self.listingIndex[nftAddress][tokenId] == 0:
+        self.listedNFTs.append(nftAddress)
+        self.listedTokenIds.append(tokenId)
+        self.listedCount += 1
+        self.listingIndex[nftAddress][tokenId] = self.listedCount
     log NFTListed(seller=msg.sender, nftAddress=nftAddress, tokenId=tokenId, price=price)
 
 @external
@@ -143,12 +199,11 @@ def unlistNFT(nftAddress: address, tokenId: uint256):
     # Refund all proposers if any
     count: uint256 = self.proposalCount[nftAddress][tokenId]
     if count > 0:
-        proposers: DynArray[address, MAX_PROPOSALS] = self.proposalAddresses[nftAddress][tokenId]
-
         for i: uint256 in range(MAX_PROPOSALS):
             if i >= count:
                 break
-            proposer: address = proposers[i]
+            proposer: address = self.proposalAddresses[nftAddress][tokenId][i]
+            self.proposerIndex[nftAddress][tokenId][proposer] = 0
             amount: uint256 = self.proposals[nftAddress][tokenId][proposer]
             if amount > 0:
                 self.proposals[nftAddress][tokenId][proposer] = 0
@@ -158,6 +213,7 @@ def unlistNFT(nftAddress: address, tokenId: uint256):
         # Clear proposal tracking
         self.proposalAddresses[nftAddress][tokenId] = []
         self.proposalCount[nftAddress][tokenId] = 0
+        self.bestOffer[nftAddress][tokenId] = 0
 
     # Remove listing
     self.prices[nftAddress][tokenId] = 0
@@ -193,12 +249,24 @@ def buyNFT(nftAddress: address, tokenId: uint256):
 
 # -------- Proposals --------
 @external
+@nonreentrant
 @payable
 def proposeNFTPrice(nftAddress: address, tokenId: uint256, proposedPrice: uint256):
     assert msg.value == proposedPrice, "ETH != proposedPrice"
+    previous: uint256 = self.proposals[nftAddress][tokenId][msg.sender]
     self.proposals[nftAddress][tokenId][msg.sender] = proposedPrice
-    self.proposalAddresses[nftAddress][tokenId].append(msg.sender)
-    self.proposalCount[nftAddress][tokenId] += 1
+    if self.proposerIndex[nftAddress][tokenId][msg.sender] == 0:
+        self.proposalAddresses[nftAddress][tokenId].append(msg.sender)
+        self.proposalCount[nftAddress][tokenId] += 1
+        self.proposerIndex[nftAddress][tokenId][msg.sender] = self.proposalCount[nftAddress][tokenId]
+    best: uint256 = self.bestOffer[nftAddress][tokenId]
+    if proposedPrice > best:
+        self.bestOffer[nftAddress][tokenId] = proposedPrice
+    elif previous == best and proposedPrice < previous:
+        self.bestOffer[nftAddress][tokenId] = self._scan_best_offer(nftAddress, tokenId)
+    # A new proposal from the same address replaces the old one; refund its deposit.
+    if previous > 0:
+        send(msg.sender, previous)
     log ProposalMade(proposer=msg.sender, nftAddress=nftAddress, tokenId=tokenId, proposedPrice=proposedPrice)
 
 @external
@@ -209,6 +277,8 @@ def cancelProposalNFTPrice(nftAddress: address, tokenId: uint256):
     self.proposals[nftAddress][tokenId][msg.sender] = 0
     send(msg.sender, proposedPrice)
     self._remove_proposal(nftAddress, tokenId, msg.sender)
+    if proposedPrice == self.bestOffer[nftAddress][tokenId]:
+        self.bestOffer[nftAddress][tokenId] = self._scan_best_offer(nftAddress, tokenId)
     log ProposalCancelled(proposer=msg.sender, nftAddress=nftAddress, tokenId=tokenId)
 
 # -------- Accept Proposal with Refunds --------
@@ -230,22 +300,24 @@ def acceptNFTProposal(nftAddress: address, tokenId: uint256, buyer: address):
     send(seller, seller_amount)
 
     # Refund all other proposers
-    all_proposers: DynArray[address, MAX_PROPOSALS] = self.proposalAddresses[nftAddress][tokenId]
     count: uint256 = self.proposalCount[nftAddress][tokenId]
 
     for i: uint256 in range(MAX_PROPOSALS):
         if i >= count:
             break
-        p: address = all_proposers[i]
+        p: address = self.proposalAddresses[nftAddress][tokenId][i]
+        self.proposerIndex[nftAddress][tokenId][p] = 0
         if p != buyer:
             amount: uint256 = self.proposals[nftAddress][tokenId][p]
             if amount > 0:
                 self.proposals[nftAddress][tokenId][p] = 0
                 send(p, amount)
 
-    # Clear accepted proposal and remove buyer from proposal list
+    # Clear accepted proposal and the (now fully refunded) proposal list
     self.proposals[nftAddress][tokenId][buyer] = 0
-    self._remove_proposal(nftAddress, tokenId, buyer)
+    self.proposalAddresses[nftAddress][tokenId] = []
+    self.proposalCount[nftAddress][tokenId] = 0
+    self.bestOffer[nftAddress][tokenId] = 0
 
     # Remove NFT listing
     self.prices[nftAddress][tokenId] = 0
@@ -298,3 +370,33 @@ def getProposalsForNFT(nftAddress: address, tokenId: uint256) -> (DynArray[addre
         prices.append(self.proposals[nftAddress][tokenId][proposers[i]])
 
     return proposers, prices
+
+@view
+@external
+def getListingCount() -> uint256:
+    return self.listedCount
+
+# A page of at most MAX_PAGE listings in listing order, each with its price, current owner,
+# proposal count and best offer. Returns an empty page once offset is past the end.
+# Each listing costs a few storage reads and one gas-capped ownerOf, so a full page stays
+# well inside the eth_call gas cap however many proposals the tokens have.
+@view
+@external
+def getListings(offset: uint256, limit: uint256) -> DynArray[Listing, MAX_PAGE]:
+    page: DynArray[Listing, MAX_PAGE] = []
+    if offset >= self.listedCount:
+        return page
+    for i: uint256 in range(MAX_PAGE):
+        if i >= limit or offset + i >= self.listedCount:
+            break
+        nft_addr: address = self.listedNFTs[offset + i]
+        token_id: uint256 = self.listedTokenIds[offset + i]
+        page.append(Listing(
+            nftAddress=nft_addr,
+            tokenId=token_id,
+            price=self.prices[nft_addr][token_id],
+            seller=self._owner_of(nft_addr, token_id),
+            proposalCount=self.proposalCount[nft_addr][token_id],
+            bestOffer=self.bestOffer[nft_addr][token_id],
+        ))
+    return page
@@ -1,7 +1,8 @@
-from app import create_app, db
+from app import create_app
+from app.schema import upgrade_schema
 
 app = create_app()
 
 with app.app_context():
-    db.create_all()
+    upgrade_schema()
     print("Database tables created!")
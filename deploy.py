@@ -1,8 +1,9 @@
-from web3 import Web3
 import json
 from dotenv import load_dotenv
 import os
 
+from app.rpc import client_from_env
+
 load_dotenv()
 
 MONAD_RPC = os.environ.get('MONAD_RPC')
@@ -15,7 +16,7 @@ with open("contracts/NFTMarketplace.abi.json") as f:
 with open("contracts/NFTMarketplace.bytecode") as f:
     BYTECODE = f.read().strip()
 
-w3 = Web3(Web3.HTTPProvider(MONAD_RPC))
+w3 = client_from_env(default_url=MONAD_RPC).get_w3()
 assert w3.is_connected(), "Failed to connect to network"
 Marketplace = w3.eth.contract(abi=ABI, bytecode=BYTECODE)
 
@@ -0,0 +1,16 @@
+import logging
+
+from app import create_app
+from app.indexer import MarketplaceIndexer
+from app.schema import upgrade_schema
+from app.stats import ensure_collection_stats
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        upgrade_schema()
+        ensure_collection_stats()
+        MarketplaceIndexer.from_app(app).run_forever(app.config['INDEXER_POLL_INTERVAL'])
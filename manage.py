@@ -2,6 +2,10 @@ from app import create_app
 
 
 app = create_app()
+if app.config.get('PRELOAD_WARMUP'):
+    from app.warmup import warm_up
+
+    warm_up(app)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5050, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""Build or update the search index snapshot that /api/search starts from.
+
+    python search_index.py [--output search-index.json.gz]
+
+The first run reads every listed token's symbol, tokenURI and metadata,
+which can take a while on a large marketplace; run it before starting the
+web workers so they load the snapshot instead. Later runs start from the
+existing snapshot and only read tokens listed since.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from app import create_app, search_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=app.config.get('SEARCH_SNAPSHOT_PATH'),
+                        help='snapshot file (default: SEARCH_SNAPSHOT_PATH)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # Saved once at the end rather than in the background as the web workers do.
+    search_index.path = None
+    with app.app_context():
+        search_index.load(args.output)
+        search_index.refresh(force=True)
+    search_index.save(args.output)
+    print(f"{len(search_index)} listed tokens indexed to {args.output} in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
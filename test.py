@@ -1,20 +1,19 @@
 from web3 import Web3
-import json
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+
+from app.rpc import client_from_env
 
 # ======= CONFIG =======
 MONAD_RPC = "https://testnet-rpc.monad.xyz"
 MARKETPLACE_ADDRESS = '0x7dA4Bf6D0EdC392C82D6C8A5aac414810689B9AE'  # your deployed contract address
 
-# Load ABI
-with open("contracts/NFTMarketplace.abi.json") as f:
-    ABI = json.load(f)
-
-# Connect to Monad RPC
-w3 = Web3(Web3.HTTPProvider(MONAD_RPC))
+# Shared pooled/failover client; ABI is loaded once here
+client = client_from_env(MARKETPLACE_ADDRESS, "contracts/NFTMarketplace.abi.json", default_url=MONAD_RPC)
+w3 = client.get_w3()
 assert w3.is_connected(), "Failed to connect to Monad RPC"
 
 # Create contract instance
-marketplace = w3.eth.contract(address=Web3.to_checksum_address(MARKETPLACE_ADDRESS), abi=ABI)
+marketplace = client.get_marketplace()
 
 def get_nft_price(nft_address: str, token_id: int) -> float:
     nft_address = Web3.to_checksum_address(nft_address)
@@ -22,18 +21,37 @@ def get_nft_price(nft_address: str, token_id: int) -> float:
     price_mon = w3.from_wei(price_wei, 'ether')  # Convert wei to MON
     return price_mon
 
-def get_all_listed_nfts():
-    # This returns two parallel lists: addresses and token IDs
-    nft_addresses, token_ids = marketplace.functions.getAllListedNFTs().call()
-    results = []
-    for nft_address, token_id in zip(nft_addresses, token_ids):
-        nft_address = Web3.to_checksum_address(nft_address)
-        price = get_nft_price(nft_address, token_id)
-        results.append({
-            "contract_address": nft_address,
+def get_listing_count(block):
+    # Marketplaces deployed before getListings existed revert (or return nothing) here; None means no paged reads
+    try:
+        return marketplace.functions.getListingCount().call(block_identifier=block)
+    except (BadFunctionCallOutput, ContractLogicError):
+        return None
+
+def get_all_listed_nfts(page_size: int = 100):
+    # getListings returns up to 100 fully populated listings per call, so N listings cost N / 100 calls
+    block = w3.eth.block_number
+    count = get_listing_count(block)
+    if count is None:
+        nft_addresses, token_ids = marketplace.functions.getAllListedNFTs().call(block_identifier=block)
+        return [{
+            "contract_address": Web3.to_checksum_address(nft_address),
             "token_id": token_id,
-            "price_mon": price
-        })
+            "price_mon": w3.from_wei(
+                marketplace.functions.getPrice(nft_address, token_id).call(block_identifier=block), 'ether'),
+        } for nft_address, token_id in zip(nft_addresses, token_ids)]
+    results = []
+    for offset in range(0, count, page_size):
+        page = marketplace.functions.getListings(offset, page_size).call(block_identifier=block)
+        for nft_address, token_id, price_wei, seller, proposal_count, best_offer_wei in page:
+            results.append({
+                "contract_address": Web3.to_checksum_address(nft_address),
+                "token_id": token_id,
+                "price_mon": w3.from_wei(price_wei, 'ether'),
+                "seller": seller,
+                "proposal_count": proposal_count,
+                "best_offer_mon": w3.from_wei(best_offer_wei, 'ether') if best_offer_wei else None,
+            })
     return results
 
 # Example usage:
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Make ``app`` and ``benchmarks`` importable when pytest is run as ``pytest tests``.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help='also run tests marked slow')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: fills the marketplace to 1k+ listings; only runs with --run-slow')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip = pytest.mark.skip(reason='needs --run-slow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
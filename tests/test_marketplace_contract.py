@@ -0,0 +1,288 @@
+"""Behaviour and gas ceilings of ``contracts/NFTMarketplace.vy`` on titanoboa's local EVM.
+
+    pip install -r requirements-test.txt && pytest tests [--run-slow]
+
+Listings and proposals are removed with swap-and-pop, so every test checks
+the on-chain arrays against a plain Python list that applies the same moves.
+The gas ceilings are checked at 10 and 500 listings, and with ``--run-slow``
+also at 1k and 10k. Comparing against an earlier revision of the contract is
+left to ``python -m benchmarks.gas_bench``.
+"""
+import os
+import random
+
+import pytest
+
+boa = pytest.importorskip('boa')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRICE = 10 ** 15
+
+# Execution gas ceilings, a little above what the current contract uses; they do not grow with N.
+GAS_CEILINGS = {
+    'setNFTPrice': 110_000,
+    'unlistNFT': 30_000,
+    'buyNFT': 80_000,
+    'cancelProposalNFTPrice': 30_000,
+    'acceptNFTProposal': 80_000,
+}
+# getListings, per listing on the page; it must not depend on how many proposals a token has.
+LISTING_GAS_CEILING = 7_500
+
+MOCK_ERC721 = """
+# @version 0.4.3
+default_owner: public(address)
+owners: HashMap[uint256, address]
+
+@deploy
+def __init__(owner: address):
+    self.default_owner = owner
+
+@view
+@external
+def ownerOf(tokenId: uint256) -> address:
+    owner: address = self.owners[tokenId]
+    if owner == empty(address):
+        return self.default_owner
+    return owner
+
+@view
+@external
+def getApproved(tokenId: uint256) -> address:
+    return empty(address)
+
+@view
+@external
+def isApprovedForAll(owner: address, operator: address) -> bool:
+    return True
+
+@external
+def transferFrom(sender: address, receiver: address, tokenId: uint256):
+    self.owners[tokenId] = receiver
+"""
+
+
+@pytest.fixture(scope='module')
+def deployer():
+    with open(os.path.join(ROOT, 'contracts', 'NFTMarketplace.vy')) as f:
+        return boa.loads_partial(f.read())
+
+
+@pytest.fixture
+def seller():
+    address = boa.env.generate_address('seller')
+    boa.env.eoa = address
+    with boa.env.anchor():
+        yield address
+
+
+@pytest.fixture
+def nft(seller):
+    return boa.loads(MOCK_ERC721, seller)
+
+
+@pytest.fixture
+def market(deployer, seller):
+    return deployer.deploy()
+
+
+def gas_of(contract, fn: str, *args, **kwargs) -> int:
+    getattr(contract, fn)(*args, **kwargs)
+    return contract._computation.get_gas_used()
+
+
+def bidder(balance: int = 10 ** 18):
+    address = boa.env.generate_address()
+    boa.env.set_balance(address, balance)
+    return address
+
+
+def listed(market, nft) -> list:
+    addresses, token_ids = market.getAllListedNFTs()
+    assert set(addresses) <= {nft.address}
+    return list(token_ids)
+
+
+def swap_and_pop(items: list, item):
+    index = items.index(item)
+    items[index] = items[-1]
+    items.pop()
+
+
+def list_tokens(market, nft, token_ids, price=PRICE) -> list:
+    for token_id in token_ids:
+        market.setNFTPrice(nft.address, token_id, price)
+    return list(token_ids)
+
+
+def test_unlisting_the_middle_moves_the_last_listing_into_its_slot(market, nft):
+    expected = list_tokens(market, nft, range(5))
+    market.unlistNFT(nft.address, 2)
+    swap_and_pop(expected, 2)
+    assert listed(market, nft) == expected == [0, 1, 4, 3]
+    assert market.getListingCount() == 4
+    # The moved listing's index was updated, so it can still be removed.
+    market.unlistNFT(nft.address, 4)
+    swap_and_pop(expected, 4)
+    assert listed(market, nft) == expected == [0, 1, 3]
+
+
+def test_unlisting_the_last_listing_pops_it(market, nft):
+    list_tokens(market, nft, range(3))
+    market.unlistNFT(nft.address, 2)
+    assert listed(market, nft) == [0, 1]
+    market.unlistNFT(nft.address, 1)
+    market.unlistNFT(nft.address, 0)
+    assert listed(market, nft) == []
+    assert market.getListingCount() == 0
+
+
+def test_index_map_stays_consistent_through_random_removals(market, nft, seller):
+    rng = random.Random(7)
+    expected = list_tokens(market, nft, range(40))
+    buyer = bidder(10 ** 20)
+    for _ in range(120):
+        token_id = rng.choice(range(60))
+        if token_id in expected and rng.random() < 0.5:
+            market.unlistNFT(nft.address, token_id)
+            swap_and_pop(expected, token_id)
+        elif token_id in expected:
+            with boa.env.prank(buyer):
+                market.buyNFT(nft.address, token_id, value=PRICE)
+            swap_and_pop(expected, token_id)
+            # Hand the token back so it can be listed again.
+            nft.transferFrom(buyer, seller, token_id)
+        else:
+            market.setNFTPrice(nft.address, token_id, PRICE)
+            expected.append(token_id)
+        assert listed(market, nft) == expected
+    for token_id in list(expected):
+        market.unlistNFT(nft.address, token_id)
+        swap_and_pop(expected, token_id)
+        assert listed(market, nft) == expected
+    assert market.getListingCount() == 0
+
+
+def test_relisting_updates_the_price_and_keeps_the_slot(market, nft):
+    list_tokens(market, nft, range(3))
+    market.setNFTPrice(nft.address, 1, 2 * PRICE)
+    assert listed(market, nft) == [0, 1, 2]
+    assert market.getPrice(nft.address, 1) == 2 * PRICE
+    assert market.getListings(0, 10)[1][2] == 2 * PRICE
+
+
+def test_reproposing_replaces_and_refunds_the_previous_offer(market, nft):
+    list_tokens(market, nft, [1])
+    buyer = bidder()
+    with boa.env.prank(buyer):
+        market.proposeNFTPrice(nft.address, 1, 300, value=300)
+        market.proposeNFTPrice(nft.address, 1, 100, value=100)
+    assert boa.env.get_balance(buyer) == 10 ** 18 - 100
+    assert boa.env.get_balance(market.address) == 100
+    proposers, prices = market.getProposalsForNFT(nft.address, 1)
+    assert (list(proposers), list(prices)) == ([buyer], [100])
+    assert market.getListings(0, 1)[0][4:] == (1, 100)
+
+
+def test_cancelling_middle_and_last_proposals_keeps_the_proposer_index(market, nft):
+    list_tokens(market, nft, [1])
+    bidders = [bidder() for _ in range(5)]
+    for amount, address in enumerate(bidders, 1):
+        with boa.env.prank(address):
+            market.proposeNFTPrice(nft.address, 1, amount, value=amount)
+    expected = list(bidders)
+    for address in (bidders[1], bidders[4], bidders[3]):
+        with boa.env.prank(address):
+            market.cancelProposalNFTPrice(nft.address, 1)
+        swap_and_pop(expected, address)
+        proposers, prices = market.getProposalsForNFT(nft.address, 1)
+        assert list(proposers) == expected
+        assert list(prices) == [bidders.index(p) + 1 for p in expected]
+        assert boa.env.get_balance(address) == 10 ** 18
+    # A proposer that cancelled can propose again and is appended.
+    with boa.env.prank(bidders[1]):
+        market.proposeNFTPrice(nft.address, 1, 7, value=7)
+    assert list(market.getProposalsForNFT(nft.address, 1)[0]) == expected + [bidders[1]]
+
+
+def test_best_offer_follows_proposals_and_cancellations(market, nft):
+    list_tokens(market, nft, [1])
+    low, high = bidder(), bidder()
+    with boa.env.prank(low):
+        market.proposeNFTPrice(nft.address, 1, 100, value=100)
+    with boa.env.prank(high):
+        market.proposeNFTPrice(nft.address, 1, 500, value=500)
+    assert market.getListings(0, 1)[0][5] == 500
+    with boa.env.prank(high):
+        market.proposeNFTPrice(nft.address, 1, 50, value=50)
+    assert market.getListings(0, 1)[0][5] == 100
+    with boa.env.prank(low):
+        market.cancelProposalNFTPrice(nft.address, 1)
+    assert market.getListings(0, 1)[0][4:] == (1, 50)
+
+
+def test_accepting_clears_the_proposals_and_refunds_the_others(market, nft, seller):
+    list_tokens(market, nft, [1, 2])
+    bidders = [bidder() for _ in range(3)]
+    for amount, address in enumerate(bidders, 1):
+        with boa.env.prank(address):
+            market.proposeNFTPrice(nft.address, 1, amount * PRICE, value=amount * PRICE)
+    market.acceptNFTProposal(nft.address, 1, bidders[1])
+    assert nft.ownerOf(1) == bidders[1]
+    assert market.getProposalsForNFT(nft.address, 1) == ([], [])
+    assert listed(market, nft) == [2]
+    assert boa.env.get_balance(bidders[0]) == 10 ** 18
+    assert boa.env.get_balance(bidders[2]) == 10 ** 18
+    assert boa.env.get_balance(bidders[1]) == 10 ** 18 - 2 * PRICE
+    assert boa.env.get_balance(market.address) == market.collected_fees()
+    # The token can be listed and bid on again from a clean slate.
+    nft.transferFrom(bidders[1], seller, 1)
+    market.setNFTPrice(nft.address, 1, PRICE)
+    assert market.getListings(0, 10)[1][4:] == (0, 0)
+
+
+def page_gas(market, offset: int) -> tuple:
+    # The EVM keeps storage warm between back-to-back calls, so the second call gives comparable figures.
+    market.getListings(offset, 100)
+    page = market.getListings(offset, 100)
+    return page, market._computation.get_gas_used()
+
+
+@pytest.mark.parametrize('size', [
+    10,
+    500,
+    pytest.param(1_000, marks=pytest.mark.slow),
+    pytest.param(10_000, marks=pytest.mark.slow),
+])
+def test_gas_stays_under_ceilings(market, nft, size):
+    list_tokens(market, nft, range(size - 1))
+    middle = size // 2
+    offset = max(0, middle - 50)
+    gas = {'setNFTPrice': gas_of(market, 'setNFTPrice', nft.address, size - 1, PRICE)}
+    with boa.env.anchor():
+        gas['unlistNFT'] = gas_of(market, 'unlistNFT', nft.address, middle)
+    with boa.env.anchor():
+        buyer = bidder()
+        with boa.env.prank(buyer):
+            gas['buyNFT'] = gas_of(market, 'buyNFT', nft.address, middle, value=PRICE)
+    page, without_proposals = page_gas(market, offset)
+    assert len(page) == min(size, 100)
+    bidders = [bidder() for _ in range(min(size, 200))]
+    for amount, address in enumerate(bidders, 1):
+        with boa.env.prank(address):
+            market.proposeNFTPrice(nft.address, middle, amount, value=amount)
+    with boa.env.anchor():
+        with boa.env.prank(bidders[len(bidders) // 2]):
+            gas['cancelProposalNFTPrice'] = gas_of(market, 'cancelProposalNFTPrice', nft.address, middle)
+    with boa.env.anchor():
+        single = size // 3
+        with boa.env.prank(bidders[0]):
+            market.proposeNFTPrice(nft.address, single, PRICE, value=PRICE)
+        gas['acceptNFTProposal'] = gas_of(market, 'acceptNFTProposal', nft.address, single, bidders[0])
+    page, gas['getListings'] = page_gas(market, offset)
+    assert [row[4:] for row in page if row[4]] == [(len(bidders), len(bidders))]
+    ceilings = {**GAS_CEILINGS, 'getListings': LISTING_GAS_CEILING * len(page)}
+    over = {name: used for name, used in gas.items() if used > ceilings[name]}
+    assert not over, f'{over} over {ceilings}'
+    # A page reads stored aggregates only, so a token with many proposals costs no more than one without.
+    assert gas['getListings'] - without_proposals < 1_000
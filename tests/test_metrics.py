@@ -0,0 +1,75 @@
+"""Per-request timings in ``app/metrics.py`` with copied request contexts on other threads."""
+import threading
+
+from flask import Flask, copy_current_request_context
+
+from app.metrics import Metrics, _timings
+
+
+def make_app():
+    app = Flask(__name__)
+    Metrics(app)
+    return app
+
+
+def test_copied_context_torn_down_on_another_thread_first():
+    app = make_app()
+    errors = []
+
+    @app.route('/')
+    def index():
+        @copy_current_request_context
+        def work():
+            return _timings.get()
+
+        def run():
+            try:
+                seen.append(work())
+            except Exception as exc:
+                errors.append(exc)
+
+        seen = []
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        # The copy runs in a fresh context, so it sees no timings of its own and leaves ours alone.
+        assert seen == [None]
+        assert _timings.get() is not None
+        return 'ok'
+
+    response = app.test_client().get('/')
+    assert response.status_code == 200
+    assert not errors
+    assert 'total;dur=' in response.headers['Server-Timing']
+    assert _timings.get() is None
+
+
+def test_copied_context_torn_down_on_another_thread_last():
+    app = make_app()
+    errors = []
+    finished = threading.Event()
+    release = threading.Event()
+
+    @app.route('/')
+    def index():
+        @copy_current_request_context
+        def work():
+            release.wait(5)
+
+        def run():
+            try:
+                work()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                finished.set()
+
+        threading.Thread(target=run).start()
+        return 'ok'
+
+    response = app.test_client().get('/')
+    assert response.status_code == 200
+    assert _timings.get() is None
+    release.set()
+    assert finished.wait(5)
+    assert not errors
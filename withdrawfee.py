@@ -1,8 +1,9 @@
 from web3 import Web3
-import json
 from dotenv import load_dotenv
 import os
 
+from app.rpc import client_from_env
+
 load_dotenv()
 
 MONAD_RPC = os.environ.get('MONAD_RPC')
@@ -10,13 +11,10 @@ PRIVATE_KEY = os.environ.get('PRIVATE_KEY')
 ACCOUNT_ADDRESS = '0xa8F4f8e7c8981B4424cB2640F3779B3a8068994b'  
 CONTRACT_ADDRESS = '0x02F54869f96E809828d68c3D6D88482d00Aa08ae'  # Marketplace contract
 
-# Load ABI
-with open("contracts/NFTMarketplace.abi.json") as f:
-    MARKETPLACE_ABI = json.load(f)
-
-# Connect Web3
-w3 = Web3(Web3.HTTPProvider(MONAD_RPC))
-marketplace = w3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=MARKETPLACE_ABI)
+# Connect Web3 through the shared pooled/failover client
+client = client_from_env(CONTRACT_ADDRESS, "contracts/NFTMarketplace.abi.json", default_url=MONAD_RPC)
+w3 = client.get_w3()
+marketplace = client.get_marketplace()
 
 # Check how much fees are available
 collected_fees = marketplace.functions.collected_fees().call()